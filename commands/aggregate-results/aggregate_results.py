@@ -0,0 +1,352 @@
+# This script aggregates the hyperparameters and corresponding results of all the runs of a CANDLE experiment into candle_results.csv, sorted numerically by the result
+# If the runs were profiled (profile_interval keyword), their resource usage is also aggregated into candle_resource_profiles.csv and summarized on the screen
+# Run like "python $CANDLE/wrappers/commands/aggregate-results/aggregate_results.py <EXP-DIR> [<RESULT-FORMAT>] [--columnar=<parquet|feather>] [--no_index]"
+# Assumption: The candle program has been called normally (so that the $CANDLE_SUBMISSION_DIR variable has been defined)
+
+import os
+import sys
+import csv
+import json
+import math
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'submit-job'))
+import experiment_index
+import resource_profiler
+
+
+result_file = "result.txt"
+params_log = "params.json"
+run_dirname = "run"
+results_basename = "candle_results"
+COLUMNAR_FORMATS = ('parquet', 'feather')
+SCAN_NTHREADS = 32
+profiles_basename = "candle_resource_profiles"
+PROFILE_COLUMNS = ('duration', 'cpu_percent_mean', 'cpu_percent_max', 'rss_gb_max', 'read_mb', 'write_mb', 'gpu_utilization_mean', 'gpu_memory_gb_max')
+MAX_SUMMARY_VALUES = 10  # hyperparameters with more distinct values than this (e.g., continuous ones) aren't broken down in the summary of the profiles
+
+
+def read_result(run_dir):
+    """
+    Return the result in the result.txt file of a run, or NaN if the run has no valid result
+    """
+
+    # Opening the file directly (rather than first checking that it exists) saves a metadata round trip
+    try:
+        with open(os.path.join(run_dir, result_file)) as f:
+            return float(f.read())
+    except (OSError, ValueError):
+        return math.nan
+
+
+def read_run(run_dir):
+    """
+    Read the result and hyperparameters of a single run
+    Arguments:
+        run_dir: str
+            Path to the run directory
+
+    Returns: tuple
+        (result, dirname, params), where result is NaN if the run has no valid result
+    """
+
+    result = read_result(run_dir)
+    try:
+        with open(os.path.join(run_dir, params_log)) as f:
+            params = json.load(f)
+    except (OSError, ValueError):
+        params = {}
+    return result, run_dir, params
+
+
+def list_run_dirs(expt_dir):
+    """
+    Return the paths to the run directories of an experiment
+    """
+    run_parent = os.path.join(expt_dir, run_dirname)
+    with os.scandir(run_parent) as entries:
+        return [os.path.join(run_parent, entry.name) for entry in entries if entry.is_dir()]
+
+
+def scan_runs(expt_dir, nthreads=SCAN_NTHREADS):
+    """
+    Read the result and hyperparameters of every run of an experiment in parallel
+    Arguments:
+        expt_dir: str
+            Path to the experiment directory, e.g., $EXPERIMENTS/X000
+        nthreads: int
+            Number of threads reading the run directories concurrently
+
+    Returns: list
+        One (result, dirname, params) tuple per run
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    # The per-run work is almost entirely waiting on (shared) filesystem I/O, so threads overlap it well despite the GIL
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        return list(executor.map(read_run, list_run_dirs(expt_dir)))
+
+
+def query_runs(expt_dir, nthreads=SCAN_NTHREADS):
+    """
+    Read the result of every run of an experiment, with the hyperparameters of the runs recorded in the experiment index read from it rather than from their params.json files
+    Every run directory is listed, as the index lacks runs killed before being recorded and those of canonically CANDLE-compliant model scripts; these are read as by scan_runs()
+    Arguments:
+        expt_dir: str
+            Path to the experiment directory, e.g., $EXPERIMENTS/X000
+        nthreads: int
+            Number of threads reading the run directories concurrently
+
+    Returns: list
+        One (result, dirname, params) tuple per run, or None if the experiment isn't indexed
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    launch_dir = os.path.realpath(expt_dir)
+    launch = os.path.basename(launch_dir)
+    records = experiment_index.get_records_by_location(os.path.dirname(launch_dir), launch=launch)
+    if not records:
+        return None
+
+    def read_indexed_run(run_dir):
+        record = records.get((launch, os.path.basename(run_dir)))
+        if record is None:
+            return read_run(run_dir)
+        return read_result(run_dir), run_dir, record['params']
+
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        return list(executor.map(read_indexed_run, list_run_dirs(expt_dir)))
+
+
+def sort_runs(runs):
+    """
+    Sort runs numerically by their result, with runs lacking a result last
+    """
+    return sorted(runs, key=lambda run: (math.isnan(run[0]), run[0], run[1]))
+
+
+def get_hp_names(runs):
+    """
+    Return the union of the hyperparameter names of all runs, in order of first appearance
+    """
+    hp_names = {}
+    for run in runs:
+        for name in run[2]:
+            hp_names[name] = None
+    return list(hp_names)
+
+
+def format_value(value):
+    """
+    Format a hyperparameter value for the CSV file
+    """
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def write_csv(runs, hp_names, result_format, filename):
+    """
+    Write the runs to a CSV file with the columns result, dirname, and the hyperparameters
+    Arguments:
+        runs: list
+            (result, dirname, params) tuples, already sorted
+        hp_names: list
+            Names of the hyperparameter columns
+        result_format: str
+            printf()-style format of the result, e.g., %07.3f
+        filename: str
+            Path to the CSV file
+    """
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['result', 'dirname'] + hp_names)
+        for result, dirname, params in runs:
+            writer.writerow(['' if math.isnan(result) else result_format % result, dirname] + [format_value(params[name]) if name in params else '' for name in hp_names])
+
+
+def write_columnar(runs, hp_names, columnar_format, filename):
+    """
+    Write the runs to a Parquet or Feather file with a numeric result column
+    Arguments:
+        runs: list
+            (result, dirname, params) tuples, already sorted
+        hp_names: list
+            Names of the hyperparameter columns
+        columnar_format: str
+            Either parquet or feather
+        filename: str
+            Path to the columnar file
+    """
+    import pandas as pd
+
+    # Columns whose values aren't all scalars of a single type (e.g., lists) are stored as their JSON representation
+    columns = {'result': [run[0] for run in runs], 'dirname': [run[1] for run in runs]}
+    for name in hp_names:
+        values = [run[2].get(name) for run in runs]
+        value_types = set(float if type(value) is int else type(value) for value in values if value is not None)  # ints and floats mix into a float column
+        if len(value_types) > 1 or value_types & {list, dict}:
+            values = [None if value is None else format_value(value) for value in values]
+        columns[name] = values
+    df = pd.DataFrame(columns)
+    try:
+        if columnar_format == 'parquet':
+            df.to_parquet(filename, index=False)
+        else:
+            df.to_feather(filename)
+    except ImportError as e:
+        print('ERROR: Writing a {} file requires pyarrow to be installed in the Python environment ({})'.format(columnar_format, e))
+        exit(1)
+
+
+def read_profiles(runs, nthreads=SCAN_NTHREADS):
+    """
+    Read the resource profile of every run in parallel
+    Arguments:
+        runs: list
+            (result, dirname, params) tuples
+        nthreads: int
+            Number of threads reading the profiles concurrently
+
+    Returns: list
+        The profile of each run (None for a run without one, e.g., a memoized result or an evaluation that ended before the first sample), or None if none of the runs were profiled
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        profiles = list(executor.map(resource_profiler.read_profile, [run[1] for run in runs]))
+    if all(profile is None for profile in profiles):
+        return None
+    return profiles
+
+
+def write_profiles_csv(runs, profiles, hp_names, result_format, filename):
+    """
+    Write the profiled runs to a CSV file with the columns result, dirname, the PROFILE_COLUMNS, bottlenecks, and the hyperparameters
+    Arguments:
+        runs: list
+            (result, dirname, params) tuples, already sorted
+        profiles: list
+            The profile of each run (or None)
+        hp_names: list
+            Names of the hyperparameter columns
+        result_format: str
+            printf()-style format of the result
+        filename: str
+            Path to the CSV file
+    """
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['result', 'dirname'] + list(PROFILE_COLUMNS) + ['bottlenecks'] + hp_names)
+        for (result, dirname, params), profile in zip(runs, profiles):
+            if profile is None:
+                continue
+            writer.writerow(['' if math.isnan(result) else result_format % result, dirname] + ['' if profile[column] is None else profile[column] for column in PROFILE_COLUMNS] + ['+'.join(resource_profiler.get_bottlenecks(profile))] + [format_value(params[name]) if name in params else '' for name in hp_names])
+
+
+def get_most_influential_hp(runs, profiles, hp_names, get_metric):
+    """
+    Return the hyperparameter whose values change a profile metric the most, i.e., with the largest ratio between the highest and lowest mean of the metric over the runs sharing a value
+    Arguments:
+        runs: list
+            (result, dirname, params) tuples
+        profiles: list
+            The profile of each run (all not None)
+        hp_names: list
+            Names of the hyperparameters
+        get_metric: function
+            Returns the metric given a profile
+
+    Returns: tuple
+        (name, {value: mean of the metric}) of the hyperparameter, or None if no hyperparameter takes between 2 and MAX_SUMMARY_VALUES values with at least one shared by several runs (unlike, e.g., the hyperparameter set ID)
+    """
+    best_ratio, best = 1, None
+    for name in hp_names:
+        metrics = {}
+        for (_, _, params), profile in zip(runs, profiles):
+            if name in params:
+                metrics.setdefault(format_value(params[name]), []).append(get_metric(profile))
+        if not 2 <= len(metrics) <= min(MAX_SUMMARY_VALUES, sum(len(values) for values in metrics.values()) - 1):
+            continue
+        means = {value: sum(values) / len(values) for value, values in metrics.items()}
+        ratio = max(means.values()) / max(min(means.values()), 1e-6)
+        if ratio > best_ratio:
+            best_ratio, best = ratio, (name, means)
+    return best
+
+
+def summarize_profiles(runs, profiles, hp_names):
+    """
+    Print the resources used by the profiled runs, the resources that bound them, the hyperparameters changing their memory and I/O the most, and the nthreads and mem_per_cpu keywords that would fit them
+    """
+    runs, profiles = zip(*[(run, profile) for run, profile in zip(runs, profiles) if profile is not None])
+    rss_gb_max = sorted(profile['rss_gb_max'] for profile in profiles)
+    io_rates = sorted(resource_profiler.get_io_rate(profile) for profile in profiles)
+    bottlenecks = {}
+    for profile in profiles:
+        for bottleneck in resource_profiler.get_bottlenecks(profile) or ['none']:
+            bottlenecks[bottleneck] = bottlenecks.get(bottleneck, 0) + 1
+    print('\nResource usage of the {} profiled runs:'.format(len(profiles)))
+    print('  Peak memory: median {:.2f} GB, max {:.2f} GB'.format(rss_gb_max[len(rss_gb_max) // 2], rss_gb_max[-1]))
+    print('  Mean CPU usage: median {:.0f}%, max {:.0f}% (100% is one fully used CPU)'.format(sorted(profile['cpu_percent_mean'] for profile in profiles)[len(profiles) // 2], max(profile['cpu_percent_mean'] for profile in profiles)))
+    print('  I/O rate: median {:.1f} MB/s, max {:.1f} MB/s'.format(io_rates[len(io_rates) // 2], io_rates[-1]))
+    gpu_utilizations = [profile['gpu_utilization_mean'] for profile in profiles if profile['gpu_utilization_mean'] is not None]
+    if gpu_utilizations:
+        print('  Mean GPU utilization: median {:.0f}%, max {:.0f}%'.format(sorted(gpu_utilizations)[len(gpu_utilizations) // 2], max(gpu_utilizations)))
+    print('  Runs bound by each resource: {}'.format(', '.join('{} {}'.format(bottleneck, count) for bottleneck, count in sorted(bottlenecks.items()))))
+    for description, get_metric, unit in (('Peak memory', lambda profile: profile['rss_gb_max'], 'GB'), ('I/O rate', resource_profiler.get_io_rate, 'MB/s')):
+        most_influential_hp = get_most_influential_hp(runs, profiles, hp_names, get_metric)
+        if most_influential_hp is not None:
+            name, means = most_influential_hp
+            print('  {} varies most with the hyperparameter "{}": {}'.format(description, name, ', '.join('{} ({:.2f} {})'.format(value, mean, unit) for value, mean in sorted(means.items(), key=lambda item: item[1]))))
+    nthreads, mem_per_cpu = resource_profiler.suggest_keywords(profiles)
+    print('  Keywords that would fit every run: nthreads={}, mem_per_cpu={} (on Biowulf)'.format(nthreads, mem_per_cpu))
+
+
+def aggregate_results(expt_dir, result_format='%07.3f', output_dir='.', columnar_format=None, use_index=True):
+    """
+    Aggregate the results of all runs of an experiment into candle_results.csv (and optionally a columnar file), and their resource profiles (if any) into candle_resource_profiles.csv
+    Arguments:
+        expt_dir: str
+            Path to the experiment directory, e.g., $EXPERIMENTS/X000
+        result_format: str
+            printf()-style format of the result in the CSV file
+        output_dir: str
+            Directory in which to write the output file(s)
+        columnar_format: str
+            If set, also write candle_results.parquet or candle_results.feather
+        use_index: bool
+            Whether to read the hyperparameters of the runs recorded in the experiment index from it instead of from their params.json files
+
+    Returns: int
+        Number of runs aggregated
+    """
+
+    runs = query_runs(expt_dir) if use_index else None
+    if runs is None:
+        runs = scan_runs(expt_dir)
+    runs = sort_runs(runs)
+    hp_names = get_hp_names(runs)
+    write_csv(runs, hp_names, result_format, os.path.join(output_dir, results_basename + '.csv'))
+    if columnar_format is not None:
+        write_columnar(runs, hp_names, columnar_format, os.path.join(output_dir, results_basename + '.' + columnar_format))
+    profiles = read_profiles(runs)
+    if profiles is not None:
+        write_profiles_csv(runs, profiles, hp_names, result_format, os.path.join(output_dir, profiles_basename + '.csv'))
+        summarize_profiles(runs, profiles, hp_names)
+    return len(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate the results of a CANDLE experiment')
+    parser.add_argument('expt_dir', help='The experiment directory, e.g., experiments/X000')
+    parser.add_argument('result_format', nargs='?', default='%07.3f', help='The printf()-style format of the result in the CSV file')
+    parser.add_argument('--columnar', choices=COLUMNAR_FORMATS, default=None, help='Also write the results to a file in this columnar format')
+    parser.add_argument('--no_index', action='store_true', help='Read the hyperparameters of every run from its params.json file even if the experiment index has recorded it')
+    args = parser.parse_args()
+
+    aggregate_results(args.expt_dir, args.result_format, os.path.join(os.getenv('CANDLE_SUBMISSION_DIR'), 'candle_generated_files'), args.columnar, not args.no_index)
+
+
+if __name__ == '__main__':
+    main()
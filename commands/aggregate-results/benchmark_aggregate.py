@@ -0,0 +1,96 @@
+# This script compares how long the Python aggregation engine (aggregate_results.py) and the former awk/sort pipeline take to aggregate the results of a synthetic experiment.
+# Run like "python $CANDLE/wrappers/commands/aggregate-results/benchmark_aggregate.py [<NRUNS> [<PARENT-DIR>]]", e.g., "python benchmark_aggregate.py 50000 /data/$USER"
+# Point <PARENT-DIR> to the filesystem of interest (e.g., GPFS) to obtain representative timings; by default the experiment is built in a temporary directory
+# Assumption: None
+
+# Import relevant modules
+import subprocess
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import aggregate_results
+
+# The get_data() pipeline formerly in command_script.sh, which runs two awk processes per run directory and then sorts the CSV text
+LEGACY_PIPELINE = r'''
+expt_dir=$1
+result_format="%07.3f"
+function get_data(){
+    for run_dir in "$expt_dir/run"/*; do
+        result=$(awk -v result_format="$result_format" '{printf(result_format,$0)}' "$run_dir/result.txt")
+        hp_values=$(awk -v doprint=0 '{if($0~/^PARAMS:$/){doprint=1}; if(doprint==1 && $0~/^$/){doprint=0}; if(doprint){print}}' "$run_dir/model.log" | tail -n +2 | awk '{printf("%s,",$2)}')
+        hp_values="$result,$run_dir,${hp_values:0:${#hp_values}-1}"
+        echo "$hp_values"
+    done
+}
+run_dir=$(ls "$expt_dir/run" | head -n 1)
+hp_names=$(awk -v doprint=0 '{if($0~/^PARAMS:$/){doprint=1}; if(doprint==1 && $0~/^$/){doprint=0}; if(doprint){print}}' "$expt_dir/run/$run_dir/model.log" | tail -n +2 | awk '{printf("%s,",$1)}')
+header="result,dirname,${hp_names:0:${#hp_names}-1}"
+data=$(get_data "$expt_dir" "$result_format")
+(
+    echo "$header"
+    echo "$data" | sort
+) > "$2/candle_results.csv"
+'''
+
+
+# Define a function that builds an experiment of nruns runs, each with a result.txt, params.json, and model.log containing a PARAMS block
+def make_experiment(expt_dir, nruns):
+    for irun in range(nruns):
+        run_dir = os.path.join(expt_dir, 'run', 'hpset_{:05}'.format(irun + 1))
+        os.makedirs(run_dir)
+        params = {'id': 'hpset_{:05}'.format(irun + 1), 'epochs': irun % 50, 'batch_size': 2 ** (irun % 8), 'learning_rate': 10 ** -(irun % 5), 'activation': 'relu'}
+        with open(os.path.join(run_dir, 'params.json'), 'w') as f:
+            json.dump(params, f)
+        with open(os.path.join(run_dir, 'model.log'), 'w') as f:
+            f.write('PARAMS:\n')
+            for key, value in params.items():
+                f.write('{}: {}\n'.format(key, value))
+            f.write('\n')
+        with open(os.path.join(run_dir, 'result.txt'), 'w') as f:
+            f.write('{}\n'.format((irun * 7919 % nruns) / 1000))
+
+
+def main():
+
+    # Obtain the experiment size and location from the arguments to the script call
+    nruns = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    parent_dir = sys.argv[2] if len(sys.argv) > 2 else None
+
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+    try:
+        expt_dir = os.path.join(tmp_dir, 'X000')
+
+        # Build the synthetic experiment
+        print('Building a synthetic experiment of {} runs in {}...'.format(nruns, expt_dir))
+        start_time = time.perf_counter()
+        make_experiment(expt_dir, nruns)
+        print('  done in {:.1f} s'.format(time.perf_counter() - start_time))
+
+        # Time the former pipeline
+        start_time = time.perf_counter()
+        subprocess.run(['bash', '-c', LEGACY_PIPELINE, 'legacy', expt_dir, tmp_dir], check=True)
+        legacy_time = time.perf_counter() - start_time
+        print('awk/sort pipeline:         {:.2f} s ({:.0f} runs/s)'.format(legacy_time, nruns / legacy_time))
+
+        # Time the Python engine, also writing a columnar file if pyarrow is available
+        try:
+            import pyarrow  # noqa: F401
+            columnar_format = 'parquet'
+        except ImportError:
+            columnar_format = None
+        start_time = time.perf_counter()
+        aggregate_results.aggregate_results(expt_dir, output_dir=tmp_dir, columnar_format=columnar_format)
+        engine_time = time.perf_counter() - start_time
+        print('aggregate_results.py:      {:.2f} s ({:.0f} runs/s; {:.1f}x faster){}'.format(engine_time, nruns / engine_time, legacy_time / engine_time, '' if columnar_format is None else ', including the Parquet file'))
+
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+#!/bin/bash
+
+# If an estimate of the resources needed by a CANDLE job is requested, run a few of the job's hyperparameter sets at a reduced budget on the current node and extrapolate
+# Run like "bash $CANDLE/wrappers/commands/estimate/command_script.sh <INPUT-FILE> [--npilots=<K>] [--budget_fraction=<F>]", which processes the input file exactly as "candle submit-job <INPUT-FILE>" does but runs estimate.py in place of the workflow
+# ASSUMPTIONS:
+#   (1) candle module has been loaded
+#   (2) the candle program has been called normally (so that the $CANDLE_SUBMISSION_DIR variable has been defined)
+#   (3) This is run on a node with the resources of one worker (e.g., an interactive GPU node), as for run_workflow=0
+
+# Parse the arguments
+input_file=$1
+shift
+export CANDLE_ESTIMATE_NPILOTS=4
+export CANDLE_ESTIMATE_BUDGET_FRACTION=0.1
+for arg in "$@"; do
+    case "$arg" in
+        --npilots=*) CANDLE_ESTIMATE_NPILOTS=${arg#*=} ;;
+        --budget_fraction=*) CANDLE_ESTIMATE_BUDGET_FRACTION=${arg#*=} ;;
+        *) echo "Error: Unknown argument \"$arg\" to candle estimate"; exit 1 ;;
+    esac
+done
+
+# Process the input file as submit-job does, after which run_workflows.sh runs estimate.py rather than the workflow
+export CANDLE_ESTIMATE=1
+bash "$CANDLE/wrappers/commands/submit-job/command_script.sh" "$input_file"
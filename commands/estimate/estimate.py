@@ -0,0 +1,274 @@
+# Estimate the resources a grid job needs from a pilot run of a few of its hyperparameter sets at a reduced budget
+# The pilot hyperparameter sets are run one after another on the current node; their durations (from the MODEL_WRAPPER.SH START/END TIME markers) are fit to a linear model in the number of epochs, which predicts the duration of every hyperparameter set at its full budget
+# For each candidate worker type and number of workers, the makespan is then simulated (longest-first, as async_scheduler.py dispatches) and added to the expected queue wait, and the candidate minimizing their sum is recommended
+# Run like "python estimate.py" from run_workflows.sh, which is done by "candle estimate <INPUT-FILE>"
+# ASSUMPTIONS:
+#   (1) candle is run via "candle estimate ...", which defines the variables $SITE, $CANDLE_SUBMISSION_DIR, $CANDLE_DEFAULT_MODEL_FILE, $CANDLE_WORKFLOW_SETTINGS_FILE, $CANDLE_ESTIMATE_NPILOTS, and $CANDLE_ESTIMATE_BUDGET_FRACTION (and $CANDLE_WORKER_TYPE on Biowulf)
+#   (2) The parameter space file contains one JSON hyperparameter set per line (grid or hyperband workflow)
+
+import os
+import re
+import sys
+import json
+import math
+import heapq
+import random
+import datetime
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'submit-job'))
+import async_scheduler
+import gpu_packing
+import keyword_schema
+
+
+BUDGET_PARAM = async_scheduler.BUDGET_PARAM
+ESTIMATE_DIRNAME = 'estimate_experiments'  # subdirectory of candle_generated_files in which the pilot evaluations are run
+ESTIMATE_FILE = 'estimate.json'  # in candle_generated_files
+OUT_AND_ERR_FILE = 'subprocess_out_and_err.txt'  # written by candle_compliant_wrapper.py in each evaluation directory
+START_REGEX = re.compile(r'^MODEL_WRAPPER\.SH START TIME: (\d+)', re.MULTILINE)
+END_REGEX = re.compile(r'^MODEL_WRAPPER\.SH END TIME: (\d+)', re.MULTILINE)
+SEED = 0
+WALLTIME_SAFETY_FACTOR = 1.25  # margin on the predicted makespan when recommending a walltime
+JOB_OVERHEAD_SECONDS = 300  # time for the job to start up (e.g., Swift/T) and shut down
+MAX_NWORKERS = 64
+RELATIVE_GPU_SPEED = {'k20x': 0.5, 'k80': 0.6, 'p100': 1.0, 'v100': 1.6, 'v100x': 1.6}  # rough relative throughput of the Biowulf GPU types for deep learning, used to scale durations measured on one type to the others
+CPU_CORES_PER_NODE = 16  # as ncores_cutoff in preprocess.py
+SUMMIT_GPUS_PER_NODE = 6
+QUEUE_WAIT_BASE_SECONDS = 120  # fallback model of the queue wait used if the scheduler can't be asked for an expected start time
+QUEUE_WAIT_PER_NODE_SECONDS = 300
+
+
+def read_default_budget(default_model_file):
+    """
+    Return the value of the budget hyperparameter (epochs) in the default model file, or None if it isn't set there
+    """
+    import configparser
+    config = configparser.ConfigParser()
+    try:
+        config.read(default_model_file)
+    except configparser.Error:
+        return None
+    for section in config.sections():
+        if config.has_option(section, BUDGET_PARAM):
+            try:
+                return float(config.get(section, BUDGET_PARAM))
+            except ValueError:
+                return None
+    return None
+
+
+def get_pilot_hpsets(hpsets, npilots, budget_fraction, default_budget):
+    """
+    Sample the pilot hyperparameter sets, alternating between two reduced budgets so that the fixed and per-epoch parts of an evaluation's duration can be told apart
+    Arguments:
+        hpsets: list
+            Hyperparameter sets of the job
+        npilots: int
+            Number of pilot hyperparameter sets
+        budget_fraction: float
+            Fraction of its budget with which the first of the two reduced budgets runs each pilot hyperparameter set (the second runs twice that)
+        default_budget: float
+            Budget of the hyperparameter sets not setting it themselves, or None if unknown
+
+    Returns: list
+        The pilot hyperparameter sets, with IDs prefixed by "pilot-"
+    """
+    rng = random.Random(SEED)
+    pilots = []
+    for ipilot, hpset in enumerate(rng.sample(hpsets, min(npilots, len(hpsets)))):
+        pilot = dict(hpset)
+        pilot['id'] = 'pilot-{}'.format(hpset.get('id', ipilot))
+        budget = pilot.get(BUDGET_PARAM, default_budget)
+        if isinstance(budget, (int, float)):
+            pilot[BUDGET_PARAM] = min(int(budget), max(1, int(round(budget * budget_fraction)) * (1 + ipilot % 2)))
+        pilots.append(pilot)
+    return pilots
+
+
+def read_duration(eval_dir):
+    """
+    Return the duration of an evaluation from the MODEL_WRAPPER.SH START/END TIME markers in its output, or None if they aren't there (e.g., the model is canonically CANDLE-compliant)
+    """
+    try:
+        with open(os.path.join(eval_dir, OUT_AND_ERR_FILE)) as f:
+            output = f.read()
+    except OSError:
+        return None
+    starts, ends = START_REGEX.findall(output), END_REGEX.findall(output)
+    if not (starts and ends):
+        return None
+    return int(ends[-1]) - int(starts[-1])
+
+
+def fit_duration_model(budgets, durations):
+    """
+    Fit duration = fixed + per_budget * budget by least squares, falling back to a duration proportional to the budget (or a constant duration if the budget is unknown) if the fit isn't meaningful
+    Arguments:
+        budgets: list
+            Budget of each pilot evaluation (None if unknown)
+        durations: list
+            Duration of each pilot evaluation in seconds
+
+    Returns: tuple
+        (fixed, per_budget) in seconds and seconds per unit of budget
+    """
+    if any(budget is None for budget in budgets):
+        return sum(durations) / len(durations), 0.0
+    mean_budget = sum(budgets) / len(budgets)
+    mean_duration = sum(durations) / len(durations)
+    variance = sum((budget - mean_budget) ** 2 for budget in budgets)
+    if variance > 0:
+        per_budget = sum((budget - mean_budget) * (duration - mean_duration) for budget, duration in zip(budgets, durations)) / variance
+        fixed = mean_duration - per_budget * mean_budget
+        if (per_budget > 0) and (fixed >= 0):
+            return fixed, per_budget
+    return 0.0, mean_duration / mean_budget
+
+
+def simulate_makespan(durations, nworkers):
+    """
+    Return the makespan of running evaluations of the given durations on a number of workers, longest first
+    """
+    workers = [0.0] * nworkers
+    for duration in sorted(durations, reverse=True):
+        heapq.heapreplace(workers, workers[0] + duration)
+    return max(workers)
+
+
+def format_walltime(seconds, site):
+    """
+    Format a walltime as the walltime keyword expects it on a site (hours:minutes:seconds on Biowulf, hours:minutes on Summit), rounded up to the minute
+    """
+    minutes = int(math.ceil(seconds / 60))
+    if site == 'biowulf':
+        return '{:02}:{:02}:00'.format(minutes // 60, minutes % 60)
+    return '{:02}:{:02}'.format(minutes // 60, minutes % 60)
+
+
+def get_nnodes(nworkers, worker_type, site):
+    """
+    Return the number of nodes a job with a number of workers requests, as in export_bash_variables() in preprocess.py (using all the GPUs of each node, without GPU packing, and assuming one thread per worker)
+    """
+    if site == 'biowulf':
+        if worker_type == 'cpu':
+            return int(math.ceil((nworkers + 1) / CPU_CORES_PER_NODE))
+        gpus_per_node = gpu_packing.GPUS_PER_NODE.get(worker_type, 1)
+        return int(math.ceil((nworkers + (gpus_per_node > 1)) / gpus_per_node))  # the Swift/T server takes a GPU slot when several GPUs per node are bound to tasks
+    return int(math.ceil((nworkers + 1) / SUMMIT_GPUS_PER_NODE))
+
+
+def estimate_queue_wait(nnodes, walltime, worker_type, site):
+    """
+    Return the expected wait in the queue of a job in seconds, asking Slurm on Biowulf (via sbatch --test-only) and otherwise falling back to a simple model growing with the number of nodes
+    """
+    if site == 'biowulf':
+        cmd = ['sbatch', '--test-only', '--nodes={}'.format(nnodes), '--time={}'.format(walltime), '--wrap=true']
+        if worker_type == 'cpu':
+            cmd.append('--partition={}'.format('norm' if nnodes == 1 else 'multinode'))
+        else:
+            cmd += ['--partition=gpu', '--gres=gpu:{}:1'.format(worker_type)]
+        try:
+            output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, timeout=60).stdout
+            match = re.search(r'to start at (\S+)', output)
+            if match:
+                return max(0.0, (datetime.datetime.strptime(match.group(1), '%Y-%m-%dT%H:%M:%S') - datetime.datetime.now()).total_seconds())
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            pass
+    return QUEUE_WAIT_BASE_SECONDS + QUEUE_WAIT_PER_NODE_SECONDS * nnodes
+
+
+def recommend(predicted_durations, measured_worker_type, valid_worker_types, site):
+    """
+    Evaluate every candidate worker type and number of workers and return the candidates sorted by the expected time to finish the job (queue wait plus runtime)
+    Arguments:
+        predicted_durations: list
+            Predicted duration of every hyperparameter set on the worker type of the pilot run
+        measured_worker_type: str
+            Worker type on which the pilot run was measured
+        valid_worker_types: tuple
+            Worker types available on the site
+        site: str
+            The site
+
+    Returns: list
+        One dictionary per candidate with the keys worker_type, nworkers, nnodes, runtime, queue_wait, total, and walltime
+    """
+
+    # The durations measured on one GPU type are scaled to the others; CPU and GPU durations can't be related
+    if measured_worker_type == 'cpu' or site != 'biowulf':
+        worker_types = {measured_worker_type: 1.0}
+    else:
+        worker_types = {worker_type: RELATIVE_GPU_SPEED[measured_worker_type] / RELATIVE_GPU_SPEED[worker_type] for worker_type in valid_worker_types if worker_type in RELATIVE_GPU_SPEED}
+
+    nworkers_candidates = sorted(set([2 ** i for i in range(int(math.log2(MAX_NWORKERS)) + 1) if 2 ** i <= len(predicted_durations)] + [min(len(predicted_durations), MAX_NWORKERS)]))
+    candidates = []
+    for worker_type, scale in worker_types.items():
+        durations = [duration * scale for duration in predicted_durations]
+        for nworkers in nworkers_candidates:
+            runtime = simulate_makespan(durations, nworkers) + JOB_OVERHEAD_SECONDS
+            walltime = format_walltime(runtime * WALLTIME_SAFETY_FACTOR, site)
+            nnodes = get_nnodes(nworkers, worker_type, site)
+            queue_wait = estimate_queue_wait(nnodes, walltime, worker_type, site)
+            candidates.append({'worker_type': worker_type, 'nworkers': nworkers, 'nnodes': nnodes, 'runtime': runtime, 'queue_wait': queue_wait, 'total': runtime + queue_wait, 'walltime': walltime})
+    return sorted(candidates, key=lambda candidate: candidate['total'])
+
+
+def main():
+
+    # Obtain the settings
+    site = os.getenv('SITE')
+    generated_files_dir = os.path.join(os.getenv('CANDLE_SUBMISSION_DIR'), 'candle_generated_files')
+    hpsets = async_scheduler.load_hpsets(os.getenv('CANDLE_WORKFLOW_SETTINGS_FILE'))
+    npilots = int(os.getenv('CANDLE_ESTIMATE_NPILOTS'))
+    budget_fraction = float(os.getenv('CANDLE_ESTIMATE_BUDGET_FRACTION'))
+    default_budget = read_default_budget(os.getenv('CANDLE_DEFAULT_MODEL_FILE'))
+    worker_type = os.getenv('CANDLE_WORKER_TYPE', 'v100')  # Summit only has V100s
+    valid_worker_types = keyword_schema.get_keywords(site).get('worker_type', dict()).get('choices', ())
+
+    # Run the pilot hyperparameter sets one after another on this node
+    pilots = get_pilot_hpsets(hpsets, npilots, budget_fraction, default_budget)
+    exp_dir = async_scheduler.get_new_experiment_dir(os.path.join(generated_files_dir, ESTIMATE_DIRNAME))
+    print('Running {} pilot hyperparameter sets with reduced {} in {}'.format(len(pilots), BUDGET_PARAM, exp_dir), flush=True)
+    timings = async_scheduler.schedule(pilots, [0] * len(pilots), 1, lambda slot, hpset: async_scheduler.launch_evaluation(slot, hpset, exp_dir, []))
+
+    # Measure the pilot evaluations, preferring the model wrapper's markers to the scheduler's timings since they exclude the startup of the evaluation process
+    timings = {timing['id']: timing for timing in timings}
+    measured = []
+    for pilot in pilots:
+        timing = timings[pilot['id']]
+        if timing['returncode'] != 0:
+            print('WARNING: Pilot evaluation {} failed; not using it'.format(pilot['id']))
+            continue
+        duration = read_duration(os.path.join(exp_dir, 'run', pilot['id']))
+        measured.append({'id': pilot['id'], BUDGET_PARAM: pilot.get(BUDGET_PARAM), 'duration': duration if duration is not None else timing['end_time'] - timing['dispatch_time']})
+        print('Pilot evaluation {} with {} {} took {:.0f} s'.format(pilot['id'], BUDGET_PARAM, measured[-1][BUDGET_PARAM], measured[-1]['duration']))
+    budgets = [pilot[BUDGET_PARAM] for pilot in measured]
+    durations = [pilot['duration'] for pilot in measured]
+    if not durations:
+        print('ERROR: No pilot evaluation succeeded; see the evaluation directories in {}'.format(exp_dir))
+        exit(1)
+
+    # Extrapolate the total work of the job
+    fixed, per_budget = fit_duration_model(budgets, durations)
+    predicted_durations = [fixed + per_budget * (hpset.get(BUDGET_PARAM, default_budget) or 0) for hpset in hpsets]
+    total_work = sum(predicted_durations)
+    print('Predicted duration of an evaluation: {:.0f} s + {:.1f} s per unit of {}; total work for {} hyperparameter sets: {:.0f} s ({:.1f} hours)'.format(fixed, per_budget, BUDGET_PARAM, len(hpsets), total_work, total_work / 3600))
+
+    # Recommend the settings minimizing the time to finish the job
+    candidates = recommend(predicted_durations, worker_type, valid_worker_types, site)
+    print('\n{:>11} {:>8} {:>6} {:>12} {:>12} {:>12} {:>10}'.format('worker_type', 'nworkers', 'nodes', 'runtime (h)', 'queue (h)', 'total (h)', 'walltime'))
+    for candidate in candidates:
+        print('{:>11} {:>8} {:>6} {:>12.2f} {:>12.2f} {:>12.2f} {:>10}'.format(candidate['worker_type'], candidate['nworkers'], candidate['nnodes'], candidate['runtime'] / 3600, candidate['queue_wait'] / 3600, candidate['total'] / 3600, candidate['walltime']))
+    best = candidates[0]
+    print('\nRecommended settings for the &control section:\n')
+    if site == 'biowulf':
+        print('  worker_type = "{}"'.format(best['worker_type']))
+    print('  nworkers = {}'.format(best['nworkers']))
+    print('  walltime = "{}"\n'.format(best['walltime']))
+    with open(os.path.join(generated_files_dir, ESTIMATE_FILE), 'w') as f:
+        json.dump({'pilots': measured, 'fixed': fixed, 'per_budget': per_budget, 'total_work': total_work, 'candidates': candidates}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+# This script measures the throughput (in hyperparameter sets per second) of the grid engine in generate_hyperparameter_grid.py on large synthetic grids.
+# Run like "python $CANDLE/wrappers/commands/generate-grid/benchmark_grid.py [<NDIMS> [<NVALUES-PER-DIM>]]", e.g., "python benchmark_grid.py 7 8" for a 7-dimensional grid of 8^7 = 2,097,152 points
+# Assumption: A numpy-containing Python is loaded
+
+# Import relevant modules
+import numpy as np
+import tempfile
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import generate_hyperparameter_grid as ghg
+
+
+# Define a function that builds a synthetic grid with a mix of integer, float, and string variables
+def make_variables(ndims, nvalues):
+    variables = []
+    for idim in range(ndims):
+        if idim % 3 == 0:
+            variables.append(['int_var_{}'.format(idim), np.arange(nvalues) * 16])
+        elif idim % 3 == 1:
+            variables.append(['float_var_{}'.format(idim), np.linspace(0.0001, 0.9, nvalues)])
+        else:
+            variables.append(['str_var_{}'.format(idim), ['value_{}'.format(ivalue) for ivalue in range(nvalues)]])
+    return(variables)
+
+
+def main():
+
+    # Obtain the grid size from the arguments to the script call
+    ndims = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    nvalues = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    variables = make_variables(ndims, nvalues)
+
+    # Time writing the entire grid to a temporary file
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, 'hyperparameter_grid.txt')
+        start_time = time.perf_counter()
+        with open(filename, 'w', buffering=ghg.WRITE_BUFFER_SIZE) as f:
+            nhpsets = ghg.write_hpsets(ghg.generate_hpsets(variables), f)
+        elapsed_time = time.perf_counter() - start_time
+        nbytes = os.path.getsize(filename)
+
+    # Output the results
+    print('Grid dimensions:      {} variables x {} values'.format(ndims, nvalues))
+    print('Hyperparameter sets:  {}'.format(nhpsets))
+    print('File size:            {:.1f} MB'.format(nbytes / 1024**2))
+    print('Elapsed time:         {:.2f} s'.format(elapsed_time))
+    print('Throughput:           {:.0f} rows/s'.format(nhpsets / elapsed_time))
+
+
+if __name__ == '__main__':
+    main()
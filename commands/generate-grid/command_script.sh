@@ -6,7 +6,7 @@
 # Save all the arguments to this script to an array called args_arr
 args_arr=($@)
 
-echo -n "Generating hyperparameter grid into file \"hyperparameter_grid.txt\"... "
+echo -n "Generating hyperparameter grid into file(s) \"candle_generated_files/hyperparameter_grid*\"... "
 
 # Load a numpy-containing Python
 # shellcheck source=/dev/null
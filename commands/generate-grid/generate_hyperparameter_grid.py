@@ -4,14 +4,26 @@
 
 # Import relevant modules
 import numpy as np
+import itertools
+import argparse
+import random
+import json
 import sys
 import os
 
-# Obtain the arguments to the script call
-arguments = sys.argv[1:]
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'submit-job'))
+import input_file_parser
 
-# Make sure at least one set of variables is specified
-if len(arguments) == 0:
+# Constants
+HPSET_FORMAT = '{{"id": "hpset_{:05}"{}}}\n'  # format of a single line of the unrolled parameter file
+CHUNK_NLINES = 65536  # number of hyperparameter sets to join together before each write to the output file
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024  # size in bytes of the output file buffer
+GRID_BASENAME = 'hyperparameter_grid'  # basename of the unrolled parameter file(s) written to candle_generated_files
+SAMPLING_METHODS = ('random', 'lhs', 'sobol')  # uniform random (without replacement), Latin hypercube, and Sobol sampling of the grid
+
+
+# Output the usage of this script
+def usage():
     print('')
     print('Call this script with one or more strings of two-element lists containing (1) the variable name and (2) the values, which must be a list. Double-quote each string argument.')
     print('')
@@ -20,12 +32,15 @@ if len(arguments) == 0:
     print('  module load python/3.7')
     print('  python $CANDLE/wrappers/commands/generate-grid/generate_hyperparameter_grid.py "[\'john\',np.arange(5,15,2)]" "[\'single_num\',[4]]" "[\'letter\',[\'x\',\'y\',\'z\']]" "[\'arr\',[[2,2],None,[2,2,2],[2,2,2,2]]]" "[\'smith\',np.arange(-1,1,0.2)]"')
     print('')
-    exit()
+    print('To split the grid into N shard files (plus a manifest), each of which can be run as its own grid job, add --nshards=N; to also write one copy of an input file per shard whose &param_space section points to that shard, add --input_file=<INPUT-FILE>:')
+    print('')
+    print('  python $CANDLE/wrappers/commands/generate-grid/generate_hyperparameter_grid.py --nshards=4 --input_file=grid_example.in "[\'john\',np.arange(5,15,2)]" "[\'letter\',[\'x\',\'y\',\'z\']]"')
+    print('')
+    print('To draw only N well-spread points from the grid instead of the entire Cartesian product, add --sample=<{}> and --npoints=N (and optionally --seed=<SEED>):'.format('|'.join(SAMPLING_METHODS)))
+    print('')
+    print('  python $CANDLE/wrappers/commands/generate-grid/generate_hyperparameter_grid.py --sample=lhs --npoints=1000 --seed=7 "[\'john\',np.arange(5,15,2)]" "[\'smith\',np.arange(-1,1,0.01)]"')
+    print('')
 
-# Create a list of the variable settings
-variables = []
-for argument in arguments:
-    variables.append(eval(argument))
 
 # Define a function for determining whether an object is a number
 # Modified from https://stackoverflow.com/questions/354038/how-do-i-check-if-a-string-is-a-number-float
@@ -35,7 +50,8 @@ def is_number(obj):
         return True
     except ValueError:
         return False
-        
+
+
 # Define a function to add to a string a name/value pair of a particular datatype
 def add_to_set(set_str_base, name, value, dtype):
 
@@ -43,7 +59,7 @@ def add_to_set(set_str_base, name, value, dtype):
     wrap_char = ''
     if isinstance(value, str):
         wrap_char = '"'
-        
+
     # Define the string to be formatted
     tmp_str = '{}, "{}": {}{:' + dtype + '}{}'
 
@@ -56,18 +72,9 @@ def add_to_set(set_str_base, name, value, dtype):
     # Return the formatted string
     return(tmp_str.format(set_str_base, name, wrap_char, value, wrap_char))
 
-# Define a function to output each set of hyperparameters
-def print_str(set_str, nhpset, f):
-    nhpset += 1
-    f.write('{{"id": "hpset_{:05}"{}}}\n'.format(nhpset, set_str))
-    return(nhpset)
-
-# Define a recursive function that when initialized creates an unrolled parameter file
-def make_set(variables, set_str_base, ivar, nhpset, f):
 
-    # Get the current variable name and its set of values
-    name = variables[ivar][0]
-    values = variables[ivar][1]
+# Define a function that formats every value of a single variable exactly once
+def format_variable(name, values):
 
     # If the values are numbers, determine whether they are integers or floats
     dtype = ''
@@ -78,27 +85,201 @@ def make_set(variables, set_str_base, ivar, nhpset, f):
         else:
             dtype = 'f' # float
 
-    # For every value of the current variable...
-    for value in values:
+    # Return the list of ', "name": value' strings for the current variable
+    return([add_to_set('', name, value, dtype) for value in values])
 
-        # Add the name/value pair to the string describing the current hyperparameter set
-        set_str = add_to_set(set_str_base, name, value, dtype)
 
-        # If we're not on the last variable...
-        if ivar < len(variables)-1:
+# Define a generator that yields the lines of the unrolled parameter file one at a time
+# The last variable varies the fastest, and the IDs start at hpset_<start>
+def generate_hpsets(variables, start=1):
 
-            # Call this function again setting set_str-->set_str_base, ivar+1-->ivar, updated current hyperparameter set index (nhpset), and the same "variables" value
-            nhpset = make_set(variables, set_str, ivar+1, nhpset, f)
+    # Get the preformatted name/value pairs of every variable
+    formatted_variables = [format_variable(variable[0], variable[1]) for variable in variables]
 
-        else:
+    # For every combination of the variable values, output the current hyperparameter set with a unique ID
+    for nhpset, combination in enumerate(itertools.product(*formatted_variables), start):
+        yield(HPSET_FORMAT.format(nhpset, ''.join(combination)))
+
+
+# Define a function that draws npoints distinct points from the grid (without generating it), returning the indices into each variable's values for every point
+def sample_indices(nvalues, npoints, method, seed=None):
+
+    # No more points can be drawn than there are in the entire grid
+    nhpsets = 1
+    for nvalues_curr in nvalues:
+        nhpsets *= nvalues_curr
+    if npoints > nhpsets:
+        print('NOTE: Requested number of points ({}) has been decreased to the size of the entire grid ({})'.format(npoints, nhpsets))
+        npoints = nhpsets
+
+    # Uniform random sampling without replacement of the flattened grid indices, each of which is then unraveled (the last variable varying the fastest)
+    if method == 'random':
+        rng = random.Random(seed)
+        if nhpsets <= sys.maxsize:
+            flat_indices = rng.sample(range(nhpsets), npoints)
+        else:  # the grid is too large for random.sample() but necessarily much larger than npoints, so just reject the rare repeats
+            flat_indices = dict()
+            while len(flat_indices) < npoints:
+                flat_indices[rng.randrange(nhpsets)] = None
+        indices = []
+        for flat_index in flat_indices:
+            point = []
+            for nvalues_curr in reversed(nvalues):
+                flat_index, index = divmod(flat_index, nvalues_curr)
+                point.append(index)
+            indices.append(point[::-1])
+        return(indices)
+
+    # Otherwise, draw points in the unit hypercube and map each coordinate onto the values of the corresponding variable
+    if method == 'lhs':
+        rng = np.random.default_rng(seed)
+        unit_points = np.empty((npoints, len(nvalues)))
+        for ivar in range(len(nvalues)):
+            unit_points[:, ivar] = (rng.permutation(npoints) + rng.random(npoints)) / npoints
+    elif method == 'sobol':
+        try:
+            from scipy.stats import qmc
+        except ImportError:
+            print('ERROR: Sobol sampling requires scipy (>= 1.7) to be installed in the Python environment')
+            exit(1)
+        unit_points = qmc.Sobol(d=len(nvalues), scramble=True, seed=seed).random(npoints)
+    else:
+        print('ERROR: Sampling method "{}" must be one of'.format(method), SAMPLING_METHODS)
+        exit(1)
+
+    # Points falling on the same grid point would be the same hyperparameter set, so keep only the first of each and replace the rest with uniformly random grid points not already drawn
+    points = dict.fromkeys(tuple(point) for point in np.minimum((unit_points * nvalues).astype(int), np.array(nvalues) - 1).tolist())
+    if len(points) < npoints:
+        print('NOTE: {} of the {} points drawn by {} sampling fell on grid points already drawn and have been replaced by uniformly random grid points'.format(npoints - len(points), npoints, method))
+        rng = random.Random(seed)
+        while len(points) < npoints:
+            points[tuple(rng.randrange(nvalues_curr) for nvalues_curr in nvalues)] = None
+    return([list(point) for point in points])
+
+
+# Define a generator that yields the lines of the unrolled parameter file for only the sampled points of the grid
+def generate_sampled_hpsets(variables, indices, start=1):
+
+    # Get the preformatted name/value pairs of every variable
+    formatted_variables = [format_variable(variable[0], variable[1]) for variable in variables]
+
+    # For every sampled point, output the corresponding hyperparameter set with a unique ID
+    for nhpset, point in enumerate(indices, start):
+        yield(HPSET_FORMAT.format(nhpset, ''.join([formatted_variable[index] for formatted_variable, index in zip(formatted_variables, point)])))
+
+
+# Define a function that writes lines to a file in large chunks, returning the number of lines written
+def write_hpsets(hpsets, f, chunk_nlines=CHUNK_NLINES):
+    nhpsets = 0
+    while True:
+        chunk = list(itertools.islice(hpsets, chunk_nlines))
+        if not chunk:
+            break
+        f.write(''.join(chunk))
+        nhpsets += len(chunk)
+    return(nhpsets)
+
+
+# Define a function that calculates the total number of hyperparameter sets in the grid without generating it
+def count_hpsets(variables):
+    nhpsets = 1
+    for variable in variables:
+        nhpsets *= len(variable[1])
+    return(nhpsets)
+
+
+# Define a function that writes a copy of an input file whose &param_space section points to a shard of the grid
+def write_shard_input_file(input_file, shard_file, shard_input_file):
+
+    # Read in the original input file, locating its &param_space section as "candle submit-job" does
+    with open(input_file) as f:
+        lines = f.readlines()
+    span = input_file_parser.parse(input_file).spans.get('param_space')
+    if span is None:
+        print('ERROR: Input file "{}" does not contain a &param_space section'.format(input_file))
+        exit(1)
+
+    # Replace the contents of the &param_space section with the candle_param_space_file keyword
+    start_line_number, end_line_number = span
+    new_lines = lines[:start_line_number] + ['  candle_param_space_file="{}"\n'.format(shard_file)] + (lines[end_line_number - 1:] if end_line_number is not None else ['/\n'])
+
+    # Write the new input file
+    with open(shard_input_file, 'w') as f:
+        f.writelines(new_lines)
+
+
+# Define a function that splits the hyperparameter sets into nshards files of contiguous IDs, returning the manifest describing them
+def write_sharded_hpsets(hpsets, nhpsets, nshards, dirname, input_file=None, start=1):
+    shard_nhpsets = -(-nhpsets // nshards)  # ceiling division
+    shards = []
+    for ishard in range(nshards):
+        first_hpset = start + ishard * shard_nhpsets
+        last_hpset = min(first_hpset + shard_nhpsets, start + nhpsets) - 1
+        if last_hpset < first_hpset:
+            break
+        shard = {'file': os.path.join(dirname, '{}-shard_{:05}.txt'.format(GRID_BASENAME, ishard + 1))}
+        with open(shard['file'], 'w', buffering=WRITE_BUFFER_SIZE) as f:
+            shard['nhpsets'] = write_hpsets(itertools.islice(hpsets, last_hpset - first_hpset + 1), f)
+        shard['first_id'] = 'hpset_{:05}'.format(first_hpset)
+        shard['last_id'] = 'hpset_{:05}'.format(last_hpset)
+        if input_file is not None:
+            shard['input_file'] = os.path.join(dirname, '{}-shard_{:05}.in'.format(os.path.splitext(os.path.basename(input_file))[0], ishard + 1))
+            write_shard_input_file(input_file, shard['file'], shard['input_file'])
+        shards.append(shard)
+    return({'nhpsets': nhpsets, 'nshards': len(shards), 'shards': shards})
+
+
+def main():
+
+    # Obtain the arguments to the script call
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('variables', nargs='*')
+    parser.add_argument('--nshards', type=int, default=1)
+    parser.add_argument('--input_file', default=None)
+    parser.add_argument('--sample', choices=SAMPLING_METHODS, default=None)
+    parser.add_argument('--npoints', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    # Make sure at least one set of variables is specified
+    if len(args.variables) == 0:
+        usage()
+        exit()
+    if args.nshards < 1:
+        print('ERROR: The number of shards ({}) must be a positive integer'.format(args.nshards))
+        exit(1)
+    if (args.sample is not None) and ((args.npoints is None) or (args.npoints < 1)):
+        print('ERROR: The number of points to sample must be set to a positive integer using --npoints')
+        exit(1)
+
+    # Create a list of the variable settings
+    variables = []
+    for argument in args.variables:
+        variables.append(eval(argument))
+
+    dirname = os.path.join(os.getenv('CANDLE_SUBMISSION_DIR'), 'candle_generated_files')
+
+    # Set up the generation of either the entire grid or only a sample of it
+    if args.sample is None:
+        hpsets = generate_hpsets(variables)
+        nhpsets = count_hpsets(variables)
+    else:
+        indices = sample_indices([len(variable[1]) for variable in variables], args.npoints, args.sample, args.seed)
+        hpsets = generate_sampled_hpsets(variables, indices)
+        nhpsets = len(indices)
 
-            # Otherwise, print the current hyperparameter set with a unique ID
-            nhpset = print_str(set_str, nhpset, f)
+    # Stream the hyperparameter sets to the unrolled parameter file
+    if args.nshards == 1 and args.input_file is None:
+        with open(os.path.join(dirname, GRID_BASENAME + '.txt'), 'w', buffering=WRITE_BUFFER_SIZE) as f:
+            write_hpsets(hpsets, f)
 
-    # Return the current hyperparameter set index
-    return(nhpset)
+    # ...or to the shards and write the manifest describing them
+    else:
+        input_file = None if args.input_file is None else os.path.abspath(args.input_file)
+        manifest = write_sharded_hpsets(hpsets, nhpsets, args.nshards, dirname, input_file)
+        with open(os.path.join(dirname, GRID_BASENAME + '-manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
 
 
-# Call the make_set() function with initialized settings
-with open(os.path.join(os.getenv('CANDLE_SUBMISSION_DIR'), 'candle_generated_files', 'hyperparameter_grid.txt'), 'w') as f:
-    make_set(variables, '', 0, 0, f)
+if __name__ == '__main__':
+    main()
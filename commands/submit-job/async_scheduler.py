@@ -0,0 +1,288 @@
+# Asynchronous scheduler for the grid workflow: a controller that keeps every worker slot of the allocation busy by dispatching the hyperparameter sets of the UPF file one at a time to whichever slot is idle, longest-expected-first, so that stragglers don't leave the other workers idle at the end of the job
+# Used in place of Supervisor's Swift/T upf workflow when the scheduler keyword is set to "async" (in which case the controller is submitted as a batch job whose evaluations are srun/jsrun job steps) or "async_local" (in which case the controller runs right here and its evaluations are local processes, e.g., in an interactive allocation)
+# If $CANDLE_BULK_MANIFEST is set (by bulk_submit.py), the hyperparameter sets of all the input files listed in that manifest are dispatched together, each evaluated in the environment and experiments directory of its own input file
+# Run like "python async_scheduler.py" from run_workflows.sh or bulk_submit.py; the batch job runs "python async_scheduler.py --in-allocation", and each evaluation runs "python async_scheduler.py --evaluate <EVAL-DIR> <HPSET-JSON>"
+# ASSUMPTIONS:
+#   (1) candle is run the normal way via "candle submit-job ...", which defines the variables $SITE, $CANDLE_SUBMISSION_DIR, $EXPERIMENTS, $OBJ_RETURN, $MODEL_PYTHON_DIR, $MODEL_PYTHON_SCRIPT, $CANDLE_DEFAULT_MODEL_FILE, $CANDLE_WORKFLOW_SETTINGS_FILE, $CANDLE_SCHEDULER, $CANDLE_NWORKERS, and $CANDLE_EVALUATION_LAUNCHER (and the batch settings $QUEUE, $WALLTIME, $TURBINE_SBATCH_ARGS, $PPN, $PROJECT, and $NODES)
+#   (2) The parameter space file contains one JSON hyperparameter set per line, each with a unique "id"
+
+import os
+import sys
+import json
+import time
+import shlex
+import statistics
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import experiment_index
+import gpu_packing
+
+
+EXPID_PREFIX = 'X'  # experiment directories are named like Supervisor's, e.g., X000
+TIMINGS_FILE = 'scheduler_timings.jsonl'  # written to the experiment directory, one line per evaluation
+POLL_INTERVAL = 1  # seconds between checks for finished evaluations
+RESULT_FILE = 'result.txt'
+EVAL_LOG = 'model.log'
+LOG_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'  # as read by restart.py
+BUDGET_PARAM = 'epochs'  # hyperparameter assumed to be proportional to the duration of an evaluation when it hasn't been timed before
+
+
+def load_hpsets(filename):
+    """
+    Return the hyperparameter sets (dictionaries) in a UPF file containing one JSON object per line
+    """
+    hpsets = []
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                hpsets.append(json.loads(line))
+    return hpsets
+
+
+def estimate_durations(hpsets, experiments_dir):
+    """
+    Estimate how long each hyperparameter set will take to evaluate from the evaluations recorded in the experiment index
+    An evaluation of the same hyperparameter set (e.g., from a job being rerun) gives its duration directly; otherwise the duration is the typical duration per epoch times the epochs of the set, or else the typical duration of an evaluation
+    Arguments:
+        hpsets: list
+            Hyperparameter sets to estimate
+        experiments_dir: str
+            Path to the experiments directory
+
+    Returns: list
+        The estimated duration of each hyperparameter set (in seconds if the index has any timed evaluations, and otherwise only relative)
+    """
+
+    # Gather the durations of the timed evaluations in the index
+    previous_durations = {}
+    per_epoch, overall = [], []
+    for record in experiment_index.query_evaluations(experiments_dir):
+        if (record['start_time'] is None) or (record['stop_time'] is None):
+            continue
+        duration = record['stop_time'] - record['start_time']
+        previous_durations[record['eval_id']] = duration
+        overall.append(duration)
+        if isinstance(record['params'].get(BUDGET_PARAM), (int, float)) and record['params'][BUDGET_PARAM] > 0:
+            per_epoch.append(duration / record['params'][BUDGET_PARAM])
+    per_epoch = statistics.median(per_epoch) if per_epoch else 1.0
+    overall = statistics.median(overall) if overall else 1.0
+
+    durations = []
+    for hpset in hpsets:
+        if str(hpset.get('id')) in previous_durations:
+            durations.append(previous_durations[str(hpset['id'])])
+        elif isinstance(hpset.get(BUDGET_PARAM), (int, float)):
+            durations.append(per_epoch * hpset[BUDGET_PARAM])
+        else:
+            durations.append(overall)
+    return durations
+
+
+def get_new_experiment_dir(experiments_dir):
+    """
+    Create and return the next unused experiment directory (X000, X001, ...)
+    """
+    iexp = 0
+    while True:
+        exp_dir = os.path.join(experiments_dir, '{}{:03}'.format(EXPID_PREFIX, iexp))
+        try:
+            os.makedirs(exp_dir)
+            return exp_dir
+        except FileExistsError:
+            iexp += 1
+
+
+def schedule(hpsets, durations, nworkers, launch_func, poll_interval=POLL_INTERVAL):
+    """
+    Evaluate hyperparameter sets on a fixed number of worker slots, always giving the next longest expected set to the first slot that becomes idle
+    Arguments:
+        hpsets: list
+            Hyperparameter sets to evaluate (or any dictionaries with a unique "id" that launch_func knows how to evaluate)
+        durations: list
+            Expected duration of each hyperparameter set
+        nworkers: int
+            Number of worker slots
+        launch_func: function
+            Function taking a worker slot and a hyperparameter set and returning the started subprocess.Popen object evaluating it
+        poll_interval: float
+            Seconds between checks for finished evaluations
+
+    Returns: list
+        One timing record per evaluation with the keys id, slot, expected_duration, dispatch_time, end_time, and returncode, in the order the evaluations finished
+    """
+
+    queue = sorted(range(len(hpsets)), key=lambda ihpset: durations[ihpset], reverse=True)
+    idle_slots = list(range(nworkers))
+    running = {}
+    timings = []
+    while queue or running:
+
+        # Keep every idle slot busy
+        while queue and idle_slots:
+            ihpset = queue.pop(0)
+            slot = idle_slots.pop(0)
+            running[slot] = (ihpset, launch_func(slot, hpsets[ihpset]), time.time())
+
+        # Free the slots of the evaluations that have finished
+        time.sleep(poll_interval)
+        for slot in sorted(running):
+            ihpset, process, dispatch_time = running[slot]
+            if process.poll() is not None:
+                timings.append({'id': hpsets[ihpset]['id'], 'slot': slot, 'expected_duration': durations[ihpset], 'dispatch_time': dispatch_time, 'end_time': time.time(), 'returncode': process.returncode})
+                del running[slot]
+                idle_slots.append(slot)
+                print('Evaluation {} finished on slot {} after {:.1f} s with return code {} ({} queued, {} running)'.format(timings[-1]['id'], slot, timings[-1]['end_time'] - dispatch_time, process.returncode, len(queue), len(running)), flush=True)
+
+    return timings
+
+
+def launch_evaluation(slot, hpset, exp_dir, launcher, environment=None):
+    """
+    Start the evaluation of a hyperparameter set in its own directory of the experiment
+    Arguments:
+        slot: int
+            Worker slot, passed to the evaluation as $CANDLE_WORKER_SLOT so that it can bind itself to one of its node's GPUs (see gpu_packing.get_bound_gpus()); the slots are spread round-robin over the nodes by the launcher's {node} placeholder, if any
+        hpset: dict
+            Hyperparameter set to evaluate
+        exp_dir: str
+            Path to the experiment directory
+        launcher: list
+            Command (e.g., an srun or jsrun job step) prepended to that running the evaluation, or an empty list to run it as a local process
+        environment: dict
+            Variables to set in the environment of the evaluation in addition to the current ones (e.g., those of its input file in a bulk submission)
+
+    Returns: subprocess.Popen
+        The process running the evaluation
+    """
+    eval_dir = os.path.join(exp_dir, experiment_index.run_dirname, str(hpset['id']))
+    os.makedirs(eval_dir, exist_ok=True)
+    node = slot % int(os.getenv('SLURM_JOB_NUM_NODES', '1'))
+    launcher = [x.replace('{node}', str(node)) for x in launcher]
+    environment = dict(os.environ, **(environment or {}), CANDLE_WORKER_SLOT=str(slot))
+    with open(os.path.join(eval_dir, EVAL_LOG), 'w') as log:
+        return subprocess.Popen(launcher + [sys.executable, os.path.realpath(__file__), '--evaluate', eval_dir, json.dumps(hpset)], stdout=log, stderr=subprocess.STDOUT, cwd=eval_dir, env=environment)
+
+
+def evaluate(eval_dir, hpset):
+    """
+    Run the canonically CANDLE-compliant model script on a hyperparameter set in its evaluation directory and write the objective to result.txt, as Supervisor's model runner does
+    """
+
+    # Import relevant library
+    import importlib
+
+    def log(message):
+        print('{} __main__ INFO: {}'.format(time.strftime(LOG_TIME_FORMAT), message), flush=True)
+
+    # Bind the evaluation to its GPU if several evaluations share the GPUs of a node
+    gpus = gpu_packing.get_bound_gpus()
+    if gpus is not None:
+        os.environ['CUDA_VISIBLE_DEVICES'] = gpus
+
+    os.chdir(eval_dir)
+    log('RUN START')
+    sys.argv = [os.path.join(os.getenv('MODEL_PYTHON_DIR'), os.getenv('MODEL_PYTHON_SCRIPT') + '.py')]  # so that the CANDLE library doesn't parse our arguments
+    sys.path.insert(0, os.getenv('MODEL_PYTHON_DIR'))
+    model = importlib.import_module(os.getenv('MODEL_PYTHON_SCRIPT'))
+    params = model.initialize_parameters(default_model=os.getenv('CANDLE_DEFAULT_MODEL_FILE'))
+    params.update(hpset)
+    history = model.run(params)
+    objective = experiment_index.get_objective(history.history)
+    if objective is not None:
+        with open(RESULT_FILE, 'w') as f:
+            f.write('{}\n'.format(objective))
+    log('RUN STOP')
+
+
+def submit_batch_job():
+    """
+    Submit a batch job running this controller inside the allocation requested by the job's keywords
+    """
+    site = os.getenv('SITE')
+    cmd = '{} {} --in-allocation'.format(shlex.quote(sys.executable), shlex.quote(os.path.realpath(__file__)))
+    output = os.path.join(os.getenv('CANDLE_SUBMISSION_DIR'), 'candle_generated_files', 'async_scheduler-%j.out')
+    if site == 'biowulf':
+        submit_cmd = ['sbatch', '--partition={}'.format(os.getenv('QUEUE')), '--time={}'.format(os.getenv('WALLTIME')), '--ntasks={}'.format(os.getenv('CANDLE_NWORKERS')), '--ntasks-per-node={}'.format(os.getenv('PPN'))] + shlex.split(os.getenv('TURBINE_SBATCH_ARGS', '')) + ['--job-name={}'.format(os.getenv('MODEL_NAME', 'candle_job')), '--output={}'.format(output), '--wrap={}'.format(cmd)]
+    elif site in ('summit-tf1', 'summit-tf2'):
+        submit_cmd = ['bsub', '-P', os.getenv('PROJECT'), '-nnodes', os.getenv('NODES'), '-W', os.getenv('WALLTIME'), '-q', os.getenv('QUEUE'), '-J', os.getenv('MODEL_NAME', 'candle_job'), '-o', output.replace('%j', '%J')] + shlex.split(cmd)
+    else:
+        print('ERROR: site ({}) is unknown in async_scheduler.py'.format(site))
+        exit(1)
+    print('Submitting the asynchronous scheduler as a batch job using:\n  {}'.format(' '.join(shlex.quote(x) for x in submit_cmd)), flush=True)
+    subprocess.run(submit_cmd, check=True)
+
+
+def load_jobs():
+    """
+    Return the jobs whose hyperparameter sets are to be evaluated, i.e., the one submitted normally or all those of a bulk submission (see bulk_submit.py)
+
+    Returns: list
+        One dictionary per job with the keys name (None unless bulk), hpsets, experiments_dir, and environment (the variables to set for its evaluations, or None to use the current ones)
+    """
+    manifest_file = os.getenv('CANDLE_BULK_MANIFEST')
+    if manifest_file:
+        with open(manifest_file) as f:
+            members = json.load(f)['members']
+        jobs = []
+        for member in members:
+            environment = dict(os.environ, **member['environment'])
+            jobs.append({'name': member['name'], 'settings_file': environment['CANDLE_WORKFLOW_SETTINGS_FILE'], 'experiments_dir': environment['EXPERIMENTS'], 'environment': member['environment']})
+    else:
+        jobs = [{'name': None, 'settings_file': os.getenv('CANDLE_WORKFLOW_SETTINGS_FILE'), 'experiments_dir': os.getenv('EXPERIMENTS'), 'environment': None}]
+    for job in jobs:
+        job['hpsets'] = load_hpsets(job['settings_file'])
+        ids = [str(hpset.get('id')) for hpset in job['hpsets']]
+        if len(set(ids)) != len(ids):
+            print('ERROR: Every hyperparameter set in {} must have a unique "id"'.format(job['settings_file']))
+            exit(1)
+    return jobs
+
+
+def run_controller(launcher):
+    """
+    Evaluate every hyperparameter set of the UPF file (or of the UPF files of a bulk submission) in a new experiment directory and report how well the workers were kept busy
+    """
+
+    # Obtain the settings, pooling the hyperparameter sets of all the jobs, each labeled by its job in a bulk submission
+    nworkers = int(os.getenv('CANDLE_NWORKERS'))
+    jobs = load_jobs()
+    evaluations, durations = [], []
+    for job in jobs:
+        durations += estimate_durations(job['hpsets'], job['experiments_dir'])
+        job['exp_dir'] = get_new_experiment_dir(job['experiments_dir'])
+        evaluations += [{'id': hpset['id'] if job['name'] is None else '{}/{}'.format(job['name'], hpset['id']), 'hpset': hpset, 'job': job} for hpset in job['hpsets']]
+    print('Asynchronously evaluating {} hyperparameter sets on {} workers in {}'.format(len(evaluations), nworkers, ', '.join(job['exp_dir'] for job in jobs)), flush=True)
+
+    # Run the evaluations
+    start_time = time.time()
+    timings = schedule(evaluations, durations, nworkers, lambda slot, evaluation: launch_evaluation(slot, evaluation['hpset'], evaluation['job']['exp_dir'], launcher, evaluation['job']['environment']))
+    makespan = time.time() - start_time
+
+    # Record the timing of every evaluation in the experiment directory of its job and summarize
+    evaluations = {evaluation['id']: evaluation for evaluation in evaluations}
+    for job in jobs:
+        job_timings = [dict(timing, id=evaluations[timing['id']]['hpset']['id']) for timing in timings if evaluations[timing['id']]['job'] is job]
+        with open(os.path.join(job['exp_dir'], TIMINGS_FILE), 'w') as f:
+            for timing in job_timings:
+                f.write(json.dumps(timing) + '\n')
+        if job['name'] is not None:
+            print('Input file {}: {} evaluations ({} failed) in {}'.format(job['name'], len(job_timings), sum(1 for timing in job_timings if timing['returncode'] != 0), job['exp_dir']))
+    total_work = sum(timing['end_time'] - timing['dispatch_time'] for timing in timings)
+    nfailed = sum(1 for timing in timings if timing['returncode'] != 0)
+    print('Asynchronous scheduler complete: makespan {:.1f} s, total work {:.1f} s, ideal makespan (total work / workers) {:.1f} s, worker utilization {:.1%}, {} failed evaluations'.format(makespan, total_work, total_work / nworkers, total_work / (nworkers * makespan) if makespan > 0 else 1, nfailed))
+
+
+def main():
+    if (len(sys.argv) > 1) and (sys.argv[1] == '--evaluate'):
+        evaluate(sys.argv[2], json.loads(sys.argv[3]))
+    elif os.getenv('CANDLE_SCHEDULER') == 'async_local':
+        run_controller([])
+    elif (len(sys.argv) > 1) and (sys.argv[1] == '--in-allocation'):
+        run_controller(shlex.split(os.getenv('CANDLE_EVALUATION_LAUNCHER', '')))
+    else:
+        submit_batch_job()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# This script measures how long restart.py takes to gather the status of every evaluation in a synthetic experiments tree.
+# Run like "python $CANDLE/wrappers/commands/submit-job/benchmark_restart.py [<NEVALS> [<NLAUNCHES> [<EXPERIMENTS-DIR>]]]", e.g., "python benchmark_restart.py 100000 4 /lscratch/$SLURM_JOB_ID"
+# Point <EXPERIMENTS-DIR> to the filesystem of interest (e.g., GPFS) to obtain representative timings; by default the tree is built in a temporary directory
+# Assumption: A pandas-containing Python is loaded
+
+# Import relevant modules
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import restart
+
+# Constants
+NLOG_FILLER_LINES = 200  # lines of Keras-like progress output between the RUN START and RUN STOP lines of each model.log
+SUCCESS_EVERY = 5  # every SUCCESS_EVERY-th evaluation is left without a result, as if it had been killed
+
+
+# Define a function that builds an experiments tree of nevals evaluations spread over nlaunches launches
+def make_experiments_tree(exp_dir, nevals, nlaunches):
+    filler = ''.join(['{}/{} [==============================] - 1s 2ms/step - loss: 0.6931\n'.format(iline, NLOG_FILLER_LINES) for iline in range(NLOG_FILLER_LINES)])
+    for ieval in range(nevals):
+        eval_dir = os.path.join(exp_dir, 'X{:03}'.format(ieval % nlaunches), 'run', 'hpset_{:05}'.format(ieval + 1))
+        os.makedirs(eval_dir)
+        with open(os.path.join(eval_dir, 'params.json'), 'w') as f:
+            json.dump({'id': 'hpset_{:05}'.format(ieval + 1), 'epochs': ieval % 50, 'batch_size': 2 ** (ieval % 8), 'activation': 'relu'}, f)
+        with open(os.path.join(eval_dir, 'model.log'), 'w') as f:
+            f.write('2021-05-10 12:00:00 __main__ RUN START\n')
+            f.write(filler)
+            if ieval % SUCCESS_EVERY != 0:
+                f.write('2021-05-10 12:{:02}:{:02} __main__ RUN STOP\n'.format((ieval // 60) % 60, ieval % 60))
+        if ieval % SUCCESS_EVERY != 0:
+            with open(os.path.join(eval_dir, 'result.txt'), 'w') as f:
+                f.write('{}\n'.format(1 / (ieval + 1)))
+
+
+def main():
+
+    # Obtain the tree size and location from the arguments to the script call
+    nevals = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nlaunches = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    parent_dir = sys.argv[3] if len(sys.argv) > 3 else None
+
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir)
+    try:
+
+        # Build the synthetic tree
+        print('Building a synthetic experiments tree of {} evaluations in {}...'.format(nevals, tmp_dir))
+        start_time = time.perf_counter()
+        make_experiments_tree(tmp_dir, nevals, nlaunches)
+        print('  done in {:.1f} s'.format(time.perf_counter() - start_time))
+
+        # Time the scan using a single thread and using the default thread pool
+        for nthreads in (1, restart.SCAN_NTHREADS):
+            start_time = time.perf_counter()
+            df = restart.all_runs_log(tmp_dir, nthreads=nthreads, use_index=False)
+            elapsed_time = time.perf_counter() - start_time
+            nsuccesses = len(restart.get_successful_evaluations(df))
+            print('all_runs_log() with {:2} thread(s): {:.2f} s ({:.0f} evaluations/s; {} evaluations, {} successful)'.format(nthreads, elapsed_time, len(df) / elapsed_time, len(df), nsuccesses))
+
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# This script measures how long "candle submit-job" takes to process an input file (as a dry run) using the original Bash implementation and the single-process Python front end (submit_job.py), and checks that both write identical generated files
+# Run like "python $CANDLE/wrappers/commands/submit-job/benchmark_submit.py [<NHPSETS> [<NREPEATS> [<SUBMISSION-DIR-PARENT>]]]", e.g., "python benchmark_submit.py 10000 5"
+# Run it where jobs are normally submitted (e.g., a login node) to obtain representative timings; by default the submission directory is created in a temporary directory
+# Assumption: The candle module is loaded (so that $CANDLE and $SITE are set)
+
+# Import relevant modules
+import subprocess
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+# Constants
+MODES = (('Bash (CANDLE_LEGACY_SUBMIT=1)', '1'), ('Python (submit_job.py)', '0'))
+MODEL_SCRIPT = 'def initialize_parameters():\n    pass\n\n\ndef run(params):\n    pass\n'
+
+
+# Define a function that writes a grid input file with nhpsets hyperparameter sets to a submission directory
+def write_input_file(submission_dir, nhpsets):
+    with open(os.path.join(submission_dir, 'model.py'), 'w') as f:
+        f.write(MODEL_SCRIPT)
+    with open(os.path.join(submission_dir, 'benchmark.in'), 'w') as f:
+        f.write('# Input file written by benchmark_submit.py\n')
+        f.write('&control\n  model_script="$(pwd)/model.py"\n  workflow="grid"\n  nworkers=2\n  walltime="00:20:00"  # [hours:]minutes[:seconds]\n  dry_run=1\n/\n\n')
+        f.write('&default_model\n  epochs=20\n  batch_size=128\n  activation=\'relu\'\n/\n\n')
+        f.write('&param_space\n')
+        for ihpset in range(nhpsets):
+            f.write('  {{"id": "hpset_{:06}", "epochs": {}, "batch_size": {}}}\n'.format(ihpset + 1, 10 + ihpset % 20, 2 ** (4 + ihpset % 5)))
+        f.write('/\n')
+
+
+# Define a function that returns the contents of all the generated files of a submission directory (except the experiments directory)
+def read_generated_files(submission_dir):
+    generated_files_dir = os.path.join(submission_dir, 'candle_generated_files')
+    contents = {}
+    for dirpath, dirnames, filenames in os.walk(generated_files_dir):
+        dirnames[:] = [dirname for dirname in dirnames if dirname != 'experiments']
+        for filename in filenames:
+            with open(os.path.join(dirpath, filename), 'rb') as f:
+                contents[os.path.relpath(os.path.join(dirpath, filename), generated_files_dir)] = f.read()
+    return contents
+
+
+def main():
+
+    # Obtain the benchmark size and location from the arguments to the script call
+    nhpsets = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    nrepeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    parent_dir = sys.argv[3] if len(sys.argv) > 3 else None
+    candle_script = os.path.join(os.getenv('CANDLE'), 'wrappers', 'bin', 'candle')
+
+    submission_dir = os.path.realpath(tempfile.mkdtemp(dir=parent_dir))
+    try:
+
+        write_input_file(submission_dir, nhpsets)
+        print('Submitting a grid input file with {} hyperparameter sets as a dry run {} times per implementation in {}...'.format(nhpsets, nrepeats, submission_dir))
+
+        # Time the submission using each implementation, saving the generated files of the last submission
+        generated_files = {}
+        for name, legacy_submit in MODES:
+            elapsed_times = []
+            for irepeat in range(nrepeats):
+                shutil.rmtree(os.path.join(submission_dir, 'candle_generated_files'), ignore_errors=True)
+                start_time = time.perf_counter()
+                subprocess.run(['bash', candle_script, 'submit-job', 'benchmark.in'], cwd=submission_dir, env=dict(os.environ, CANDLE_LEGACY_SUBMIT=legacy_submit), stdout=subprocess.DEVNULL, check=True)
+                elapsed_times.append(time.perf_counter() - start_time)
+            generated_files[name] = read_generated_files(submission_dir)
+            print('{:30}: best {:.3f} s, mean {:.3f} s'.format(name, min(elapsed_times), sum(elapsed_times) / len(elapsed_times)))
+
+        # Check that both implementations wrote the same files
+        (name1, files1), (name2, files2) = generated_files.items()
+        differing_files = sorted(filename for filename in set(files1) | set(files2) if files1.get(filename) != files2.get(filename))
+        if differing_files:
+            print('WARNING: The generated files written by the two implementations differ: {}'.format(', '.join(differing_files)))
+        else:
+            print('The two implementations wrote identical generated files: {}'.format(', '.join(sorted(files1))))
+
+    finally:
+        shutil.rmtree(submission_dir)
+
+
+if __name__ == '__main__':
+    main()
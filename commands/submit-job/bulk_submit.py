@@ -0,0 +1,178 @@
+# Bulk submission for "candle submit-job": run the grid jobs of many input files in a single allocation so that they share one queue wait and one scheduler startup
+# Each input file is prepared exactly as submit_job.py prepares a single job, but in its own submission directory candle_generated_files/bulk/<NAME> (where <NAME> is the input file's name without ".in"), so that its generated files, experiments directory, and results stay separate from those of the other input files
+# The allocation is sized by running export_bash_variables() of preprocess.py on the combined keywords, i.e., with the sum of the nworkers of the input files and the longest of their walltimes, so that no job gets fewer workers or less time than it would have had on its own; async_scheduler.py then dispatches the hyperparameter sets of all the jobs longest-first to whichever worker is idle, each in the environment and experiments directory of its own input file
+# Run like "python $CANDLE/wrappers/commands/submit-job/bulk_submit.py <INPUT-FILE-OR-DIR-1> [<INPUT-FILE-OR-DIR-2> ...]" from command_script.sh, which does so when "candle submit-job" is given more than one input file or a directory (whose *.in files are then submitted)
+# ASSUMPTIONS:
+#   (1) candle module has been loaded
+#   (2) the candle program has been called normally (so that the $CANDLE_SUBMISSION_DIR variable has been defined)
+#   (3) Every input file uses the grid workflow, as only independent hyperparameter sets can be pooled
+
+import os
+import sys
+import json
+import glob
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import submit_job
+import keyword_schema
+
+
+BULK_DIRNAME = 'bulk'  # subdirectory of candle_generated_files holding the submission directory of each input file
+MANIFEST_FILE = 'bulk_manifest.json'  # in candle_generated_files, read by async_scheduler.py via $CANDLE_BULK_MANIFEST
+SHARED_KEYWORDS = ('worker_type', 'nthreads', 'mem_per_cpu', 'custom_sbatch_args', 'project', 'queue', 'gpu_packing', 'eval_gpu_memory', 'eval_gpu_utilization', 'gpus_per_node', 'dry_run')  # keywords shaping the allocation, which all the input files must agree on
+ALLOCATION_VARIABLES = ('PROCS', 'PPN', 'NODES', 'PROJECT', 'QUEUE', 'WALLTIME', 'TURBINE_SBATCH_ARGS', 'TURBINE_LAUNCH_OPTIONS', 'CANDLE_NWORKERS', 'CANDLE_EVALUATION_LAUNCHER', 'CANDLE_BIND_GPUS', 'CANDLE_SCHEDULER', 'MODEL_NAME')  # variables set by preprocess.py for the allocation as a whole, which aren't passed on to the evaluations of each job
+
+
+def get_input_files(arguments):
+    """
+    Return the input files to submit from the arguments to the script call, each either an input file or a directory whose *.in files are taken in alphabetical order
+    """
+    input_files = []
+    for argument in arguments:
+        if os.path.isdir(argument):
+            input_files += sorted(glob.glob(os.path.join(argument, '*.in')))
+        else:
+            input_files.append(argument)
+    return input_files
+
+
+def get_job_names(input_files):
+    """
+    Return a unique name for the job of each input file, i.e., its filename without ".in" (suffixed by _2, _3, ... if more than one input file has the same filename)
+    """
+    names = []
+    for input_file in input_files:
+        name = os.path.basename(input_file)
+        if name.endswith('.in'):
+            name = name[:-len('.in')]
+        unique_name, iname = name, 1
+        while unique_name in names:
+            iname += 1
+            unique_name = '{}_{}'.format(name, iname)
+        names.append(unique_name)
+    return names
+
+
+def prepare_jobs(input_files, candle, submission_dir):
+    """
+    Prepare the job of each input file in its own submission directory as submit_job.py does, without running it
+    Arguments:
+        input_files: list
+            Paths to the .in files
+        candle: str
+            Path to the CANDLE installation, i.e., $CANDLE
+        submission_dir: str
+            Path to the submission directory of the bulk submission
+
+    Returns: list
+        One dictionary per input file with the keys name, input_file, submission_dir, keywords (the checked keywords, or None if the job couldn't be prepared), and environment (the variables the job sets)
+    """
+    base_environment = dict(os.environ)
+    jobs = []
+    for name, input_file in zip(get_job_names(input_files), input_files):
+        job_submission_dir = os.path.join(submission_dir, 'candle_generated_files', BULK_DIRNAME, name)
+        job = {'name': name, 'input_file': os.path.realpath(input_file), 'submission_dir': job_submission_dir, 'keywords': None, 'environment': dict()}
+        jobs.append(job)
+        print('\n### Preparing the job of the input file "{}" in {}\n'.format(input_file, job_submission_dir), flush=True)
+
+        # Prepare the job in a clean copy of the environment
+        os.environ.clear()
+        os.environ.update(base_environment)
+        os.environ['CANDLE_SUBMISSION_DIR'] = job_submission_dir
+        os.environ['CANDLE_INPUT_FILE'] = job['input_file']
+        os.makedirs(job_submission_dir, exist_ok=True)
+        try:
+            candle_workflow = submit_job.prepare_submission(input_file, candle, job_submission_dir)
+        except SystemExit:
+            continue
+        except OSError as e:
+            print('ERROR: {}'.format(e))
+            continue
+        if candle_workflow != 'upf':
+            print('ERROR: Only input files using the grid workflow can be submitted in bulk; "{}" uses the {} workflow'.format(input_file, os.getenv('CANDLE_KEYWORD_WORKFLOW')))
+            continue
+
+        # Save the job's checked keywords and the variables it set for its evaluations
+        with open(os.path.join(job_submission_dir, 'candle_generated_files', 'keyword_validation.json')) as f:
+            job['keywords'] = json.load(f)['keywords']
+        job['environment'] = {variable: value for variable, value in os.environ.items() if (base_environment.get(variable) != value) and (variable not in ALLOCATION_VARIABLES)}
+
+    os.environ.clear()
+    os.environ.update(base_environment)
+    return jobs
+
+
+def combine_keywords(jobs, site):
+    """
+    Return the keywords sizing the allocation of all the jobs, i.e., those of the first job but with the sum of the nworkers and the longest walltime of all the jobs, or None if the jobs can't share an allocation
+    """
+    keywords = dict(jobs[0]['keywords'])
+    can_share = True
+    for keyword in SHARED_KEYWORDS:
+        values = {job['name']: job['keywords'][keyword] for job in jobs if keyword in job['keywords']}
+        if len(set(values.values())) > 1:
+            print('ERROR: Input files submitted in bulk must set the "{}" keyword to the same value, but they set it to: {}'.format(keyword, ', '.join('{} ({})'.format(value, name) for name, value in values.items())))
+            can_share = False
+    try:
+        walltimes = [keyword_schema.get_walltime_seconds(job['keywords']['walltime'], site) for job in jobs]
+    except (ValueError, KeyError):
+        print('ERROR: Could not determine the longest walltime of the input files from their "walltime" keywords: {}'.format(', '.join(job['keywords']['walltime'] for job in jobs)))
+        can_share = False
+    if not can_share:
+        return None
+    keywords['nworkers'] = sum(job['keywords']['nworkers'] for job in jobs)
+    keywords['walltime'] = jobs[walltimes.index(max(walltimes))]['keywords']['walltime']
+    keywords['workflow'] = 'grid'
+    keywords['scheduler'] = 'async_local' if all(job['keywords']['scheduler'] == 'async_local' for job in jobs) else 'async'  # Swift/T runs a single model, so the jobs are always run by async_scheduler.py
+    return keywords
+
+
+def main():
+
+    # Obtain the input files from the arguments to the script call
+    input_files = get_input_files(sys.argv[1:])
+    if not input_files:
+        print('ERROR: No input files were found in {}'.format(' '.join(sys.argv[1:])))
+        exit(1)
+    candle = os.getenv('CANDLE')
+    submission_dir = os.getenv('CANDLE_SUBMISSION_DIR')
+    site = os.getenv('SITE')
+
+    # Prepare the job of every input file, quitting if any of them has an error
+    jobs = prepare_jobs(input_files, candle, submission_dir)
+    failed_input_files = [job['input_file'] for job in jobs if job['keywords'] is None]
+    if failed_input_files:
+        print('ERROR: The following input files could not be prepared (see above), so nothing has been submitted: {}'.format(', '.join(failed_input_files)))
+        exit(1)
+
+    # Size the allocation from the combined keywords as preprocess.py does for a single job
+    import preprocess
+    keywords = combine_keywords(jobs, site)
+    if keywords is None:
+        exit(1)
+    print('\n### Sizing the allocation of the {} jobs with {} workers in total and a walltime of {}\n'.format(len(jobs), keywords['nworkers'], keywords['walltime']), flush=True)
+    preprocess.dict_output({job['name']: 'nworkers={}, walltime={}, {}'.format(job['keywords']['nworkers'], job['keywords']['walltime'], job['input_file']) for job in jobs}, 'Jobs submitted in bulk:')
+    preprocess.export_bash_variables(keywords)
+    submit_job.source_exports(submit_job.read_lines(os.path.join(submission_dir, 'candle_generated_files', 'preprocessed_vars_to_export.sh')))
+    submit_job.set_default('MODEL_NAME', 'candle_bulk_job')
+
+    # Write the manifest of the jobs read by async_scheduler.py
+    manifest_file = os.path.join(submission_dir, 'candle_generated_files', MANIFEST_FILE)
+    with open(manifest_file, 'w') as f:
+        json.dump({'members': [{'name': job['name'], 'input_file': job['input_file'], 'submission_dir': job['submission_dir'], 'nworkers': job['keywords']['nworkers'], 'walltime': job['keywords']['walltime'], 'environment': job['environment']} for job in jobs]}, f, indent=2)
+    os.environ['CANDLE_BULK_MANIFEST'] = manifest_file
+
+    # Run the asynchronous scheduler on all the jobs unless a dry run has been requested
+    cmd_to_run = 'python {}/wrappers/commands/submit-job/async_scheduler.py'.format(candle)
+    if os.getenv('CANDLE_DRY_RUN') == '0':
+        print('\nNow running CANDLE using the command:\n')
+        print('  {}\n'.format(cmd_to_run), flush=True)
+        exit(subprocess.call(cmd_to_run.split()))
+    else:
+        print('\nDry run has been requested; command that would otherwise be run next:\n')
+        print('  {}\n'.format(cmd_to_run))
+
+
+if __name__ == '__main__':
+    main()
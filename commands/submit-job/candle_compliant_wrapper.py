@@ -28,8 +28,114 @@ def initialize_parameters(default_model='dummy_file_to_never_be_used.txt'):
     return gParameters
 
 
+# The persistent worker (if requested) of the current Swift/T worker, which lives as long as this module remains imported
+persistent_worker = None
+PERSISTENT_WORKER_START_TIMEOUT = 600  # seconds to wait for the persistent worker to start listening
+
+
+def start_persistent_worker():
+    """
+    Start a long-lived Python process in the model's environment (via model_wrapper.sh --persistent-worker) and connect to it over a Unix socket.
+    """
+
+    # Import relevant libraries
+    import os
+    import time
+    import atexit
+    import tempfile
+    import subprocess
+    from multiprocessing.connection import Client
+
+    global persistent_worker
+
+    # Put the socket on the local filesystem since Unix socket paths are limited to ~100 characters
+    socket_path = os.path.join(tempfile.mkdtemp(prefix='candle_worker_'), 'socket')
+    with open('persistent_worker_out_and_err.txt', 'w') as myfile:
+        process = subprocess.Popen(['bash', os.getenv('CANDLE') + '/wrappers/commands/submit-job/model_wrapper.sh', '--persistent-worker', socket_path], stdout=myfile, stderr=subprocess.STDOUT)
+
+    # Wait for the worker to import the deep learning backend and start listening
+    start_time = time.time()
+    while not os.path.exists(socket_path):
+        if process.poll() is not None or time.time() - start_time > PERSISTENT_WORKER_START_TIMEOUT:
+            process.kill()
+            raise RuntimeError('The persistent worker failed to start; see persistent_worker_out_and_err.txt in {}'.format(os.getcwd()))
+        time.sleep(0.1)
+    conn = Client(socket_path, family='AF_UNIX')
+
+    persistent_worker = {'process': process, 'conn': conn, 'socket_path': socket_path}
+    atexit.register(stop_persistent_worker)
+    print('Started persistent worker with PID {} in {}'.format(process.pid, os.getcwd()))
+
+
+def stop_persistent_worker():
+    """
+    Shut down the persistent worker, if there is one.
+    """
+
+    # Import relevant libraries
+    import os
+    import shutil
+
+    global persistent_worker
+
+    if persistent_worker is not None:
+        try:
+            persistent_worker['conn'].close()
+            persistent_worker['process'].wait(timeout=30)
+        except Exception:
+            persistent_worker['process'].kill()
+        shutil.rmtree(os.path.dirname(persistent_worker['socket_path']), ignore_errors=True)
+        persistent_worker = None
+
+
+def run_in_persistent_worker(check_evaluation, check_interval, resources=None):
+    """
+    Run the model on the hyperparameter set in the current directory's params.json using the persistent worker, (re)starting the worker if necessary, and call check_evaluation() every check_interval seconds while it runs (and start profiling the worker via the resource profiler, if any).
+    """
+
+    # Import relevant libraries
+    import os
+    import json
+
+    global persistent_worker
+
+    if persistent_worker is None or persistent_worker['process'].poll() is not None:
+        stop_persistent_worker()
+        start_persistent_worker()
+
+    print('Starting run of the model in the persistent worker from candle_compliant_wrapper.py...')
+    if resources is not None:
+        resources.start(persistent_worker['process'].pid)
+    try:
+        persistent_worker['conn'].send_bytes(json.dumps({'eval_dir': os.getcwd()}).encode())
+        while not persistent_worker['conn'].poll(check_interval):
+            check_evaluation()
+        response = json.loads(persistent_worker['conn'].recv_bytes().decode())
+    except (EOFError, OSError):  # e.g., the worker was killed by running out of memory; it will be restarted for the next evaluation
+        response = {'status': 'error', 'message': 'The persistent worker died during the evaluation'}
+        stop_persistent_worker()
+    if response['status'] != 'ok':
+        print('WARNING: The model failed in the persistent worker: {}'.format(response['message']))
+    print('Finished run of the model in the persistent worker from candle_compliant_wrapper.py')
+
+
 def run(params):
 
+    # Import relevant libraries
+    import os
+    import sys
+    import json
+    import time
+    import socket
+    import subprocess
+    if os.path.dirname(os.path.realpath(__file__)) not in sys.path:
+        sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+    import experiment_index
+    import result_cache
+    import pruning
+    import gpu_packing
+    import resource_profiler
+
     # Define the dummy history class; defining it here to keep this file aligned with the standard CANDLE-compliance procedure
     class HistoryDummy:
         def __init__(self, mynum):
@@ -40,23 +146,93 @@ def run(params):
 
     # Write the current set of hyperparameters to a JSON file, and also print them to the screen
     print('Params:', params)
-    import json
     with open('params.json', 'w') as outfile:
         json.dump(params, outfile)
 
+    # If requested, return the result of an identical earlier evaluation (same hyperparameters, model script, and default model file) in the experiments directory rather than rerunning the model
+    memoize = os.getenv('CANDLE_MEMOIZE_RESULTS', '0') == '1'
+    if memoize:
+        model_script = os.getenv('CANDLE_KEYWORD_MODEL_SCRIPT')
+        model_digest = result_cache.get_file_digest(model_script)
+        cache_key = result_cache.get_key(params, model_digest)
+        memoized = result_cache.lookup(os.getcwd(), cache_key)
+        if memoized is not None:
+            history_dict, source_eval_dir = memoized
+            print('Returning the memoized result of the identical evaluation in {}'.format(source_eval_dir))
+            with open('candle_value_to_return.json', 'w') as outfile:
+                json.dump(history_dict, outfile)
+            with open(result_cache.MEMOIZED_FROM_FILE, 'w') as outfile:
+                outfile.write(source_eval_dir + '\n')
+            now = time.time()
+            experiment_index.index_evaluation(os.getcwd(), params, history_dict, now, now, socket.gethostname())
+            history = HistoryDummy(4444)
+            history.history = history_dict
+            return(history)
+
+    # Watch the intermediate values the model reports (if any) so that the evaluation can be pruned early according to the pruning keyword
+    monitor = pruning.PruningMonitor(os.getcwd(), os.getenv('CANDLE_PRUNING', 'none'), int(os.getenv('CANDLE_PRUNING_WARMUP_STEPS', '1')))
+
+    # If this is a pilot run outside of a workflow, measure the model's GPU usage so that the gpu_packing keyword can later use it
+    profiler = gpu_packing.GpuProfiler() if os.getenv('CANDLE_RUN_WORKFLOW') == '0' else None
+
+    # If requested, profile the CPU, memory, I/O, and GPU usage of the evaluation, written to resource_profile.json alongside result.txt
+    profile_interval = float(os.getenv('CANDLE_PROFILE_INTERVAL', '0'))
+    resources = resource_profiler.ResourceProfiler(profile_interval) if profile_interval > 0 else None
+
+    # Check on the evaluation while it runs as often as the pruning monitor and the profilers require
+    check_interval = min([pruning.CHECK_INTERVAL] + ([gpu_packing.PROFILE_INTERVAL] if profiler is not None else []) + ([profile_interval] if resources is not None else []))
+
+    def check_evaluation():
+        monitor.check()
+        if profiler is not None:
+            profiler.sample()
+        if resources is not None:
+            resources.sample()
+
     # Run the wrapper script model_wrapper.sh where the environment is defined and the model (whether in Python or R) is called
-    with open('subprocess_out_and_err.txt', 'w') as myfile:
-        import subprocess
-        import os
-        print('Starting run of model_wrapper.sh from candle_compliant_wrapper.py...')
-        subprocess.run(['bash', os.getenv('CANDLE') + '/wrappers/commands/submit-job/model_wrapper.sh'], stdout=myfile, stderr=subprocess.STDOUT)
-        print('Finished run of model_wrapper.sh from candle_compliant_wrapper.py')
+    start_time = time.time()
+    # If requested, Python models are instead run in a persistent worker that keeps the interpreter and deep learning backend loaded between evaluations
+    if (os.getenv('CANDLE_PERSISTENT_WORKER', '0') == '1') and os.getenv('CANDLE_KEYWORD_MODEL_SCRIPT', '').lower().endswith('.py'):
+        run_in_persistent_worker(check_evaluation, check_interval, resources)
+    else:
+        with open('subprocess_out_and_err.txt', 'w') as myfile:
+            print('Starting run of model_wrapper.sh from candle_compliant_wrapper.py...')
+            process = subprocess.Popen(['bash', os.getenv('CANDLE') + '/wrappers/commands/submit-job/model_wrapper.sh'], stdout=myfile, stderr=subprocess.STDOUT, env=dict(os.environ, **{pruning.EVAL_DIR_ENV: os.getcwd()}))
+            if resources is not None:
+                resources.start(process.pid)
+            while True:
+                try:
+                    process.wait(timeout=check_interval)
+                    break
+                except subprocess.TimeoutExpired:
+                    check_evaluation()
+            print('Finished run of model_wrapper.sh from candle_compliant_wrapper.py')
+    stop_time = time.time()
+    monitor.update()
+    if profiler is not None:
+        profiler.save()
+    if resources is not None:
+        resources.save()
 
     # Read in the history.history dictionary containing the result from the JSON file created by the model
     history = HistoryDummy(4444)
-    import json
-    with open('candle_value_to_return.json') as infile:
-        history.history = json.load(infile)
+    history_dict = None
+    try:
+        # A pruned model ends without writing a result, so return the best value it reported
+        if monitor.pruned and not os.path.exists('candle_value_to_return.json') and (monitor.get_best_value() is not None):
+            best_value = monitor.get_best_value()
+            print('Returning the best value reported by the pruned evaluation: {}'.format(best_value))
+            with open('candle_value_to_return.json', 'w') as outfile:
+                json.dump({'val_loss': [best_value], 'val_corr': [best_value], 'val_dice_coef': [best_value]}, outfile)
+        with open('candle_value_to_return.json') as infile:
+            history_dict = json.load(infile)
+        history.history = history_dict
+        # Memoize complete (i.e., unpruned) results for later evaluations of the same hyperparameter set
+        if memoize and not monitor.pruned and (experiment_index.get_objective(history_dict) is not None):
+            result_cache.store(os.getcwd(), cache_key, model_script, model_digest, history_dict)
+    finally:
+        # Record the evaluation (successful or not) in the index of the experiments directory so that restart and aggregation needn't crawl the whole experiments tree
+        experiment_index.index_evaluation(os.getcwd(), params, history_dict, start_time, stop_time, socket.gethostname(), monitor.values)
     return(history)
 
 
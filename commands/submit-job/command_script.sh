@@ -1,7 +1,9 @@
 #!/bin/bash
 
 # If a job is requested to be submitted, do so
-# Note that this script basically echos "bash run_workflows.sh" into a script and then runs that script, i.e., this script calls run_workflows.sh
+# If more than one input file or a directory of them is given, they are all submitted in a single allocation by bulk_submit.py
+# By default this is all done in a single Python process by submit_job.py; setting $CANDLE_LEGACY_SUBMIT to 1 instead runs the original Bash implementation below, which writes the same generated files
+# Note that the Bash implementation basically echos "bash run_workflows.sh" into a script and then runs that script, i.e., this script calls run_workflows.sh
 # ASSUMPTIONS:
 #   (1) candle module has been loaded
 #   (2) the candle program has been called normally (so that the $CANDLE_SUBMISSION_DIR variable has been defined)
@@ -58,7 +60,7 @@ function generate_input_files_and_run() {
 
         # Define the parameter space filename and export it inside the submission script
         workflow=$(grep "^export CANDLE_KEYWORD_WORKFLOW=" "$fn_submission_script" | awk -v FS="=" '{gsub(/"/,""); print tolower($2)}')
-        if [ "a$workflow" == "agrid" ]; then
+        if [ "a$workflow" == "agrid" ] || [ "a$workflow" == "ahyperband" ]; then
             wsf_ext="txt"
         else
             wsf_ext="R"
@@ -70,7 +72,7 @@ function generate_input_files_and_run() {
         extract_section "param_space" "$input_file" > tmp.txt
         nlines=$(wc -l tmp.txt | awk '{print $1}')
         (
-            if [ "a$workflow" == "agrid" ]; then
+            if [ "a$workflow" == "agrid" ] || [ "a$workflow" == "ahyperband" ]; then
                 cat tmp.txt
             else
                 echo "param.set <- makeParamSet("
@@ -93,7 +95,43 @@ function generate_input_files_and_run() {
 }
 
 
-# The .in file should be the argument to this script
+# Generate the three input files, preprocess the keywords, and run the workflow in a single Python process
+function generate_input_files_and_run_in_python() {
+
+    # Load the Python with which Swift/T was built, as run_workflows.sh does (this also sources site-specific_settings.sh)
+    # shellcheck source=/dev/null
+    source "$CANDLE/wrappers/utilities.sh"; load_python_env --set-pythonhome
+
+    # Pass on the site settings that site-specific_settings.sh doesn't export
+    CANDLE_SETUP_JOB_LAUNCHER="$CANDLE_SETUP_JOB_LAUNCHER" CANDLE_SETUP_SINGLE_TASK_LAUNCHER_OPTIONS="$CANDLE_SETUP_SINGLE_TASK_LAUNCHER_OPTIONS" python "$CANDLE/wrappers/commands/submit-job/submit_job.py" "$1"
+
+}
+
+
+# Submit the grid jobs of several input files (or of all the input files in a directory) in a single allocation
+function submit_in_bulk() {
+
+    # Load the Python with which Swift/T was built, as run_workflows.sh does (this also sources site-specific_settings.sh)
+    # shellcheck source=/dev/null
+    source "$CANDLE/wrappers/utilities.sh"; load_python_env --set-pythonhome
+
+    python "$CANDLE/wrappers/commands/submit-job/bulk_submit.py" "$@"
+
+}
+
+
+# Submit in bulk if more than one input file or a directory is given
+if [ $# -gt 1 ] || [ -d "$1" ]; then
+    echo "Submitting the CANDLE input files \"$*\" in bulk... "
+    if [ "${CANDLE_LEGACY_SUBMIT:-0}" -eq 1 ]; then
+        echo "Error: Bulk submission is only supported by the Python front end (unset \$CANDLE_LEGACY_SUBMIT)"
+        exit 1
+    fi
+    submit_in_bulk "$@" && echo "Input files submitted successfully" || echo "Input files submission failed"
+    exit 0
+fi
+
+# Otherwise the .in file should be the argument to this script
 input_file=$1
 
 # This is not actually used in the wrappers but is useful to reference in Supervisor (see e.g. workflows/common/sh/utils.sh)
@@ -101,4 +139,8 @@ export CANDLE_INPUT_FILE=$(readlink -e "$input_file")
 
 # Generate the three input files from this single input file and then execute the generated submission script
 echo "Submitting the CANDLE input file \"$input_file\"... "
-generate_input_files_and_run "$input_file" && echo "Input file submitted successfully" || echo "Input file submission failed"
+if [ "${CANDLE_LEGACY_SUBMIT:-0}" -eq 1 ]; then
+    generate_input_files_and_run "$input_file" && echo "Input file submitted successfully" || echo "Input file submission failed"
+else
+    generate_input_files_and_run_in_python "$input_file" && echo "Input file submitted successfully" || echo "Input file submission failed"
+fi
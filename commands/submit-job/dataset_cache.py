@@ -0,0 +1,101 @@
+# Cache of datasets converted to NumPy arrays, shared by all evaluations (and all workers on a node) of a job; each dataset is parsed once and every later load is a zero-copy memory map of the cached .npy file
+# Made available to Python model scripts by head.py as candle_load_csv() and candle_cached_array()
+# ASSUMPTIONS:
+#   (1) candle is run the normal way via "candle submit-job ...", which defines the variable $CANDLE_SUBMISSION_DIR
+#   (2) $CANDLE_DATASET_CACHE_DIR is set by site-specific_settings.sh to a node-local directory if the site has one (e.g., /lscratch/$SLURM_JOB_ID/candle_dataset_cache on Biowulf)
+
+import os
+import hashlib
+import tempfile
+
+
+CACHE_DIR_ENV = 'CANDLE_DATASET_CACHE_DIR'
+FALLBACK_CACHE_DIRNAME = 'dataset_cache'  # subdirectory of candle_generated_files used if the node-local directory isn't available
+HASH_NCHARS = 16  # number of characters of the SHA-256 hash of the cache key to use in the cached filenames
+
+
+def get_cache_dir():
+    """
+    Return the directory in which cached arrays are stored, i.e., $CANDLE_DATASET_CACHE_DIR if its parent directory exists (e.g., the job's /lscratch directory was requested) and candle_generated_files/dataset_cache otherwise
+    """
+    cache_dir = os.getenv(CACHE_DIR_ENV, '')
+    if cache_dir and os.path.isdir(os.path.dirname(os.path.abspath(cache_dir))):
+        return cache_dir
+    return os.path.join(os.getenv('CANDLE_SUBMISSION_DIR', '.'), 'candle_generated_files', FALLBACK_CACHE_DIRNAME)
+
+
+def get_cache_key(*parts):
+    """
+    Return a short hash identifying a cached array from the string representations of the parts that determine it
+    """
+    return hashlib.sha256('\0'.join(str(part) for part in parts).encode()).hexdigest()[:HASH_NCHARS]
+
+
+def cached_array(name, compute, cache_dir=None):
+    """
+    Return a read-only memory map of the array cached under a name, computing and caching the array first if no evaluation has done so yet
+    Concurrent callers on the same cache directory wait on a lock while the first one computes the array, so each array is computed only once
+    Arguments:
+        name: str
+            Name of the cached array, which should change whenever its contents would (e.g., include get_cache_key() of the input files and settings)
+        compute: function
+            Function taking no arguments and returning the array (or anything numpy.asarray() accepts)
+        cache_dir: str
+            Directory of the cache; defaults to get_cache_dir()
+
+    Returns: numpy.memmap
+        The cached array, mapped read-only
+    """
+
+    # Import relevant libraries
+    import fcntl
+    import numpy as np
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    cached_file = os.path.join(cache_dir, name + '.npy')
+
+    # Only compute the array if it isn't already cached, holding a lock so that other evaluations wait rather than compute it too
+    if not os.path.exists(cached_file):
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cached_file + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if not os.path.exists(cached_file):
+                print('Caching dataset array {} in {}...'.format(name, cache_dir), flush=True)
+                array = np.asarray(compute())
+                fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix='.npy')
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, array)
+                os.chmod(tmp_file, 0o644)
+                os.replace(tmp_file, cached_file)
+
+    return np.load(cached_file, mmap_mode='r')
+
+
+def load_csv(path, dtype='float32', **read_csv_kwargs):
+    """
+    Return the contents of a CSV file as a read-only memory-mapped array, parsing the file via pandas.read_csv() only the first time it is loaded in the job
+    Arguments:
+        path: str
+            Path to the CSV file
+        dtype: str
+            Data type of the returned array
+        read_csv_kwargs
+            Keyword arguments to pandas.read_csv() (header=None by default)
+
+    Returns: numpy.memmap
+        Array equal to pandas.read_csv(path, **read_csv_kwargs).values.astype(dtype)
+    """
+
+    read_csv_kwargs.setdefault('header', None)
+
+    # Key the cached array on the file's identity and modification time and on the parsing settings so that a changed file or setting is never served stale
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    name = '{}-{}'.format(os.path.basename(path), get_cache_key(path, stat.st_size, stat.st_mtime_ns, dtype, sorted(read_csv_kwargs.items())))
+
+    def compute():
+        import pandas as pd
+        return pd.read_csv(path, **read_csv_kwargs).values.astype(dtype)
+
+    return cached_array(name, compute)
@@ -0,0 +1,253 @@
+import os
+import json
+import sqlite3
+
+
+index_filename = "candle_index.sqlite"
+run_dirname = "run"
+obj_return = "OBJ_RETURN"
+default_obj_return = "val_loss"
+DB_TIMEOUT = 120  # seconds to wait for another worker's write lock before giving up
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS evaluations (
+    launch TEXT NOT NULL,
+    eval_id TEXT NOT NULL,
+    eval_dir TEXT,
+    params TEXT,
+    objective REAL,
+    start_time REAL,
+    stop_time REAL,
+    host TEXT,
+    PRIMARY KEY (launch, eval_id)
+);
+CREATE INDEX IF NOT EXISTS evaluations_objective ON evaluations (objective);
+CREATE TABLE IF NOT EXISTS intermediate_values (
+    launch TEXT NOT NULL,
+    eval_id TEXT NOT NULL,
+    step REAL NOT NULL,
+    value REAL,
+    PRIMARY KEY (launch, eval_id, step)
+);
+CREATE TABLE IF NOT EXISTS result_cache (
+    key TEXT PRIMARY KEY,
+    model_script TEXT NOT NULL,
+    model_digest TEXT NOT NULL,
+    history TEXT NOT NULL,
+    eval_dir TEXT,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS result_cache_model_script ON result_cache (model_script);
+"""
+
+
+def connect(index_file):
+    """
+    Open (creating it if necessary) the index of an experiments directory
+    Arguments:
+        index_file: str
+            Path to the SQLite index file
+
+    Returns: sqlite3.Connection
+    """
+
+    # The default rollback journal is used rather than WAL since WAL does not work on network filesystems
+    conn = sqlite3.connect(index_file, timeout=DB_TIMEOUT)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def locate_evaluation(eval_dir):
+    """
+    Determine where an evaluation directory sits in the experiments tree
+    Arguments:
+        eval_dir: str
+            Path to an evaluation directory, nominally <EXPERIMENTS>/<launch>/run/<evaluation>
+
+    Returns: tuple
+        (index_file, launch, evaluation) or None if eval_dir is not in an experiments tree
+    """
+
+    eval_dir = os.path.realpath(eval_dir)
+    run_dir = os.path.dirname(eval_dir)
+    if os.path.basename(run_dir) != run_dirname:
+        return None
+    launch_dir = os.path.dirname(run_dir)
+    index_file = os.path.join(os.path.dirname(launch_dir), index_filename)
+    return index_file, os.path.basename(launch_dir), os.path.basename(eval_dir)
+
+
+def get_objective(history):
+    """
+    Extract the objective the workflow optimizes from a history.history dictionary
+    Arguments:
+        history: dict
+            The history.history dictionary returned by the model
+
+    Returns: float
+        The last value of the $OBJ_RETURN metric, or None if there isn't one
+    """
+
+    try:
+        objective = float(history[os.getenv(obj_return, default_obj_return)][-1])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    if objective != objective:  # NaN
+        return None
+    return objective
+
+
+def upsert_evaluation(index_file, launch, eval_id, eval_dir, params, objective, start_time, stop_time, host, intermediate_values=None):
+    """
+    Insert or update the record of a finished evaluation
+    Arguments:
+        index_file: str
+            Path to the SQLite index file
+        launch: str
+            Name of the launch (experiment) directory, e.g., X000
+        eval_id: str
+            Hyperparameter set ID (the "id" hyperparameter for grid jobs, otherwise the evaluation directory name)
+        eval_dir: str
+            Path to the evaluation directory
+        params: dict
+            The hyperparameters of the evaluation
+        objective: float
+            The objective value, or None if the evaluation did not produce one
+        start_time, stop_time: float
+            Seconds since the epoch at which the model started and stopped
+        host: str
+            Name of the host on which the model ran
+        intermediate_values: list
+            (step, value) tuples reported by the model while it ran (see pruning.py), if any
+    """
+
+    conn = connect(index_file)
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO evaluations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (launch, eval_id, eval_dir, json.dumps(params, default=str), objective, start_time, stop_time, host))
+            conn.execute("DELETE FROM intermediate_values WHERE launch = ? AND eval_id = ?", (launch, eval_id))
+            if intermediate_values:
+                conn.executemany("INSERT OR REPLACE INTO intermediate_values VALUES (?, ?, ?, ?)",
+                                 ((launch, eval_id, step, value) for step, value in intermediate_values))
+    finally:
+        conn.close()
+
+
+def index_evaluation(eval_dir, params, history, start_time, stop_time, host, intermediate_values=None):
+    """
+    Record a finished evaluation in the index of the experiments directory containing it
+    Errors are reported but never raised, as the index is only an accelerator for restart and aggregation
+    Arguments:
+        eval_dir: str
+            Path to the evaluation directory
+        params: dict
+            The hyperparameters of the evaluation
+        history: dict
+            The history.history dictionary returned by the model, or None if there isn't one
+        start_time, stop_time: float
+            Seconds since the epoch at which the model started and stopped
+        host: str
+            Name of the host on which the model ran
+        intermediate_values: list
+            (step, value) tuples reported by the model while it ran, if any
+
+    Returns: bool
+        Whether the evaluation was indexed
+    """
+
+    location = locate_evaluation(eval_dir)
+    if location is None:
+        return False
+    index_file, launch, evaluation = location
+    objective = None if history is None else get_objective(history)
+    try:
+        upsert_evaluation(index_file, launch, str(params.get('id', evaluation)), eval_dir, params, objective, start_time, stop_time, host, intermediate_values)
+    except sqlite3.Error as e:
+        print('WARNING: Evaluation could not be recorded in the index {}: {}'.format(index_file, e))
+        return False
+    return True
+
+
+def query_evaluations(experiments_dir, launch=None, successful_only=False):
+    """
+    Return the records of the evaluations in the index
+    Arguments:
+        experiments_dir: str
+            Path to the experiments directory
+        launch: str
+            If set, return only the evaluations of this launch
+        successful_only: bool
+            If set, return only the evaluations with an objective value
+
+    Returns: list
+        One dictionary per evaluation with the keys launch, eval_id, eval_dir, params (a dictionary), objective, start_time, stop_time, and host, ordered by objective
+    """
+
+    index_file = os.path.join(experiments_dir, index_filename)
+    if not os.path.exists(index_file):
+        return []
+    query = "SELECT launch, eval_id, eval_dir, params, objective, start_time, stop_time, host FROM evaluations"
+    conditions, args = [], []
+    if launch is not None:
+        conditions.append("launch = ?")
+        args.append(launch)
+    if successful_only:
+        conditions.append("objective IS NOT NULL")
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY objective"
+    conn = connect(index_file)
+    try:
+        records = []
+        for row in conn.execute(query, args):
+            record = dict(zip(("launch", "eval_id", "eval_dir", "params", "objective", "start_time", "stop_time", "host"), row))
+            record["params"] = json.loads(record["params"])
+            records.append(record)
+        return records
+    finally:
+        conn.close()
+
+
+def get_records_by_location(experiments_dir, launch=None):
+    """
+    Return the records of the evaluations in the index keyed by where their directories sit in the experiments tree, so that they can be matched with the evaluation directories found by listing it (which may be reached via a different path than when they were indexed)
+    Arguments:
+        experiments_dir: str
+            Path to the experiments directory
+        launch: str
+            If set, return only the evaluations of this launch
+
+    Returns: dict
+        The record (as returned by query_evaluations()) of each indexed evaluation by (launch, name of the evaluation directory)
+    """
+
+    return {(record["launch"], os.path.basename(record["eval_dir"])): record for record in query_evaluations(experiments_dir, launch=launch)}
+
+
+def query_intermediate_values(experiments_dir, launch, exclude_eval_dir=None):
+    """
+    Return the intermediate values reported by the indexed evaluations of a launch
+    Arguments:
+        experiments_dir: str
+            Path to the experiments directory
+        launch: str
+            Name of the launch (experiment) directory, e.g., X000
+        exclude_eval_dir: str
+            If set, leave out the evaluation in this directory
+
+    Returns: dict
+        List of (step, value) tuples, ordered by step, for each evaluation ID that reported intermediate values
+    """
+
+    index_file = os.path.join(experiments_dir, index_filename)
+    if not os.path.exists(index_file):
+        return {}
+    conn = connect(index_file)
+    try:
+        values = {}
+        for eval_id, step, value in conn.execute("SELECT i.eval_id, i.step, i.value FROM intermediate_values i JOIN evaluations e ON i.launch = e.launch AND i.eval_id = e.eval_id "
+                                                 "WHERE i.launch = ? AND e.eval_dir IS NOT ? ORDER BY i.eval_id, i.step", (launch, exclude_eval_dir)):
+            values.setdefault(eval_id, []).append((step, value))
+        return values
+    finally:
+        conn.close()
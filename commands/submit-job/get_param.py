@@ -1,8 +1,9 @@
 # ASSUMPTIONS: None
 
-import json, sys, argparse, os
+import json, sys, argparse, os, re, shlex
 
 candle_hyperparam_env = "candle_params"
+candle_export_prefix = "CANDLE_PARAM_"
 
 def candle_get_param(name, param_file):
     """
@@ -27,12 +28,37 @@ def candle_get_param(name, param_file):
             raise Exception('ERROR: The file "{0}" does not contain the hyperparameter:"{1}"'.format(param_file, name))  
 
 
+def candle_export_params(param_file):
+    """
+        Return Bash statements exporting every CANDLE hyperparameter as a shell variable, so that params.json is read once per evaluation rather than once per hyperparameter
+        Argument:
+            param_file: filename
+                The CANDLE hyperparameter file
+
+        Returns string
+            One "export CANDLE_PARAM_<NAME>=<VALUE>" line per hyperparameter, to be eval'ed; each value is formatted as candle_get_param() prints it, and hyperparameters whose names can't be part of a shell variable name are skipped
+    """
+    param_file = os.path.abspath(param_file)
+    if not os.path.exists(param_file):
+        raise Exception("ERROR: The hyperparameter file {0} does not exist".format(param_file))
+    with open(param_file) as infile:
+        hyperparams = json.load(infile)
+    lines = []
+    for name, value in hyperparams.items():
+        if re.fullmatch('[A-Za-z0-9_]+', name):
+            lines.append('export {0}{1}={2}'.format(candle_export_prefix, name, shlex.quote(str(value))))
+    return '\n'.join(lines)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Return CANDLE hyperparameter value')
-    parser.add_argument('hyperparameter', help='The name of the hyperparameter to be returned')
+    parser.add_argument('hyperparameter', nargs='?', help='The name of the hyperparameter to be returned')
     parser.add_argument('--param_file', help='CANDLE hyperparameter file')
+    parser.add_argument('--export', action='store_true', help='Instead of a single value, output Bash statements exporting all the hyperparameters as {0}<NAME> variables'.format(candle_export_prefix))
 
     args = parser.parse_args()
+    if (args.hyperparameter is None) != args.export:
+        parser.error('exactly one of a hyperparameter name or --export must be given')
     if args.param_file == None:
         if os.getenv(candle_hyperparam_env) == None:
             raise Exception('ERROR: The environment variable "{0}" is not defined'.format(candle_hyperparam_env))
@@ -41,4 +67,7 @@ if __name__ == '__main__':
     else:
 
         param_file = args.param_file
-    print(candle_get_param(args.hyperparameter, param_file)) 
+    if args.export:
+        print(candle_export_params(param_file))
+    else:
+        print(candle_get_param(args.hyperparameter, param_file)) 
@@ -0,0 +1,148 @@
+# Packing of several concurrent evaluations onto each GPU for models that use only a fraction of one
+# preprocess.py uses get_evals_per_gpu() to size the allocation from the per-evaluation GPU memory and utilization, either declared via the eval_gpu_memory and eval_gpu_utilization keywords or measured by a pilot run (gpu_packing=profile)
+# The pilot run is a normal run with run_workflow=0, during which candle_compliant_wrapper.py samples the GPU via GpuProfiler and writes the measurements to candle_generated_files/gpu_profile.json
+# ASSUMPTIONS: candle is run the normal way via "candle submit-job ...", which defines the variable $CANDLE_SUBMISSION_DIR
+
+import os
+import json
+import math
+import subprocess
+
+
+GPU_MEMORY_GB = {'k20x': 6, 'k80': 12, 'p100': 16, 'v100': 16, 'v100x': 32}  # memory of a single GPU of each Biowulf worker type (the Summit GPUs are 16 GB V100s)
+SUMMIT_GPU_MEMORY_GB = 16
+GPUS_PER_NODE = {'k20x': 2, 'k80': 4, 'p100': 4, 'v100': 4, 'v100x': 4}  # number of GPUs on a Biowulf node of each worker type
+MEMORY_HEADROOM = 0.9  # fraction of a GPU's memory that the packed evaluations may use together
+MAX_EVALS_PER_GPU = 8
+PROFILE_FILE = 'gpu_profile.json'  # in candle_generated_files
+PROFILE_INTERVAL = 2  # seconds between samples of the GPU during a pilot run
+
+
+def get_profile_file():
+    """
+    Return the path to the file holding the measurements of the pilot run
+    """
+    return os.path.join(os.getenv('CANDLE_SUBMISSION_DIR', '.'), 'candle_generated_files', PROFILE_FILE)
+
+
+def get_evals_per_gpu(eval_memory_gb, eval_utilization, gpu_memory_gb):
+    """
+    Return the number of evaluations to run concurrently on each GPU such that neither its memory nor its compute is oversubscribed
+    Arguments:
+        eval_memory_gb: float
+            Peak GPU memory used by one evaluation in GB (0 if unknown, in which case only the utilization limits the packing)
+        eval_utilization: float
+            Fraction (between 0 and 1) of the GPU's compute used by one evaluation
+        gpu_memory_gb: float
+            Memory of the GPU in GB
+
+    Returns: int
+        The number of evaluations per GPU, at least 1 and at most MAX_EVALS_PER_GPU
+    """
+    evals_per_gpu = MAX_EVALS_PER_GPU
+    if eval_memory_gb > 0:
+        evals_per_gpu = min(evals_per_gpu, int(MEMORY_HEADROOM * gpu_memory_gb / eval_memory_gb))
+    if eval_utilization > 0:
+        evals_per_gpu = min(evals_per_gpu, int(math.floor(1 / eval_utilization + 1e-9)))
+    return max(1, evals_per_gpu)
+
+
+def read_profile(filename=None):
+    """
+    Return the (eval_memory_gb, eval_utilization) measured by the pilot run, or None if there is no pilot run to read
+    """
+    if filename is None:
+        filename = get_profile_file()
+    try:
+        with open(filename) as f:
+            profile = json.load(f)
+        return profile['gpu_memory_gb'], profile['gpu_utilization']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def get_bound_gpus():
+    """
+    Return the GPU(s) to which the current worker is bound (a value of $CUDA_VISIBLE_DEVICES), or None if no GPUs are set
+    If several workers share the GPUs of a Biowulf node ($CANDLE_BIND_GPUS=1, see preprocess.py), a worker is bound to one of them according to its index on the node, i.e., its task index $SLURM_LOCALID when run by Swift/T (as in model_wrapper.sh) or its slot $CANDLE_WORKER_SLOT when run by async_scheduler.py, whose slots are spread round-robin over the nodes
+    """
+    devices = os.getenv('CUDA_VISIBLE_DEVICES')
+    if (os.getenv('CANDLE_BIND_GPUS') != '1') or not devices:
+        return devices or None
+    if os.getenv('CANDLE_WORKER_SLOT'):
+        index = int(os.getenv('CANDLE_WORKER_SLOT')) // int(os.getenv('SLURM_JOB_NUM_NODES', '1'))
+    elif os.getenv('SLURM_LOCALID'):
+        index = int(os.getenv('SLURM_LOCALID'))
+    else:
+        return devices
+    node_gpus = devices.split(',')
+    return node_gpus[index % len(node_gpus)]
+
+
+def query_gpus():
+    """
+    Return the current (memory used in MiB, utilization in percent) of the GPU(s) of the current worker, summed over them, via nvidia-smi, or None if there are none (or nvidia-smi isn't available)
+    The GPUs are those the worker is bound to (see get_bound_gpus()) rather than all those visible to this process, since candle_compliant_wrapper.py samples them before model_wrapper.sh binds the model to its GPU, and the other GPUs of the node are used by the other workers
+    """
+    cmd = ['nvidia-smi', '--query-gpu=memory.used,utilization.gpu', '--format=csv,noheader,nounits']
+    gpus = get_bound_gpus()
+    if gpus is not None:
+        cmd += ['--id={}'.format(gpus)]
+    try:
+        output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, timeout=10).stdout
+        rows = [[float(x) for x in line.split(',')] for line in output.splitlines() if line.strip()]
+    except (OSError, ValueError, subprocess.TimeoutExpired):  # e.g., no GPU on this node
+        return None
+    if not rows:
+        return None
+    return sum(row[0] for row in rows), sum(row[1] for row in rows)
+
+
+def query_gpu_processes(pids):
+    """
+    Return the GPU memory (in MiB) used by some processes (e.g., those of an evaluation), summed over them, via nvidia-smi, or None if none of them use a GPU (or nvidia-smi isn't available)
+    Unlike the memory of the whole GPU, this excludes that of the other evaluations packed onto the same GPU
+    """
+    cmd = ['nvidia-smi', '--query-compute-apps=pid,used_memory', '--format=csv,noheader,nounits']
+    try:
+        output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True, timeout=10).stdout
+        rows = [[float(x) for x in line.split(',')] for line in output.splitlines() if line.strip()]
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+    pids = set(pids)
+    rows = [row for row in rows if int(row[0]) in pids]
+    if not rows:
+        return None
+    return sum(row[1] for row in rows)
+
+
+class GpuProfiler:
+    """
+    Sample the memory and utilization of the GPU(s) of an evaluation via nvidia-smi
+    """
+
+    def __init__(self):
+        self.peak_memory_mib = 0
+        self.utilizations = []
+
+    def sample(self):
+        """
+        Record the current memory usage and utilization of the evaluation's GPUs (summed over them)
+        """
+        usage = query_gpus()
+        if usage is not None:
+            self.peak_memory_mib = max(self.peak_memory_mib, usage[0])
+            self.utilizations.append(usage[1])
+
+    def save(self, filename=None):
+        """
+        Write the peak memory (GB) and mean utilization (fraction) sampled so far, if any
+        """
+        if not self.utilizations:
+            return
+        if filename is None:
+            filename = get_profile_file()
+        profile = {'gpu_memory_gb': self.peak_memory_mib / 1024, 'gpu_utilization': min(1.0, sum(self.utilizations) / len(self.utilizations) / 100), 'nsamples': len(self.utilizations)}
+        with open(filename, 'w') as f:
+            json.dump(profile, f, indent=2)
+        print('Wrote the GPU usage measured during this pilot run to {}: {}'.format(filename, profile))
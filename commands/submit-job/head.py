@@ -9,7 +9,17 @@ import sys, os, json
 supp_pythonpath = os.getenv('CANDLE_SUPP_PYTHONPATH')
 if supp_pythonpath is not None:
     for mystr in supp_pythonpath.split(':'):
-        sys.path.append(mystr)
+        if mystr not in sys.path:  # this snippet is rerun for every evaluation in a persistent worker
+            sys.path.append(mystr)
+
+# Make the dataset cache available to the model script, e.g., "X = candle_load_csv(train_file)" parses the CSV file only once per job (per node) and otherwise memory-maps the cached array
+candle_submit_job_dir = os.path.join(os.getenv('CANDLE'), 'wrappers', 'commands', 'submit-job')
+if candle_submit_job_dir not in sys.path:
+    sys.path.append(candle_submit_job_dir)
+from dataset_cache import load_csv as candle_load_csv, cached_array as candle_cached_array, get_cache_key as candle_get_cache_key
+
+# Allow the model script to report intermediate values of the objective, e.g., "candle_report(epoch, val_loss)" or "model.fit(..., callbacks=[candle_pruning_callback()])", so that the evaluation can be pruned early according to the pruning keyword
+from pruning import report as candle_report, keras_callback as candle_pruning_callback
 
 # Load the hyperparameter dictionary stored in the JSON file params.json
 with open('params.json') as infile:
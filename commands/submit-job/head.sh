@@ -6,12 +6,34 @@
 
 #script_dir="$( cd "$( dirname "${BASH_SOURCE[0]}" )" >/dev/null 2>&1 && pwd )"
 
+# Return the value of a hyperparameter, looking it up in the CANDLE_PARAM_<NAME> variables and only falling back to running get_param.py (e.g., for --param_file or a name that can't be part of a variable name)
+# The variables are loaded on the first call rather than when this file is sourced, so that model scripts that never call this function don't pay for a Python process; as calls made via $(...) run in a subshell, a script making many of them can call candle_load_params first so that they all reuse the variables
 function candle_get_param {
+    local param_var="CANDLE_PARAM_$1"
+    if [ $# -eq 1 ] && [[ "$1" =~ ^[A-Za-z0-9_]+$ ]]; then
+        candle_load_params
+        if [ -n "${!param_var+x}" ]; then
+            echo "${!param_var}"
+            return
+        fi
+    fi
     #python ${script_dir}/get_param.py "$@"
     python "$CANDLE/wrappers/commands/submit-job/get_param.py" "$@"
 }
 
+# Load all the hyperparameters at once into CANDLE_PARAM_<NAME> variables (e.g., $CANDLE_PARAM_batch_size) unless they've already been loaded in this shell, so that params.json is read by a single Python process rather than one per candle_get_param call
+function candle_load_params {
+    if [ -z "$candle_params_loaded" ]; then
+        eval "$(python "$CANDLE/wrappers/commands/submit-job/get_param.py" --export)"
+        candle_params_loaded=1
+    fi
+}
+
 
 #GZ, not sure you want to append PATH, or PYTHONPATH
 #export PATH=$PATH:$SUPP_PYTHONPATH # ALW: removing this as it's for Python scripts only
 export candle_params=$(readlink -f params.json)
+
+# Forget any hyperparameters loaded for a previous evaluation (e.g., by the persistent worker's shell)
+# shellcheck disable=SC2046
+unset $(compgen -v CANDLE_PARAM_) candle_params_loaded
@@ -0,0 +1,299 @@
+# Hyperband workflow: run brackets of successive halving as repeated rounds of the UPF (grid) workflow
+# Each round evaluates the configurations still alive in every bracket with the budget (e.g., number of epochs) of their current rung, after which the top 1/eta of each bracket are promoted to the next rung with eta times the budget
+# Run like "python $CANDLE/wrappers/commands/submit-job/hyperband.py" from run_workflows.sh, which is done when the workflow keyword is set to "hyperband"
+# ASSUMPTIONS:
+#   (1) candle is run the normal way via "candle submit-job ...", which defines the variables $SITE, $CANDLE, $CANDLE_SUBMISSION_DIR, $EXPERIMENTS, $WALLTIME, $CANDLE_WORKFLOW_SETTINGS_FILE, and $CANDLE_HYPERBAND_{MAX_BUDGET,ETA,BUDGET_PARAM}
+#   (2) The parameter space file contains one JSON hyperparameter set per line (as for the grid workflow, e.g., generated by "candle generate-grid --sample=..."), from which the configurations of the brackets are drawn
+#   (3) If Supervisor's workflow.sh submits a batch job, Turbine prints its ID (as "JOB_ID=<ID>") and writes it to jobid.txt in the new experiment directory; each round waits for that job to leave the queue before reading its results
+
+import os
+import re
+import sys
+import glob
+import json
+import math
+import time
+import random
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import experiment_index
+import keyword_schema
+
+
+ROUND_BASENAME = 'hyperband_round'  # basename of the UPF file written to candle_generated_files for each round
+MANIFEST_FILE = 'hyperband_manifest.json'
+RESULT_FILE = 'result.txt'
+RESULT_POLL_INTERVAL = 30  # seconds between checks for the results of a round whose batch job can't be watched
+JOB_POLL_INTERVAL = 60  # seconds between checks on whether the batch job of a round has ended
+JOB_ID_PATTERN = re.compile(r'JOB_ID=(\d+)')  # as printed by Turbine upon submitting a batch job
+JOB_ID_FILE = 'jobid.txt'  # written by Turbine to the experiment directory of the batch job
+LSF_ENDED_STATES = ('DONE', 'EXIT')
+SEED = 0  # seed for drawing the configurations of the brackets from the parameter space
+
+
+def get_brackets(max_budget, eta):
+    """
+    Return the brackets of Hyperband
+    Arguments:
+        max_budget: int
+            Maximum budget (e.g., number of epochs) given to a single configuration
+        eta: int
+            Factor by which the number of configurations is reduced (and the budget increased) from one rung to the next
+
+    Returns: list
+        One list of (nconfigs, budget) rungs per bracket, from the most to the least exploratory bracket
+    """
+    s_max = 0
+    while eta ** (s_max + 1) <= max_budget:
+        s_max += 1
+    brackets = []
+    for s in range(s_max, -1, -1):
+        nconfigs = int(math.ceil((s_max + 1) / (s + 1) * eta ** s))
+        brackets.append([(nconfigs // eta ** i, max(1, int(round(max_budget / eta ** (s - i))))) for i in range(s + 1)])
+    return brackets
+
+
+def load_param_space(filename):
+    """
+    Return the hyperparameter sets (dictionaries) in a parameter space file containing one JSON object per line
+    """
+    hpsets = []
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                hpsets.append(json.loads(line))
+    return hpsets
+
+
+def write_round_file(filename, round_hpsets):
+    """
+    Write the UPF file of a round, i.e., one JSON hyperparameter set per line
+    """
+    with open(filename, 'w') as f:
+        for hpset in round_hpsets:
+            f.write(json.dumps(hpset) + '\n')
+
+
+def read_objectives(experiments_dir, eval_ids, since):
+    """
+    Return the objective of each of the given evaluations that has finished, from the experiment index if it has recorded them and otherwise from their result.txt files
+    Arguments:
+        experiments_dir: str
+            Path to the experiments directory
+        eval_ids: list
+            IDs of the evaluations
+        since: float
+            Seconds since the epoch before which evaluations with the same IDs (e.g., from a previous hyperband job) are ignored
+
+    Returns: dict
+        The objective (NaN if the evaluation failed) of each finished evaluation
+    """
+    objectives = {}
+    wanted = set(eval_ids)
+    for record in experiment_index.query_evaluations(experiments_dir):
+        if (record['eval_id'] in wanted) and (record['stop_time'] is not None) and (record['stop_time'] >= since):
+            objectives[record['eval_id']] = math.nan if record['objective'] is None else record['objective']
+    for eval_id in wanted - set(objectives):
+        for result_file in glob.glob(os.path.join(experiments_dir, '*', 'run', eval_id, RESULT_FILE)):
+            try:
+                if os.path.getmtime(result_file) >= since:
+                    with open(result_file) as f:
+                        objectives[eval_id] = float(f.read())
+            except (OSError, ValueError):
+                pass
+    return objectives
+
+
+def get_job_id(workflow_output, experiments_dir, since):
+    """
+    Return the ID of the batch job submitted by the workflow command of a round
+    Arguments:
+        workflow_output: str
+            Output of the workflow command
+        experiments_dir: str
+            Path to the experiments directory
+        since: float
+            Seconds since the epoch at which the workflow command was run
+
+    Returns: str
+        The job ID printed by Turbine or else that in the jobid.txt file of the newest experiment directory created since then, or None if no batch job was submitted (e.g., the workflow was run in the foreground)
+    """
+    job_ids = JOB_ID_PATTERN.findall(workflow_output)
+    if job_ids:
+        return job_ids[-1]
+    job_id_files = [job_id_file for job_id_file in glob.glob(os.path.join(experiments_dir, '*', JOB_ID_FILE)) if os.path.getmtime(job_id_file) >= since]
+    if not job_id_files:
+        return None
+    with open(max(job_id_files, key=os.path.getmtime)) as f:
+        job_id = f.read().strip()
+    return job_id or None
+
+
+def is_job_active(job_id, site):
+    """
+    Return whether a batch job is still queued or running according to squeue (Biowulf) or bjobs (Summit), or None if the scheduler couldn't be queried
+    """
+    if site == 'biowulf':
+        cmd = ['squeue', '--noheader', '--jobs={}'.format(job_id), '--format=%T']
+    else:
+        cmd = ['bjobs', '-noheader', '-o', 'stat', job_id]
+    try:
+        process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=120)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    if process.returncode != 0:
+        return False if 'invalid job id' in process.stderr.lower() else None  # squeue no longer knows a job some time after it has ended
+    return any(state not in LSF_ENDED_STATES for state in process.stdout.split())
+
+
+def run_command(cmd):
+    """
+    Run a command, echoing its output to the screen as it goes, and return that output
+    """
+    output = []
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    for line in process.stdout:
+        print(line, end='', flush=True)
+        output.append(line)
+    process.wait()
+    return ''.join(output)
+
+
+def run_round(iround, round_hpsets, workflow_cmd, experiments_dir, site, max_wait):
+    """
+    Run one round of hyperparameter sets using the UPF workflow and return their objectives
+    Arguments:
+        iround: int
+            Index of the round
+        round_hpsets: list
+            Hyperparameter sets (each with a unique "id") to evaluate
+        workflow_cmd: list
+            Command running the UPF workflow, to which the path of the round's UPF file is appended
+        experiments_dir: str
+            Path to the experiments directory
+        site: str
+            The $SITE, whose scheduler is queried for the batch job submitted by the workflow command (if any)
+        max_wait: float
+            Seconds to keep waiting for results after the workflow command has returned if it submitted a batch job that can't be watched
+
+    Returns: dict
+        The objective of each evaluation (infinite if it didn't produce one)
+    """
+    start_time = time.time()
+    upf_file = os.path.join(os.getenv('CANDLE_SUBMISSION_DIR'), 'candle_generated_files', '{}-{:02}.txt'.format(ROUND_BASENAME, iround))
+    write_round_file(upf_file, round_hpsets)
+    print('Hyperband round {}: running {} hyperparameter sets in {}'.format(iround, len(round_hpsets), upf_file), flush=True)
+    workflow_output = run_command(workflow_cmd + [upf_file])
+
+    # Wait for the batch job of the round (if any) to end, however long it is queued
+    eval_ids = [hpset['id'] for hpset in round_hpsets]
+    job_id = get_job_id(workflow_output, experiments_dir, start_time)
+    job_active = False
+    if job_id is not None:
+        print('Hyperband round {}: waiting for batch job {} to end'.format(iround, job_id), flush=True)
+        job_active = is_job_active(job_id, site)
+        while job_active:
+            time.sleep(JOB_POLL_INTERVAL)
+            job_active = is_job_active(job_id, site)
+
+    # If the job couldn't be watched, instead wait for the evaluations of the round to have finished for up to the walltime
+    objectives = read_objectives(experiments_dir, eval_ids, start_time)
+    if job_active is None:
+        print('WARNING: Could not query the state of batch job {}; waiting up to the walltime for the results of hyperband round {}'.format(job_id, iround))
+        wait_start_time = time.time()
+        while (len(objectives) < len(eval_ids)) and (time.time() - wait_start_time < max_wait):
+            time.sleep(RESULT_POLL_INTERVAL)
+            objectives = read_objectives(experiments_dir, eval_ids, start_time)
+    if len(objectives) < len(eval_ids):
+        print('WARNING: {} evaluations of hyperband round {} did not finish; treating them as failed'.format(len(eval_ids) - len(objectives), iround))
+
+    return {eval_id: (math.inf if math.isnan(objectives.get(eval_id, math.nan)) else objectives[eval_id]) for eval_id in eval_ids}
+
+
+def hyperband(hpsets, max_budget, eta, budget_param, run_round_func):
+    """
+    Run Hyperband, evaluating the same rung of all brackets in the same round
+    Arguments:
+        hpsets: list
+            Pool of hyperparameter sets from which the configurations of the brackets are drawn
+        max_budget: int
+            Maximum budget given to a single configuration
+        eta: int
+            Reduction factor between rungs
+        budget_param: str
+            Hyperparameter through which the budget is passed to the model (e.g., epochs)
+        run_round_func: function
+            Function taking the round index and a list of hyperparameter sets and returning the objective of each one by ID
+
+    Returns: list
+        One dictionary per round with the keys round, hpsets, and objectives
+    """
+
+    # Draw the configurations of each bracket from the pool, without replacement as long as the pool lasts
+    rng = random.Random(SEED)
+    brackets = get_brackets(max_budget, eta)
+    pool = list(range(len(hpsets)))
+    rng.shuffle(pool)
+    alive = []
+    for ibracket, rungs in enumerate(brackets):
+        nconfigs = rungs[0][0]
+        if len(pool) < nconfigs:  # reuse configurations across (but never within) brackets if the pool is too small
+            pool += [iconfig for iconfig in rng.sample(range(len(hpsets)), len(hpsets)) if iconfig not in pool]
+        alive.append(pool[:nconfigs])
+        pool = pool[nconfigs:]
+        print('Hyperband bracket {}: (configurations, {}) per rung = {}'.format(ibracket, budget_param, rungs))
+
+    # In each round, evaluate the current rung of every bracket that still has one
+    rounds = []
+    for iround in range(len(brackets[0])):
+        round_hpsets = []
+        for ibracket, rungs in enumerate(brackets):
+            if iround < len(rungs):
+                budget = rungs[iround][1]
+                for iconfig in alive[ibracket]:
+                    hpset = dict(hpsets[iconfig])
+                    hpset['id'] = 'hb{:02}-b{}-c{:04}-r{}'.format(iround, ibracket, iconfig, budget)
+                    hpset[budget_param] = budget
+                    round_hpsets.append(hpset)
+        objectives = run_round_func(iround, round_hpsets)
+        rounds.append({'round': iround, 'hpsets': round_hpsets, 'objectives': objectives})
+
+        # Promote the best configurations of each bracket to its next rung
+        for ibracket, rungs in enumerate(brackets):
+            if iround + 1 < len(rungs):
+                ranked = sorted(alive[ibracket], key=lambda iconfig: objectives['hb{:02}-b{}-c{:04}-r{}'.format(iround, ibracket, iconfig, rungs[iround][1])])
+                alive[ibracket] = ranked[:rungs[iround + 1][0]]
+
+    return rounds
+
+
+def main():
+
+    # Obtain the settings
+    experiments_dir = os.getenv('EXPERIMENTS')
+    max_budget = int(os.getenv('CANDLE_HYPERBAND_MAX_BUDGET'))
+    eta = int(os.getenv('CANDLE_HYPERBAND_ETA'))
+    budget_param = os.getenv('CANDLE_HYPERBAND_BUDGET_PARAM')
+    hpsets = load_param_space(os.getenv('CANDLE_WORKFLOW_SETTINGS_FILE'))
+    if not hpsets:
+        print('ERROR: The parameter space file {} contains no hyperparameter sets'.format(os.getenv('CANDLE_WORKFLOW_SETTINGS_FILE')))
+        exit(1)
+    site = os.getenv('SITE')
+    candle = os.getenv('CANDLE')
+    workflow_cmd = [os.path.join(candle, 'Supervisor', 'workflows', 'upf', 'swift', 'workflow.sh'), site, '-a', os.path.join(candle, 'Supervisor', 'workflows', 'common', 'sh', 'cfg-sys-{}.sh'.format(site))]
+    max_wait = keyword_schema.get_walltime_seconds(os.getenv('WALLTIME'), site)
+
+    # Run the rounds
+    rounds = hyperband(hpsets, max_budget, eta, budget_param, lambda iround, round_hpsets: run_round(iround, round_hpsets, workflow_cmd, experiments_dir, site, max_wait))
+
+    # Record the rounds (with null objectives for the evaluations that failed, as JSON has no infinity) and report the best configuration given the largest budget
+    with open(os.path.join(os.getenv('CANDLE_SUBMISSION_DIR'), 'candle_generated_files', MANIFEST_FILE), 'w') as f:
+        json.dump([dict(iround, objectives={eval_id: (objective if math.isfinite(objective) else None) for eval_id, objective in iround['objectives'].items()}) for iround in rounds], f, indent=2)
+    finalists = [(iround['objectives'][hpset['id']], hpset) for iround in rounds for hpset in iround['hpsets'] if hpset[budget_param] == max_budget]
+    best_objective, best_hpset = min(finalists, key=lambda finalist: finalist[0])
+    print('Hyperband complete; best hyperparameter set given the maximum budget ({}): {}'.format(best_objective, json.dumps(best_hpset)))
+
+
+if __name__ == '__main__':
+    main()
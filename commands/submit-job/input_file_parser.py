@@ -0,0 +1,167 @@
+# Parser for the namelist-style input (.in) file given to "candle submit-job", which reads the file once into memory and records the line number of everything it reads so that problems can be reported by line
+# The sections are read exactly as the extract_section() function of command_script.sh reads them (so that the generated files don't depend on which implementation of submit-job is used): comment lines (starting with "#") and comments are dropped, a section starts at a line consisting of "&<SECTION>" (case-insensitive) and ends at a line consisting of "/", and the leading spaces of the lines of a section are removed
+# Used by submit_job.py, preprocess.py (to point to the line setting an invalid keyword), and generate_hyperparameter_grid.py
+# ASSUMPTIONS: None
+
+import re
+
+
+SECTIONS = ('control', 'default_model', 'param_space')
+KEYWORD_REGEX = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')  # keywords become parts of the names of environment variables
+
+
+class InputFileError(Exception):
+    """
+    Raised by parse() in strict mode if the input file has any problems
+    """
+
+
+class InputFile:
+    """
+    Contents of an input file, as returned by parse()
+    Attributes:
+        filename: str
+            Path to the input file
+        sections: dict
+            The lines of each of SECTIONS (empty if the section is absent), with comments and leading spaces removed
+        line_numbers: dict
+            The line number of each of the lines of each section
+        spans: dict
+            The line numbers of the "&<SECTION>" and "/" lines of each section present in the file (the latter being None if the section is never ended)
+        keywords: dict
+            The (unexpanded) value of each keyword set in the &control section, by lowercase keyword; if a keyword is set more than once, the last value is kept, as when the resulting exports are sourced
+        keyword_line_numbers: dict
+            The line number on which each keyword is set
+        problems: list
+            Description of each problem found in the file, prefixed by its location
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.sections = {section_name: [] for section_name in SECTIONS}
+        self.line_numbers = {section_name: [] for section_name in SECTIONS}
+        self.spans = {}
+        self.keywords = {}
+        self.keyword_line_numbers = {}
+        self.problems = []
+        self._located_problems = []  # (line number, problem), sorted by line into problems once the file has been read
+
+    def location(self, line_number):
+        """
+        Return the location of a line of the input file in the usual <FILE>:<LINE> form
+        """
+        return '{}:{}'.format(self.filename, line_number)
+
+    def add_problem(self, line_number, message):
+        """
+        Record a problem found on a line of the input file
+        """
+        self._located_problems.append((line_number, '{}: {}'.format(self.location(line_number), message)))
+
+    def get_keyword_location(self, keyword):
+        """
+        Return the location of the line setting a keyword of the &control section, or None if the keyword isn't set
+        """
+        line_number = self.keyword_line_numbers.get(keyword.lower())
+        return None if line_number is None else self.location(line_number)
+
+    def get_file_keyword(self, section_name, keyword):
+        """
+        Return the file set by a keyword (e.g., candle_default_model_file) on the first line of a section, or None if the section doesn't start with it
+        """
+        section_lines = self.sections[section_name]
+        if not section_lines or not re.sub(r'[\t ]', '', section_lines[0]).lower().startswith(keyword + '='):
+            return None
+        val = section_lines[0].split('=', 1)[1].strip('\t ')
+        return re.sub(r'^[\'"]|[\'"]$', '', val)
+
+
+def parse_keywords(input_file):
+    """
+    Fill in the keywords of an InputFile from the lines of its &control section
+    """
+    for line_number, line in zip(input_file.line_numbers['control'], input_file.sections['control']):
+        if not line.strip() or (line == '/') or line.startswith('&'):  # blank, or a section start or indented section end, which parse() has reported
+            continue
+        key, equals_sign, val = line.partition('=')
+        key = key.replace(' ', '').lower()
+        if not equals_sign or not KEYWORD_REGEX.match(key):
+            input_file.add_problem(line_number, 'Line "{}" of the &control section is not of the form <KEYWORD>=<VALUE>'.format(line))
+            continue
+        if key in input_file.keywords:
+            input_file.add_problem(line_number, 'Keyword "{}" is set again (it was first set on line {}); the last value is used'.format(key, input_file.keyword_line_numbers[key]))
+        input_file.keywords[key] = val.lstrip(' ')
+        input_file.keyword_line_numbers[key] = line_number
+
+
+def parse(filename, strict=False):
+    """
+    Read an input file in a single pass
+    Arguments:
+        filename: str
+            Path to the input file
+        strict: bool
+            Whether to raise InputFileError if any problems are found rather than just recording them in the returned InputFile
+
+    Returns: InputFile
+        The contents of the input file
+    """
+    input_file = InputFile(filename)
+    sections, line_numbers, spans = input_file.sections, input_file.line_numbers, input_file.spans
+    active_sections = []  # sections currently being read (more than one only if a section is started inside another)
+    in_unknown_section = False  # whether an unknown section is being skipped
+    with open(filename, newline='', errors='surrogateescape') as f:
+        for line_number, line in enumerate(f, 1):
+            if line.endswith('\n'):
+                line = line[:-1]
+
+            # Get rid of comment lines and comments
+            if '#' in line:
+                if line.startswith('#'):
+                    continue
+                line = line.split('#', 1)[0]
+
+            # A "/" line ends every section
+            if line == '/':
+                if not (active_sections or in_unknown_section):
+                    input_file.add_problem(line_number, '"/" does not end any section')
+                for section_name in active_sections:
+                    spans[section_name] = (spans[section_name][0], line_number)
+                active_sections = []
+                in_unknown_section = False
+                continue
+
+            # Add the line to every section being read
+            line_without_leading_spaces = line.lstrip(' ')
+            if active_sections:
+                for section_name in active_sections:
+                    sections[section_name].append(line_without_leading_spaces)
+                    line_numbers[section_name].append(line_number)
+            elif line.strip() and not line.startswith('&') and not in_unknown_section:
+                input_file.add_problem(line_number, 'Line "{}" is outside of any section and is ignored'.format(line))
+
+            # A "&<SECTION>" line starts a section
+            if line.startswith('&'):
+                section_name = line[1:].lower()
+                if section_name not in sections:
+                    input_file.add_problem(line_number, 'Unknown section "{}" (the sections are {}); it is ignored'.format(line, ', '.join('&' + name for name in SECTIONS)))
+                    in_unknown_section = not active_sections
+                elif section_name not in active_sections:
+                    if active_sections:
+                        input_file.add_problem(line_number, 'Section "{}" starts before the section "&{}" has been ended by a "/" line'.format(line, active_sections[-1]))
+                    if section_name in spans:
+                        input_file.add_problem(line_number, 'Section "{}" was already started on line {}; its lines are appended to those of that section'.format(line, spans[section_name][0]))
+                    else:
+                        spans[section_name] = (line_number, None)
+                    active_sections.append(section_name)
+            elif (line_without_leading_spaces[:1] in ('/', '&')) and ((line_without_leading_spaces == '/') or (line_without_leading_spaces[1:].lower() in sections)):
+                input_file.add_problem(line_number, 'Indented line "{}" is read as {}; remove the indentation to {} a section'.format(line, 'a line of the section' if active_sections else 'an ignored line', 'end' if line_without_leading_spaces == '/' else 'start'))
+
+    for section_name in active_sections:
+        input_file.add_problem(spans[section_name][0], 'Section "&{}" is never ended by a "/" line, so it extends to the end of the file'.format(section_name))
+    parse_keywords(input_file)
+    input_file.problems = [problem for _, problem in sorted(input_file._located_problems, key=lambda located_problem: located_problem[0])]
+
+    if strict and input_file.problems:
+        raise InputFileError('\n'.join(input_file.problems))
+    return input_file
@@ -0,0 +1,331 @@
+# Declarative schema of the keywords of the &control section of the input file, i.e., the type, default value, and constraints of every keyword, with per-$SITE overrides
+# The schema of a $SITE is compiled once into a list of checks, after which validate() checks a whole set of keyword values in a single pass without printing anything, returning a machine-readable report
+# preprocess.py uses it to check the keywords of a submission; running this script directly validates any number of input files (e.g., those generated by a driver of many sweeps) without submitting them
+# Run like "python $CANDLE/wrappers/commands/submit-job/keyword_schema.py [--site=<SITE>] [--json] <INPUT-FILE-1> [<INPUT-FILE-2> ...]"
+# ASSUMPTIONS: When run directly, values like "$(pwd)/model.py" are expanded relative to the directory containing the input file, as candle submit-job is normally run from there
+
+import os
+import re
+import json
+import shlex
+import argparse
+
+import input_file_parser
+
+
+WORKFLOWS = ('grid', 'bayesian', 'hyperband')  # these are the CANDLE workflows (corresponding to upf and mlrMBO, with hyperband running repeated rounds of upf) that we've tested so far
+DL_BACKENDS = ('keras', 'pytorch')
+BIOWULF_WORKER_TYPES = ('cpu', 'k20x', 'k80', 'p100', 'v100', 'v100x')
+PRUNING_POLICIES = ('none', 'median', 'successive_halving')  # pruning.POLICIES
+SCHEDULERS = ('swift', 'async', 'async_local')
+GPU_PACKINGS = ('none', 'declared', 'profile')
+SITES = ('biowulf', 'summit-tf1', 'summit-tf2')
+SUMMIT_SITES = ('summit-tf1', 'summit-tf2')
+
+# The keywords in the order in which they're checked and output. Each is a dictionary containing the type of the keyword's value, its default value (None if the keyword is required), and optionally:
+#   sites: the $SITEs to which the keyword applies (all of them if not set)
+#   choices: the valid values, compared case-insensitively if ignore_case is set
+#   min, max: inclusive bounds on the value; min_exclusive: exclusive lower bound
+#   readable_file: the value must be a file that can be opened for reading (or blank if the keyword is optional)
+#   directory: the value must be a directory (or blank)
+#   pattern: regular expression the whole value must match
+#   relative_paths: the value must be a comma-separated list of paths none of which is absolute or contains a ".." component
+#   help: description of a valid value for the error messages (generated from choices if not set)
+KEYWORDS = {
+    'model_script': {'type': str, 'default': None, 'readable_file': True, 'help': 'a file that can be opened for reading'},
+    'workflow': {'type': str, 'default': None, 'choices': WORKFLOWS, 'ignore_case': True},
+    'walltime': {'type': str, 'default': '00:05:00', 'pattern': r'\d+(:\d+){0,2}|\d+-\d+(:\d+){0,2}', 'help': 'a time limit of the form minutes, minutes:seconds, hours:minutes:seconds, days-hours, days-hours:minutes, or days-hours:minutes:seconds'},
+    'worker_type': {'type': str, 'default': 'k80', 'sites': ('biowulf',), 'choices': BIOWULF_WORKER_TYPES, 'ignore_case': True},
+    'nworkers': {'type': int, 'default': 1, 'min': 1, 'help': 'a positive integer'},
+    'nthreads': {'type': int, 'default': 1, 'sites': ('biowulf',), 'min': 1, 'help': 'a positive integer'},
+    'custom_sbatch_args': {'type': str, 'default': '', 'sites': ('biowulf',)},
+    'mem_per_cpu': {'type': int, 'default': 7, 'sites': ('biowulf',), 'min': 1, 'help': 'a positive integer (expressing memory size in GB)'},
+    'project': {'type': str, 'default': None, 'sites': SUMMIT_SITES},
+    'dl_backend': {'type': str, 'default': 'keras', 'choices': DL_BACKENDS, 'ignore_case': True},
+    'supp_modules': {'type': str, 'default': ''},
+    'python_bin_path': {'type': str, 'default': '', 'directory': True, 'help': 'a directory'},
+    'exec_python_module': {'type': str, 'default': ''},
+    'supp_pythonpath': {'type': str, 'default': ''},
+    'extra_script_args': {'type': str, 'default': ''},
+    'exec_r_module': {'type': str, 'default': ''},
+    'supp_r_libs': {'type': str, 'default': ''},
+    'run_workflow': {'type': int, 'default': 1, 'choices': (0, 1)},
+    'dry_run': {'type': int, 'default': 0, 'choices': (0, 1)},
+    'queue': {'type': str, 'default': 'batch', 'sites': SUMMIT_SITES},
+    'default_model_file': {'type': str, 'default': '', 'readable_file': True, 'help': 'a file that can be opened for reading'},
+    'param_space_file': {'type': str, 'default': '', 'readable_file': True, 'help': 'a file that can be opened for reading'},
+    'persistent_worker': {'type': int, 'default': 0, 'choices': (0, 1)},
+    'stage_locally': {'type': int, 'default': 0, 'choices': (0, 1)},
+    'staged_outputs': {'type': str, 'default': '', 'pattern': r'[^ "]*', 'relative_paths': True, 'help': 'a comma-separated list of relative filename patterns (starting in the evaluation directory) containing no spaces, quotes, or ".." components'},
+    'pruning': {'type': str, 'default': 'none', 'choices': PRUNING_POLICIES},
+    'pruning_warmup_steps': {'type': int, 'default': 1, 'min': 1, 'help': 'a positive integer'},
+    'hyperband_max_budget': {'type': int, 'default': 81, 'min': 1, 'help': 'a positive integer'},
+    'hyperband_eta': {'type': int, 'default': 3, 'min': 2, 'help': 'an integer greater than 1'},
+    'hyperband_budget_param': {'type': str, 'default': 'epochs'},
+    'scheduler': {'type': str, 'default': 'swift', 'choices': SCHEDULERS},
+    'gpu_packing': {'type': str, 'default': 'none', 'choices': GPU_PACKINGS},
+    'eval_gpu_memory': {'type': float, 'default': 0, 'min': 0, 'help': 'a non-negative number (the peak GPU memory in GB used by an evaluation, or 0 if unknown)'},
+    'eval_gpu_utilization': {'type': float, 'default': 1.0, 'min_exclusive': 0, 'max': 1, 'help': 'a number greater than 0 and at most 1 (the fraction of a GPU\'s compute used by an evaluation)'},
+    'gpus_per_node': {'type': int, 'default': 0, 'min': 0, 'help': 'a non-negative integer (0 to use all the GPUs of each node)'},
+    'memoize_results': {'type': int, 'default': 0, 'choices': (0, 1)},
+    'profile_interval': {'type': float, 'default': 0, 'min': 0, 'help': 'a non-negative number (the seconds between samples of the resources used by each evaluation, or 0 not to profile them)'}
+}
+
+# Per-$SITE overrides of the settings of the keywords above
+SITE_OVERRIDES = {
+    'summit-tf1': {'walltime': {'default': '00:05', 'pattern': r'\d+(:\d+)?', 'help': 'a time limit of the form [hours:]minutes'}},
+    'summit-tf2': {'walltime': {'default': '00:05', 'pattern': r'\d+(:\d+)?', 'help': 'a time limit of the form [hours:]minutes'}}
+}
+
+# Keywords that are used without being validated here
+UNVALIDATED_KEYWORDS = ('restart_from_exp',)  # checked in run_workflows.sh/submit_job.py
+
+_compiled_schemas = dict()  # compiled schemas by $SITE
+
+
+def get_keywords(site):
+    """
+    Return the settings of the keywords that apply to a $SITE, with the overrides of that $SITE applied
+    Arguments:
+        site: str
+            The $SITE, e.g., biowulf
+
+    Returns: dict
+        Keyword settings by keyword, in KEYWORDS order
+    """
+    if site not in SITES:
+        raise ValueError('site ({}) is unknown in keyword_schema.py'.format(site))
+    overrides = SITE_OVERRIDES.get(site, dict())
+    return {keyword: dict(settings, **overrides.get(keyword, dict())) for keyword, settings in KEYWORDS.items() if site in settings.get('sites', SITES)}
+
+
+def get_walltime_seconds(walltime, site):
+    """
+    Return the number of seconds in a walltime keyword, i.e., [days-]hours:minutes:seconds (or any other format accepted by sbatch, e.g., minutes or days-hours) on Biowulf or [hours:]minutes on Summit
+    Raises ValueError if the walltime isn't in such a format
+    """
+    if site == 'biowulf':
+        days, dash, rest = walltime.rpartition('-')
+        fields = [int(field) for field in rest.split(':')]
+        multipliers = (3600, 60, 1) if dash else {1: (60,), 2: (60, 1), 3: (3600, 60, 1)}.get(len(fields))
+        if (multipliers is None) or (len(fields) > 3):
+            raise ValueError('invalid walltime {}'.format(walltime))
+        return (int(days) * 86400 if dash else 0) + sum(field * multiplier for field, multiplier in zip(fields, multipliers))
+    fields = [int(field) for field in walltime.split(':')]
+    multipliers = {1: (60,), 2: (3600, 60)}.get(len(fields))
+    if multipliers is None:
+        raise ValueError('invalid walltime {}'.format(walltime))
+    return sum(field * multiplier for field, multiplier in zip(fields, multipliers))
+
+
+def get_defaults(site):
+    """
+    Return the keywords that apply to a $SITE and their default values (None if the keyword is required)
+    """
+    return {keyword: settings['default'] for keyword, settings in get_keywords(site).items()}
+
+
+def compile_check(settings):
+    """
+    Compile the constraints of a keyword into a single function
+    Arguments:
+        settings: dict
+            The settings of the keyword (see KEYWORDS)
+
+    Returns: function
+        Function returning whether a (cast) value of the keyword is valid, or None if the keyword isn't constrained
+    """
+    checks = []
+    if 'choices' in settings:
+        choices = frozenset(settings['choices'])
+        if settings.get('ignore_case'):
+            checks.append(lambda val: val.lower() in choices)
+        else:
+            checks.append(lambda val: val in choices)
+    if 'min' in settings:
+        checks.append(lambda val: val >= settings['min'])
+    if 'min_exclusive' in settings:
+        checks.append(lambda val: val > settings['min_exclusive'])
+    if 'max' in settings:
+        checks.append(lambda val: val <= settings['max'])
+    allow_blank = settings['default'] == ''  # a blank path means the optional file or directory isn't used
+    if settings.get('readable_file'):
+        checks.append(lambda val: (allow_blank and (val == '')) or (os.path.isfile(val) and os.access(val, os.R_OK)))
+    if settings.get('directory'):
+        checks.append(lambda val: (allow_blank and (val == '')) or os.path.isdir(val))
+    if 'pattern' in settings:
+        regex = re.compile(settings['pattern'])
+        checks.append(lambda val: regex.fullmatch(val) is not None)
+    if settings.get('relative_paths'):
+        checks.append(lambda val: all(not path.startswith('/') and ('..' not in path.split('/')) for path in val.split(',')))
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+    return lambda val: all(check(val) for check in checks)
+
+
+def compile_schema(site):
+    """
+    Return the compiled schema of a $SITE, compiling it on first use
+    Arguments:
+        site: str
+            The $SITE, e.g., biowulf
+
+    Returns: list
+        (keyword, casting_func, default, is_valid, help) tuples in KEYWORDS order, where is_valid is the function returned by compile_check()
+    """
+    if site not in _compiled_schemas:
+        schema = []
+        for keyword, settings in get_keywords(site).items():
+            help_text = settings.get('help')
+            if (help_text is None) and ('choices' in settings):
+                help_text = 'one of {}'.format(settings['choices'])
+            schema.append((keyword, settings['type'], settings['default'], compile_check(settings), help_text))
+        _compiled_schemas[site] = schema
+    return _compiled_schemas[site]
+
+
+def validate(keyword_values, site, locations=None):
+    """
+    Validate the keywords of the &control section of an input file
+    Arguments:
+        keyword_values: dict
+            The (uncast) string value of each keyword set in the input file, by lowercase keyword
+        site: str
+            The $SITE, e.g., biowulf
+        locations: dict
+            Optional location in the input file (e.g., "grid_example.in:5") of each keyword, which is added to the errors and warnings about it
+
+    Returns: dict
+        The validation report, containing:
+            site: the $SITE
+            valid: whether all the keywords are valid
+            keywords: the value of every keyword that applies to the $SITE, cast to its type (the default value if it's not set)
+            defaulted: the keywords that were set to their default values
+            errors, warnings: lists of {"keyword", "value", "message", "location"} dictionaries
+    """
+    locations = locations or dict()
+    keywords = dict()
+    defaulted = []
+    errors = []
+    warnings = []
+
+    def add_problem(problems, keyword, value, message):
+        problems.append({'keyword': keyword, 'value': value, 'message': message, 'location': locations.get(keyword)})
+
+    # Check each keyword that applies to the site
+    for keyword, casting_func, default, is_valid, help_text in compile_schema(site):
+        value = keyword_values.get(keyword)
+        if value is None:
+            if default is None:
+                add_problem(errors, keyword, None, 'Required keyword "{}" has not been set in the &control section of the input file'.format(keyword))
+                continue
+            add_problem(warnings, keyword, default, 'Optional keyword "{}" has not been set in the &control section of the input file; it is being set to its default value of {}'.format(keyword, default))
+            defaulted.append(keyword)
+            cast_value = default
+        else:
+            try:
+                cast_value = casting_func(value)
+            except ValueError:
+                add_problem(errors, keyword, value, 'Keyword "{}" has an invalid value of {}; it must be of type {}'.format(keyword, value, casting_func.__name__))
+                continue
+        if (is_valid is not None) and not is_valid(cast_value):
+            add_problem(errors, keyword, value, 'Keyword "{}" has an invalid value of {}; it must be {}'.format(keyword, cast_value, help_text))
+            continue
+        keywords[keyword] = cast_value
+
+    # Check the constraints between keywords
+    if (keywords.get('scheduler', 'swift') != 'swift') and ('workflow' in keywords) and (keywords['workflow'].lower() != 'grid'):
+        add_problem(errors, 'scheduler', keywords.pop('scheduler'), 'Keyword "scheduler" can only be set to something other than "swift" for the grid workflow')
+
+    # Flag keywords that don't apply to the site (they're ignored)
+    site_keywords = {entry[0] for entry in compile_schema(site)}
+    for keyword in keyword_values:
+        if keyword in UNVALIDATED_KEYWORDS:
+            continue
+        if keyword not in KEYWORDS:
+            add_problem(warnings, keyword, keyword_values[keyword], 'Keyword "{}" is unknown and is being ignored'.format(keyword))
+        elif keyword not in site_keywords:
+            add_problem(warnings, keyword, keyword_values[keyword], 'Keyword "{}" does not apply to site {} and is being ignored'.format(keyword, site))
+
+    return {'site': site, 'valid': not errors, 'keywords': keywords, 'defaulted': defaulted, 'errors': errors, 'warnings': warnings}
+
+
+def format_problem(problem):
+    """
+    Return an error or warning from a validation report as a line of text, e.g., 'grid_example.in:5: Keyword "nworkers" has an invalid value of 0; it must be a positive integer'
+    """
+    return problem['message'] if problem['location'] is None else '{}: {}'.format(problem['location'], problem['message'])
+
+
+def expand_value(value, input_file_dir):
+    """
+    Return the value of a keyword in an input file as Bash would export it when run from the directory containing the input file (only $(pwd), $PWD, and environment variables are expanded)
+    """
+    try:
+        tokens = shlex.split(value)
+    except ValueError:
+        tokens = [value]
+    value = tokens[0] if tokens else ''
+    for pwd in ('$(pwd)', '${PWD}', '$PWD'):
+        value = value.replace(pwd, input_file_dir)
+    return os.path.expandvars(value)
+
+
+def validate_input_file(filename, site):
+    """
+    Validate the keywords of the &control section of an input file
+    Arguments:
+        filename: str
+            Path to the input file
+        site: str
+            The $SITE, e.g., biowulf
+
+    Returns: dict
+        The validation report returned by validate(), with the problems found by input_file_parser.parse() added to its warnings and the name of the input file added as "input_file"
+    """
+    parsed = input_file_parser.parse(filename)
+    input_file_dir = os.path.dirname(os.path.realpath(filename))
+    keyword_values = {keyword: expand_value(value, input_file_dir) for keyword, value in parsed.keywords.items()}
+    report = validate(keyword_values, site, {keyword: parsed.get_keyword_location(keyword) for keyword in keyword_values})
+    report['warnings'] = [{'keyword': None, 'value': None, 'message': problem, 'location': None} for problem in parsed.problems] + report['warnings']  # the problems already include their locations
+    report['input_file'] = filename
+    return report
+
+
+def main():
+
+    # Parse the arguments to the script call
+    parser = argparse.ArgumentParser(description='Validate the &control section of CANDLE input files without submitting them')
+    parser.add_argument('input_files', nargs='+', help='The input files to validate')
+    parser.add_argument('--site', default=os.getenv('SITE'), choices=SITES, help='The $SITE to validate the keywords for (default: $SITE)')
+    parser.add_argument('--json', action='store_true', help='Output the validation reports as a JSON list instead of text')
+    args = parser.parse_args()
+    if args.site is None:
+        print('ERROR: The --site argument is required if $SITE is not set')
+        exit(1)
+
+    # Validate each input file
+    reports = []
+    for filename in args.input_files:
+        try:
+            reports.append(validate_input_file(filename, args.site))
+        except OSError as e:
+            reports.append({'input_file': filename, 'site': args.site, 'valid': False, 'keywords': dict(), 'defaulted': [], 'errors': [{'keyword': None, 'value': None, 'message': str(e), 'location': None}], 'warnings': []})
+
+    # Output the reports
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for report in reports:
+            print('{}: {}'.format(report['input_file'], 'valid' if report['valid'] else 'INVALID'))
+            for problem in report['errors']:
+                print('  ERROR: {}'.format(format_problem(problem)))
+        print('{} of {} input files are valid'.format(sum(report['valid'] for report in reports), len(reports)))
+
+    exit(0 if all(report['valid'] for report in reports) else 1)
+
+
+if __name__ == '__main__':
+    main()
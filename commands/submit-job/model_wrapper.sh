@@ -11,6 +11,11 @@
 #         $CANDLE_EXEC_R_MODULE (preprocess.py)
 #         $CANDLE_SUPP_PYTHONPATH (via head.py; preprocess.py)
 #         $CANDLE_SUPP_R_LIBS (via head.R; preprocess.py)
+#         $CANDLE_SUBMISSION_DIR (bin/candle)
+#         $CANDLE_STAGE_LOCALLY, $CANDLE_STAGED_OUTPUTS (preprocess.py)
+#         $CANDLE_STAGING_DIR (site-specific_settings.sh via utilities.sh)
+#         $CANDLE_BIND_GPUS (preprocess.py)
+# If called as "model_wrapper.sh --persistent-worker <SOCKET-PATH>" (from candle_compliant_wrapper.py when $CANDLE_PERSISTENT_WORKER is 1), the environment for a Python model is set up as usual but, instead of running the model once, a long-lived persistent_worker.py process is started that runs the model on every hyperparameter set it is sent
 
 
 # Function to wrap the input model by wrapper lines of code
@@ -24,6 +29,26 @@ wrap_model() {
 }
 
 
+# Function to write the wrapped model once per job into candle_generated_files/wrapped_models, named by a hash of its contents, and output its path
+# This avoids rewriting (and, for Python, recompiling) the same wrapped model in every evaluation directory; the same file is produced by get_cached_wrapped_model() in run_wrapped_model.py
+get_cached_wrapped_model() {
+    cache_dir=${CANDLE_WRAPPED_MODEL_CACHE_DIR:-"$CANDLE_SUBMISSION_DIR/candle_generated_files/wrapped_models"}
+    hash=$(wrap_model "$1" "$2" "$3" | sha256sum | cut -c 1-16)
+    cached_file="$cache_dir/wrapped_model-${hash}.$4"
+    if [ ! -f "$cached_file" ]; then
+        mkdir -p "$cache_dir"
+        wrap_model "$1" "$2" "$3" > "$cached_file.$$.tmp" && mv -f "$cached_file.$$.tmp" "$cached_file"
+    fi
+    echo "$cached_file"
+}
+
+
+# If several workers share the GPUs of a node (see export_bash_variables() in preprocess.py), bind this worker to one of them according to its task index on the node
+if [ "x$CANDLE_BIND_GPUS" == "x1" ] && [ -n "$SLURM_LOCALID" ] && [ -n "$CUDA_VISIBLE_DEVICES" ]; then
+    IFS=',' read -r -a node_gpus <<< "$CUDA_VISIBLE_DEVICES"
+    export CUDA_VISIBLE_DEVICES=${node_gpus[$((SLURM_LOCALID % ${#node_gpus[@]}))]}
+fi
+
 # Display timing/node/GPU information
 echo "MODEL_WRAPPER.SH START TIME: $(date +%s)"
 echo "HOST: $(hostname)"
@@ -39,12 +64,31 @@ if [ -n "$CANDLE_SUPP_MODULES" ]; then
     module load $CANDLE_SUPP_MODULES
 fi
 
+# If requested, run the evaluation in a node-local directory so that the shared filesystem holding the experiments directory only sees the results copied back at the end
+# The persistent worker stages each of its evaluations itself
+eval_dir=$(pwd)
+stage_dir=
+if [ "x$CANDLE_STAGE_LOCALLY" == "x1" ]; then
+    if [ -n "$CANDLE_STAGING_DIR" ] && [ -d "$(dirname "$CANDLE_STAGING_DIR")" ]; then
+        export CANDLE_WRAPPED_MODEL_CACHE_DIR="$CANDLE_STAGING_DIR/wrapped_models" # also read the wrapped model from the node-local directory
+        if [ "x$1" != "x--persistent-worker" ]; then
+            mkdir -p "$CANDLE_STAGING_DIR"
+            stage_dir=$(mktemp -d "$CANDLE_STAGING_DIR/$(basename "$eval_dir").XXXXXX")
+            cp params.json "$stage_dir"
+            cd "$stage_dir" || exit 1
+            echo "Staging the evaluation in $stage_dir"
+        fi
+    else
+        echo "WARNING: The stage_locally keyword is set but no node-local staging directory is available (\$CANDLE_STAGING_DIR=\"$CANDLE_STAGING_DIR\"), so running the evaluation in place"
+    fi
+fi
+
 # Determine language to use to run the model
 suffix=$(echo "$CANDLE_KEYWORD_MODEL_SCRIPT" | rev | awk -v FS="." '{print tolower($1)}' | rev)
 
 # Write the run_candle_model_standalone.sh script here so that this job can be run completely standalone in the future if desired
 # Don't do this if the file already exists, as, e.g., happens when you're already running this file directly
-if [ ! -f ./run_candle_model_standalone.sh ]; then
+if [ "x$1" != "x--persistent-worker" ] && [ ! -f "$eval_dir/run_candle_model_standalone.sh" ]; then
     m4 "$CANDLE/wrappers/commands/submit-job/run_candle_model_standalone.sh.m4" > ./run_candle_model_standalone.sh
 fi
 
@@ -69,13 +113,21 @@ if [ "x$suffix" == "xpy" ]; then
         fi
     fi
 
-    # Create a wrapped version of the model in wrapped_model.py
-    wrap_model "$CANDLE/wrappers/commands/submit-job/head.py" "$CANDLE_KEYWORD_MODEL_SCRIPT" "$CANDLE/wrappers/commands/submit-job/tail.py" > ./wrapped_model.py
+    # Replace this script by the persistent worker if requested; it wraps and runs the model itself for every hyperparameter set
+    if [ "x$1" == "x--persistent-worker" ]; then
+        echo "Using Python for persistent worker: $(command -v python)"
+        script_call="python${CANDLE_EXTRA_SCRIPT_ARGS:+ $CANDLE_EXTRA_SCRIPT_ARGS}"
+        exec $script_call "$CANDLE/wrappers/commands/submit-job/persistent_worker.py" "$2"
+    fi
+
+    # Point wrapped_model.py to the cached wrapped version of the model
+    wrapped_model=$(get_cached_wrapped_model "$CANDLE/wrappers/commands/submit-job/head.py" "$CANDLE_KEYWORD_MODEL_SCRIPT" "$CANDLE/wrappers/commands/submit-job/tail.py" py)
+    ln -sf "$wrapped_model" ./wrapped_model.py
 
-    # Run wrapped_model.py
+    # Run wrapped_model.py using its cached bytecode
     echo "Using Python for execution: $(command -v python)"
     script_call="python${CANDLE_EXTRA_SCRIPT_ARGS:+ $CANDLE_EXTRA_SCRIPT_ARGS}"
-    $script_call wrapped_model.py
+    $script_call "$CANDLE/wrappers/commands/submit-job/run_wrapped_model.py" "$wrapped_model"
 
 # Run a model written in R
 elif [ "x$suffix" == "xr" ]; then
@@ -91,8 +143,8 @@ elif [ "x$suffix" == "xr" ]; then
         source "$CANDLE/wrappers/utilities.sh"; load_r_env
     fi
 
-    # Create a wrapped version of the model in wrapped_model.R
-    wrap_model "$CANDLE/wrappers/commands/submit-job/head.R" "$CANDLE_KEYWORD_MODEL_SCRIPT" "$CANDLE/wrappers/commands/submit-job/tail.R" > ./wrapped_model.R
+    # Point wrapped_model.R to the cached wrapped version of the model
+    ln -sf "$(get_cached_wrapped_model "$CANDLE/wrappers/commands/submit-job/head.R" "$CANDLE_KEYWORD_MODEL_SCRIPT" "$CANDLE/wrappers/commands/submit-job/tail.R" R)" ./wrapped_model.R
 
     # Run wrapped_model.R
     echo "Using Rscript for execution: $(command -v Rscript)"
@@ -120,5 +172,21 @@ elif [ "x$suffix" == "xsh" ]; then
 
 fi
 
+# Copy the results of a staged evaluation back to the evaluation directory in a single batch (tar preserves the relative paths of outputs in subdirectories) and clean up
+if [ -n "$stage_dir" ]; then
+    IFS=',' read -ra staged_outputs <<< "$CANDLE_STAGED_OUTPUTS"
+    files_to_copy=()
+    for file in candle_value_to_return.json run_candle_model_standalone.sh ${staged_outputs[*]}; do # unquoted so that the patterns are expanded
+        if [ -e "$file" ] && [ ! -L "$file" ]; then # links (e.g., wrapped_model.py) point into the node-local directory
+            files_to_copy+=("$file")
+        fi
+    done
+    if [ ${#files_to_copy[@]} -gt 0 ]; then
+        tar -cf - "${files_to_copy[@]}" | tar -C "$eval_dir" -xf -
+    fi
+    cd "$eval_dir" || exit 1
+    rm -rf "$stage_dir"
+fi
+
 # Display timing information
 echo "MODEL_WRAPPER.SH END TIME: $(date +%s)"
@@ -0,0 +1,236 @@
+# Long-lived Python process that runs the wrapped Python model script on every hyperparameter set sent to it, so that the interpreter startup and the import of the deep learning backend are paid once per Swift/T worker rather than once per evaluation
+# Run like "python persistent_worker.py <SOCKET-PATH>"; each request is a JSON object {"eval_dir": <DIR>} and each response is a JSON object {"status": "ok"|"error", "message": <STR>}
+# ASSUMPTIONS:
+#   (1) Started via "bash model_wrapper.sh --persistent-worker <SOCKET-PATH>" from candle_compliant_wrapper.py, so that the model's Python environment has already been set up
+#   (2) candle is run the normal way via "candle submit-job ...", which defines the variables $CANDLE_KEYWORD_MODEL_SCRIPT and $CANDLE_DL_BACKEND (and $CANDLE_STAGE_LOCALLY, $CANDLE_STAGED_OUTPUTS, and $CANDLE_STAGING_DIR if evaluations are staged)
+
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import socket
+import builtins
+import traceback
+import subprocess
+from multiprocessing.connection import Listener
+
+import run_wrapped_model  # found next to this script
+import pruning
+
+
+submit_job_dir = os.path.dirname(os.path.realpath(__file__))
+out_and_err_file = "subprocess_out_and_err.txt"
+PARENT_POLL_INTERVAL = 5  # seconds between checks that the process that started this worker is still alive
+
+
+def import_dl_backend():
+    """
+    Import the deep learning backend once so that every evaluation finds it already loaded
+    """
+    dl_backend = os.getenv('CANDLE_DL_BACKEND')
+    if dl_backend == 'keras':
+        import tensorflow.keras  # noqa: F401
+    elif dl_backend == 'pytorch':
+        import torch  # noqa: F401
+
+
+def clear_dl_backend():
+    """
+    Release the models of the previous evaluation held by the deep learning backend
+    """
+    import gc
+    if os.getenv('CANDLE_DL_BACKEND') == 'keras':
+        from tensorflow.keras import backend as K
+        try:
+            K.clear_session()
+        except AttributeError:
+            pass
+    gc.collect()
+
+
+class WrappedModel:
+    """
+    The model script bookended by head.py and tail.py, cached in candle_generated_files as by model_wrapper.sh, loaded once and reloaded only if the model script changes
+    """
+
+    def __init__(self, model_script):
+        self.model_script = model_script
+        self.mtime_ns = None
+        self.cached_file = None
+        self.code = None
+
+    def get(self):
+        mtime_ns = os.stat(self.model_script).st_mtime_ns
+        if mtime_ns != self.mtime_ns:
+            self.cached_file = run_wrapped_model.get_cached_wrapped_model(os.path.join(submit_job_dir, 'head.py'), self.model_script, os.path.join(submit_job_dir, 'tail.py'))
+            self.code = run_wrapped_model.load_wrapped_model(self.cached_file)
+            self.mtime_ns = mtime_ns
+        return self.cached_file, self.code
+
+
+def get_staging_dir():
+    """
+    Return the node-local directory in which to stage evaluations, or None if evaluations aren't to be (or can't be) staged, as decided in model_wrapper.sh
+    """
+    staging_dir = os.getenv('CANDLE_STAGING_DIR', '')
+    if os.getenv('CANDLE_STAGE_LOCALLY') == '1' and staging_dir and os.path.isdir(os.path.dirname(staging_dir)):
+        return staging_dir
+    return None
+
+
+def stage_in(eval_dir, staging_dir):
+    """
+    Create a node-local directory for an evaluation containing its params.json and return its path
+    """
+    import tempfile
+    os.makedirs(staging_dir, exist_ok=True)
+    stage_dir = tempfile.mkdtemp(prefix=os.path.basename(eval_dir) + '.', dir=staging_dir)
+    shutil.copy(os.path.join(eval_dir, 'params.json'), stage_dir)
+    return stage_dir
+
+
+def stage_out(stage_dir, eval_dir):
+    """
+    Copy the results of a staged evaluation (candle_value_to_return.json, run_candle_model_standalone.sh, and the files matching the patterns in $CANDLE_STAGED_OUTPUTS) back to the evaluation directory in a single batch, as model_wrapper.sh does, and remove the node-local directory
+    """
+    filenames = []
+    for pattern in ['candle_value_to_return.json', 'run_candle_model_standalone.sh'] + [x for x in os.getenv('CANDLE_STAGED_OUTPUTS', '').split(',') if x]:
+        for path in sorted(glob.glob(os.path.join(stage_dir, pattern))):
+            if not os.path.islink(path):  # links (e.g., wrapped_model.py) point into the node-local directory
+                filenames.append(os.path.relpath(path, stage_dir))
+    if filenames:
+        packer = subprocess.Popen(['tar', '-C', stage_dir, '-cf', '-'] + filenames, stdout=subprocess.PIPE)
+        subprocess.run(['tar', '-C', eval_dir, '-xf', '-'], stdin=packer.stdout)
+        packer.stdout.close()
+        packer.wait()
+    shutil.rmtree(stage_dir, ignore_errors=True)
+
+
+class RedirectedOutput:
+    """
+    Context manager pointing the stdout/stderr file descriptors (and thus the output of the model and of any libraries it uses) to a file
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __enter__(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.saved_fds = (os.dup(1), os.dup(2))
+        self.file = open(self.filename, 'a')
+        os.dup2(self.file.fileno(), 1)
+        os.dup2(self.file.fileno(), 2)
+        return self
+
+    def __exit__(self, *args):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(self.saved_fds[0], 1)
+        os.dup2(self.saved_fds[1], 2)
+        for fd in self.saved_fds:
+            os.close(fd)
+        self.file.close()
+
+
+def run_evaluation(eval_dir, wrapped_model, standalone_script):
+    """
+    Run the wrapped model in an evaluation directory, mirroring what model_wrapper.sh does for a single evaluation
+    Arguments:
+        eval_dir: str
+            Path to the evaluation directory containing params.json
+        wrapped_model: WrappedModel
+            The compiled wrapped model
+        standalone_script: str
+            Contents of run_candle_model_standalone.sh
+
+    Returns: dict
+        The response to send back to candle_compliant_wrapper.py
+    """
+
+    os.chdir(eval_dir)
+    os.environ[pruning.EVAL_DIR_ENV] = eval_dir  # where the model reports its intermediate values
+    response = {'status': 'ok', 'message': ''}
+    with RedirectedOutput(out_and_err_file):
+
+        # Display timing/node/GPU information, as model_wrapper.sh does
+        print('MODEL_WRAPPER.SH START TIME: {}'.format(int(time.time())))
+        print('HOST: {}'.format(socket.gethostname()))
+        print('GPU: {}'.format(os.getenv('CUDA_VISIBLE_DEVICES', 'NA')))
+        print('Using persistent worker for execution: {} (PID {})'.format(sys.executable, os.getpid()))
+
+        # If requested, run the evaluation in a node-local directory, as model_wrapper.sh does
+        staging_dir = get_staging_dir()
+        if staging_dir is not None:
+            stage_dir = stage_in(eval_dir, staging_dir)
+            os.chdir(stage_dir)
+            print('Staging the evaluation in {}'.format(stage_dir))
+
+        # Write the same files model_wrapper.sh would so that the evaluation can still be rerun standalone
+        cached_file, code = wrapped_model.get()
+        if not os.path.exists(os.path.join(eval_dir, 'run_candle_model_standalone.sh')):
+            with open('run_candle_model_standalone.sh', 'w') as f:
+                f.write(standalone_script)
+        if os.path.lexists('wrapped_model.py'):
+            os.remove('wrapped_model.py')
+        os.symlink(cached_file, 'wrapped_model.py')
+
+        # Run the wrapped model in a fresh namespace, making it see the same arguments and module search path it would if run via "python wrapped_model.py" in the current directory, as run_wrapped_model.main() does
+        argv, path0 = sys.argv, sys.path[0]
+        sys.argv = ['wrapped_model.py']
+        sys.path[0] = os.getcwd()
+        try:
+            exec(code, {'__name__': '__main__', '__file__': 'wrapped_model.py', '__builtins__': builtins})
+        except pruning.EvaluationPruned:
+            pass
+        except SystemExit as e:
+            if e.code not in (None, 0):  # e.g., an argparse error, which exits the model with a nonzero code
+                print('The model exited with code {}'.format(e.code))
+                response = {'status': 'error', 'message': 'SystemExit: {}'.format(e.code)}
+        except BaseException as e:
+            traceback.print_exc()
+            response = {'status': 'error', 'message': '{}: {}'.format(type(e).__name__, e)}
+        finally:
+            sys.argv, sys.path[0] = argv, path0
+            clear_dl_backend()
+
+        # Copy the results of a staged evaluation back to the evaluation directory
+        if staging_dir is not None:
+            os.chdir(eval_dir)
+            stage_out(stage_dir, eval_dir)
+
+        print('MODEL_WRAPPER.SH END TIME: {}'.format(int(time.time())))
+
+    return response
+
+
+def main():
+    socket_path = sys.argv[1]
+    parent_pid = os.getppid()
+
+    # Do the expensive, evaluation-independent work once
+    import_dl_backend()
+    wrapped_model = WrappedModel(os.getenv('CANDLE_KEYWORD_MODEL_SCRIPT'))
+    standalone_script = subprocess.run(['m4', os.path.join(submit_job_dir, 'run_candle_model_standalone.sh.m4')], stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+    # Serve hyperparameter sets until the connection is closed or the process that started this worker goes away
+    with Listener(socket_path, family='AF_UNIX') as listener:
+        print('Persistent worker listening on {}'.format(socket_path), flush=True)
+        with listener.accept() as conn:
+            while True:
+                if not conn.poll(PARENT_POLL_INTERVAL):
+                    if os.getppid() != parent_pid:
+                        break
+                    continue
+                try:
+                    request = json.loads(conn.recv_bytes().decode())
+                except EOFError:
+                    break
+                response = run_evaluation(request['eval_dir'], wrapped_model, standalone_script)
+                conn.send_bytes(json.dumps(response).encode())
+
+
+if __name__ == '__main__':
+    main()
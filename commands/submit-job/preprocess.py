@@ -1,61 +1,3 @@
-def check_keyword(keyword_key, possible_keywords_and_defaults, casting_func, is_valid, checked_keywords):
-    """
-    Check a given keyword in a robust, repeatable way.
-    """
-
-    # Import relevant library
-    import os
-
-    # If keyword_key is a possible keyword...
-    if keyword_key in set(possible_keywords_and_defaults.keys()):
-
-        # Obtain the keyword default value and from that whether it is required (if the default is None, then it must be required)
-        keyword_default_value = possible_keywords_and_defaults[keyword_key]
-        keyword_is_required = keyword_default_value is None
-
-        # Load in the possible keyword value from the corresponding environment variable
-        # If the variable is defined, we get a string, otherwise, we get None
-        env_string = os.getenv('CANDLE_KEYWORD_'+keyword_key.upper())
-
-        # If the keyword wasn't defined in the input file...
-        if env_string is None:
-
-            # If the keyword is required...
-            if keyword_is_required:
-                print('ERROR: Required keyword "{}" has not been set in the &control section of the input file'.format(keyword_key))
-                exit(1)
-
-            # If the keyword is optional...
-            else:
-                print('WARNING: Optional keyword "{}" has not been set in the &control section of the input file; it is being set to its default value of {}'.format(keyword_key, keyword_default_value))
-                keyword_val = keyword_default_value
-
-        # If the keyword WAS defined in the input file, then set its value to the appropriately casted, read-in value
-        else:
-            keyword_val = casting_func(env_string)
-
-        # From the inputted is_valid() function, determine whether the keyword_val (whether read-in or the default value) is valid; if so...
-        if is_valid(keyword_val):
-            print('NOTE: Keyword "{}" has a valid value of {}'.format(keyword_key, keyword_val))
-            checked_keywords[keyword_key] = keyword_val # update the running dictionary of checked keywords
-
-        # If the keyword value is not actually valid...
-        else:
-            print('ERROR: Keyword "{}" has an invalid value of {}'.format(keyword_key, keyword_val))
-            exit(1)
-
-    # Return the running dictionary of checked keywords
-    return(checked_keywords)
-
-
-def no_validation(keyword_key):
-    """
-    Return a function always returning True in order to skip validation if desired.
-    """
-    print('WARNING: No error-checking done on "{}" keyword'.format(keyword_key))
-    return(lambda keyword_val: True)
-
-
 def dict_output(dict_to_output, message_to_output):
     """
     Output the contents of a dictionary in a visually appealing way.
@@ -78,197 +20,62 @@ def dict_output(dict_to_output, message_to_output):
         print(format_str.format(key+':', dict_to_output[key]))
 
 
-def check_keywords(possible_keywords_and_defaults_bash_var):
+def check_keywords():
     """
-    Check keywords from the input file.
+    Check keywords from the input file against the keyword schema (keyword_schema.py), writing the validation report to candle_generated_files/keyword_validation.json.
     """
 
-    # Import relevant library
+    # Import relevant libraries
     import os
+    import sys
+    import json
+    if os.path.dirname(os.path.realpath(__file__)) not in sys.path:
+        sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+    import keyword_schema
+    import input_file_parser
 
-    # Constants
-    valid_workflows = ('grid', 'bayesian') # these are the CANDLE workflows (corresponding to upf and mlrMBO) that we've tested so far
-    valid_dl_backends = ('keras', 'pytorch')
-
-    # Initialize the running dictionary of checked keywords
-    checked_keywords = dict()
+    # Constant
+    report_file = os.path.join(os.getenv('CANDLE_SUBMISSION_DIR', '.'), 'candle_generated_files', 'keyword_validation.json')
 
-    # Obtain Python dictionary of the possible keywords and their default values
-    possible_keywords_and_defaults_str = os.getenv(possible_keywords_and_defaults_bash_var)
-    possible_keywords_and_defaults = eval(possible_keywords_and_defaults_str)
+    # Obtain the keywords that apply to the site and their default values
+    site = os.getenv('SITE')
+    try:
+        possible_keywords_and_defaults = keyword_schema.get_defaults(site)
+    except ValueError as e:
+        print('ERROR: {}'.format(e))
+        exit(1)
 
     # Output the possible keywords and their default values
     dict_output(possible_keywords_and_defaults, 'Possible keywords and their default values:')
 
-    # Validate the model_script keyword
-    def is_valid(keyword_val):
-        try:
-            with open(keyword_val):
-                is_valid2 = True
-        except IOError:
-            print('WARNING: The file "{}" from the "model_script" keyword cannot be opened for reading'.format(keyword_val))
-            is_valid2 = False
-        return(is_valid2)
-    checked_keywords = check_keyword('model_script', possible_keywords_and_defaults, str, is_valid, checked_keywords)
-
-    # Validate the workflow keyword
-    def is_valid(keyword_val):
-        if keyword_val.lower() not in valid_workflows:
-            print('WARNING: The "workflow" keyword ({}) in the &control section must be one of'.format(keyword_val), valid_workflows)
-            is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('workflow', possible_keywords_and_defaults, str, is_valid, checked_keywords)
-
-    # Validate the walltime keyword
-    checked_keywords = check_keyword('walltime', possible_keywords_and_defaults, str, no_validation('walltime'), checked_keywords)
-
-    # Validate the worker_type keyword
-    def is_valid(keyword_val):
-        valid_worker_types = eval(os.getenv('CANDLE_VALID_WORKER_TYPES'))
-        if keyword_val.lower() not in valid_worker_types:
-            print('WARNING: The "worker_type" keyword ({}) in the &control section must be one of'.format(keyword_val), valid_worker_types)
-            is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('worker_type', possible_keywords_and_defaults, str, is_valid, checked_keywords)
-
-    # Validate the nworkers keyword
-    def is_valid(keyword_val):
-        if keyword_val < 1:
-            print('WARNING: The "nworkers" keyword ({}) in the &control section must be a positive integer'.format(keyword_val))
-            is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('nworkers', possible_keywords_and_defaults, int, is_valid, checked_keywords)
-
-    # Validate the nthreads keyword
-    def is_valid(keyword_val):
-        if keyword_val < 1:
-            print('WARNING: The "nthreads" keyword ({}) in the &control section must be a positive integer'.format(keyword_val))
-            is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('nthreads', possible_keywords_and_defaults, int, is_valid, checked_keywords)
-
-    # Validate the custom_sbatch_args keyword
-    checked_keywords = check_keyword('custom_sbatch_args', possible_keywords_and_defaults, str, no_validation('custom_sbatch_args'), checked_keywords)
-
-    # Validate the mem_per_cpu keyword
-    def is_valid(keyword_val):
-        if keyword_val < 1:
-            print('WARNING: The "mem_per_cpu" keyword ({}) in the &control section must be a positive integer (expressing memory size in GB)'.format(keyword_val))
-            is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('mem_per_cpu', possible_keywords_and_defaults, int, is_valid, checked_keywords)
-
-    # Validate the project keyword
-    checked_keywords = check_keyword('project', possible_keywords_and_defaults, str, no_validation('project'), checked_keywords)
-
-    # Validate the dl_backend keyword
-    def is_valid(keyword_val):
-        if keyword_val.lower() not in valid_dl_backends:
-            print('WARNING: The "dl_backend" keyword ({}) in the &control section must be one of'.format(keyword_val), valid_dl_backends)
-            is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('dl_backend', possible_keywords_and_defaults, str, is_valid, checked_keywords)
-
-    # Validate the supp_modules keyword
-    checked_keywords = check_keyword('supp_modules', possible_keywords_and_defaults, str, no_validation('supp_modules'), checked_keywords)
-
-    # Validate the python_bin_path keyword
-    def is_valid(keyword_val):
-        if keyword_val != '': # remember its default value is probably blank
-            import os
-            if os.path.isdir(keyword_val):
-                is_valid2 = True
-            else:
-                print('WARNING: The "python_bin_path" keyword ({}) in the &control section does not appear to be a directory'.format(keyword_val))
-                is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('python_bin_path', possible_keywords_and_defaults, str, is_valid, checked_keywords)
-
-    # Validate the exec_python_module keyword
-    checked_keywords = check_keyword('exec_python_module', possible_keywords_and_defaults, str, no_validation('exec_python_module'), checked_keywords)
-
-    # Validate the supp_pythonpath keyword
-    checked_keywords = check_keyword('supp_pythonpath', possible_keywords_and_defaults, str, no_validation('supp_pythonpath'), checked_keywords)
-
-    # Validate the extra_script_args keyword
-    checked_keywords = check_keyword('extra_script_args', possible_keywords_and_defaults, str, no_validation('extra_script_args'), checked_keywords)
-
-    # Validate the exec_r_module keyword
-    checked_keywords = check_keyword('exec_r_module', possible_keywords_and_defaults, str, no_validation('exec_r_module'), checked_keywords)
-
-    # Validate the supp_r_libs keyword
-    checked_keywords = check_keyword('supp_r_libs', possible_keywords_and_defaults, str, no_validation('supp_r_libs'), checked_keywords)
-
-    # Validate the run_workflow keyword
-    def is_valid(keyword_val):
-        if keyword_val not in [0,1]:
-            print('WARNING: The "run_workflow" keyword ({}) in the &control section must be either 0 or 1'.format(keyword_val))
-            is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('run_workflow', possible_keywords_and_defaults, int, is_valid, checked_keywords)
-
-    # Validate the dry_run keyword
-    def is_valid(keyword_val):
-        if keyword_val not in [0,1]:
-            print('WARNING: The "dry_run" keyword ({}) in the &control section must be either 0 or 1'.format(keyword_val))
-            is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('dry_run', possible_keywords_and_defaults, int, is_valid, checked_keywords)
-
-    # Validate the queue keyword
-    checked_keywords = check_keyword('queue', possible_keywords_and_defaults, str, no_validation('queue'), checked_keywords)
-
-    # Validate the default_model_file keyword
-    def is_valid(keyword_val):
-        if keyword_val != '': # remember its default value is probably blank
-            try:
-                with open(keyword_val):
-                    is_valid2 = True
-            except IOError:
-                print('WARNING: The file "{}" from the "default_model_file" keyword cannot be opened for reading'.format(keyword_val))
-                is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('default_model_file', possible_keywords_and_defaults, str, is_valid, checked_keywords)
-
-    # Validate the param_space_file keyword
-    def is_valid(keyword_val):
-        if keyword_val != '': # remember its default value is probably blank
-            try:
-                with open(keyword_val):
-                    is_valid2 = True
-            except IOError:
-                print('WARNING: The file "{}" from the "param_space_file" keyword cannot be opened for reading'.format(keyword_val))
-                is_valid2 = False
-        else:
-            is_valid2 = True
-        return(is_valid2)
-    checked_keywords = check_keyword('param_space_file', possible_keywords_and_defaults, str, is_valid, checked_keywords)
-
+    # Load the keywords set in the input file from the environment variables exported by command_script.sh and their locations from the input file itself, if it's still there
+    keyword_values = {name[len('CANDLE_KEYWORD_'):].lower(): value for name, value in os.environ.items() if name.startswith('CANDLE_KEYWORD_') and (len(name) > len('CANDLE_KEYWORD_'))}
+    locations = dict()
+    input_file = os.getenv('CANDLE_INPUT_FILE')
+    if input_file and os.path.isfile(input_file):
+        parsed_input_file = input_file_parser.parse(input_file)
+        locations = {keyword: parsed_input_file.get_keyword_location(keyword) for keyword in keyword_values}
+
+    # Validate all the keywords at once, saving the report
+    report = keyword_schema.validate(keyword_values, site, locations)
+    try:
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+    except OSError as e:
+        print('WARNING: Could not write the keyword validation report {}: {}'.format(report_file, e))
+
+    # Output all the problems found before quitting if any keyword is invalid
+    for problem in report['warnings']:
+        print('WARNING: {}'.format(keyword_schema.format_problem(problem)))
+    for problem in report['errors']:
+        print('ERROR: {}'.format(keyword_schema.format_problem(problem)))
+    if not report['valid']:
+        exit(1)
 
     # Output the checked keywords and their validated values
-    dict_output(checked_keywords, 'Checked and validated keywords in the input file:')
+    dict_output(report['keywords'], 'Checked and validated keywords in the input file:')
 
-    return(checked_keywords)
+    return(report['keywords'])
 
 
 def export_bash_variables(keywords):
@@ -288,11 +95,29 @@ def export_bash_variables(keywords):
     file_containing_export_statements = os.path.join(os.getenv('CANDLE_SUBMISSION_DIR'), 'candle_generated_files', 'preprocessed_vars_to_export.sh')
 
     # General logic
-    if keywords['workflow'] == 'grid':
+    if keywords['workflow'] in ('grid', 'hyperband'):
         nswift_t_processes = 1
     elif keywords['workflow'] == 'bayesian':
         nswift_t_processes = 2
     ntasks_total = nswift_t_processes + keywords['nworkers']
+    site = os.getenv('SITE')
+
+    # Determine how many evaluations to run concurrently on each GPU, from either the declared or the measured (by a pilot run) GPU usage of an evaluation
+    evals_per_gpu = 1
+    if (keywords['gpu_packing'] != 'none') and (keywords.get('worker_type', 'gpu') != 'cpu'):
+        import gpu_packing
+        eval_gpu_usage = (keywords['eval_gpu_memory'], keywords['eval_gpu_utilization'])
+        if keywords['gpu_packing'] == 'profile':
+            eval_gpu_usage = gpu_packing.read_profile()
+            if eval_gpu_usage is None:
+                print('WARNING: No GPU usage measured by a pilot run was found in {} (run the job once with run_workflow=0 to measure it); not packing evaluations onto the GPUs'.format(gpu_packing.get_profile_file()))
+        if eval_gpu_usage is not None:
+            gpu_memory_gb = gpu_packing.GPU_MEMORY_GB.get(keywords['worker_type'], gpu_packing.SUMMIT_GPU_MEMORY_GB) if site == 'biowulf' else gpu_packing.SUMMIT_GPU_MEMORY_GB
+            evals_per_gpu = gpu_packing.get_evals_per_gpu(eval_gpu_usage[0], eval_gpu_usage[1], gpu_memory_gb)
+            print('NOTE: Packing {} evaluations onto each {} GB GPU given an evaluation\'s peak GPU memory of {} GB (0 if unknown) and GPU utilization of {}'.format(evals_per_gpu, gpu_memory_gb, *eval_gpu_usage))
+            if (site in ('summit-tf1', 'summit-tf2')) and (keywords['scheduler'] == 'async') and (evals_per_gpu > 1):
+                print('NOTE: Not packing evaluations onto the GPUs after all, as the asynchronous scheduler runs each evaluation as its own jsrun step and a Summit resource set can\'t share its GPU with another step')
+                evals_per_gpu = 1
 
     # Allow for replacing the contents of the &default_model and &param_space sections with keywords pointing to corresponding files
     if keywords['default_model_file'] == '':
@@ -301,23 +126,24 @@ def export_bash_variables(keywords):
         keywords['param_space_file'] = os.getenv('CANDLE_WORKFLOW_SETTINGS_FILE')
 
     # Split into one block for each site
-    site = os.getenv('SITE')
     if site == 'summit-tf1' or site == 'summit-tf2':
 
         ## Site-dependent logic
-        nnodes = int(np.ceil(ntasks_total/6))
+        # Each resource set (one GPU and its 7 cores) holds evals_per_gpu tasks, so PROCS and PPN count resource sets rather than tasks
+        nnodes = int(np.ceil(ntasks_total/(6*evals_per_gpu)))
         ppn = 6
         ntasks_total_orig = ntasks_total
-        ntasks_total = ppn * nnodes
+        ntasks_total = ppn * nnodes * evals_per_gpu
+        nthreads_per_task = max(1, 7 // evals_per_gpu)
 
         if ntasks_total != ntasks_total_orig:
             print('NOTE: Requested number of workers ({}) has been increased to {} in order to *fill* the required number of nodes ({})'.format(keywords['nworkers'], ntasks_total-nswift_t_processes, nnodes))
 
         # Write the file that exports the Bash environment variables
         with open(file_containing_export_statements, 'w') as f:
-            f.write('export PROCS={}\n'.format(ntasks_total))
+            f.write('export PROCS={}\n'.format(ppn * nnodes))
             f.write('export PPN=6\n')
-            f.write('export TURBINE_LAUNCH_OPTIONS="--tasks_per_rs=1 --cpu_per_rs=7 --gpu_per_rs=1 --bind=packed:7 --launch_distribution=packed -E OMP_NUM_THREADS=7"\n')
+            f.write('export TURBINE_LAUNCH_OPTIONS="--tasks_per_rs={} --cpu_per_rs=7 --gpu_per_rs=1 --bind=packed:{} --launch_distribution=packed -E OMP_NUM_THREADS={}"\n'.format(evals_per_gpu, nthreads_per_task, nthreads_per_task))
             f.write('export PROJECT={}\n'.format(keywords['project']))
             f.write('export NODES={}\n'.format(nnodes))
             f.write('export WALLTIME={}\n'.format(keywords['walltime'])) # [hours:]minutes
@@ -334,6 +160,22 @@ def export_bash_variables(keywords):
             f.write('export QUEUE={}\n'.format(keywords['queue']))
             f.write('export CANDLE_DEFAULT_MODEL_FILE={}\n'.format(keywords['default_model_file']))
             f.write('export CANDLE_WORKFLOW_SETTINGS_FILE={}\n'.format(keywords['param_space_file']))
+            f.write('export CANDLE_PERSISTENT_WORKER={}\n'.format(keywords['persistent_worker']))
+            f.write('export CANDLE_STAGE_LOCALLY={}\n'.format(keywords['stage_locally']))
+            f.write('export CANDLE_STAGED_OUTPUTS="{}"\n'.format(keywords['staged_outputs'])) # quoted so that the patterns aren't expanded when this file is sourced
+            f.write('export CANDLE_PRUNING={}\n'.format(keywords['pruning']))
+            f.write('export CANDLE_PRUNING_WARMUP_STEPS={}\n'.format(keywords['pruning_warmup_steps']))
+            f.write('export CANDLE_HYPERBAND_MAX_BUDGET={}\n'.format(keywords['hyperband_max_budget']))
+            f.write('export CANDLE_HYPERBAND_ETA={}\n'.format(keywords['hyperband_eta']))
+            f.write('export CANDLE_HYPERBAND_BUDGET_PARAM={}\n'.format(keywords['hyperband_budget_param']))
+            f.write('export CANDLE_SCHEDULER={}\n'.format(keywords['scheduler']))
+            f.write('export CANDLE_EVALS_PER_GPU={}\n'.format(evals_per_gpu))
+            f.write('export CANDLE_MEMOIZE_RESULTS={}\n'.format(keywords['memoize_results']))
+            f.write('export CANDLE_PROFILE_INTERVAL={}\n'.format(keywords['profile_interval']))
+            if evals_per_gpu > 1:
+                f.write('export TF_FORCE_GPU_ALLOW_GROWTH=true\n') # keep each packed evaluation from reserving the whole GPU's memory
+            f.write('export CANDLE_NWORKERS={}\n'.format(ntasks_total - nswift_t_processes))
+            f.write('export CANDLE_EVALUATION_LAUNCHER="jsrun --nrs=1 --tasks_per_rs=1 --cpu_per_rs={0} --gpu_per_rs=1 --rs_per_host=1 --bind=packed:{0} --launch_distribution=packed -E OMP_NUM_THREADS={0}"\n'.format(nthreads_per_task)) # one resource set per evaluation run by async_scheduler.py (never packed, see above)
 
     elif site == 'biowulf':
 
@@ -367,19 +209,33 @@ def export_bash_variables(keywords):
         else: # GPU job
             partition = 'gpu'
             gres = keywords['worker_type']
-            nodes = W
-            ntasks_per_node = 1 + int(np.ceil(S/W))
+            # Use up to all the GPUs of each node (or gpus_per_node of them if set), each shared by evals_per_gpu workers, so that large jobs need few nodes
+            import gpu_packing
+            max_gpus_per_node = gpu_packing.GPUS_PER_NODE.get(gres, 1)
+            if keywords['gpus_per_node'] > 0:
+                max_gpus_per_node = min(keywords['gpus_per_node'], max_gpus_per_node)
+            if (max_gpus_per_node == 1) or (W <= evals_per_gpu): # one GPU per node, shared by all the tasks on the node (the S Swift/T processes don't use it)
+                nodes = int(np.ceil(W/evals_per_gpu))
+                ngpus_per_node = 1
+                ntasks_per_node = int(np.ceil(ntasks/nodes))
+            else:
+                # Slurm may place the S Swift/T processes on any node, so every task gets its own slot on one of its node's GPUs; as a node then holds at most ngpus_per_node*evals_per_gpu tasks, binding them to GPUs by SLURM_LOCALID (in model_wrapper.sh) never puts more than evals_per_gpu workers on a GPU
+                nodes = int(np.ceil(ntasks/(max_gpus_per_node*evals_per_gpu)))
+                ntasks_per_node = int(np.ceil(ntasks/nodes))
+                ngpus_per_node = int(np.ceil(ntasks_per_node/evals_per_gpu))
         cpus_per_task = T
 
         # Write the file that exports the Bash environment variables
         with open(file_containing_export_statements, 'w') as f:
             f.write('export PROCS={}\n'.format(ntasks))
             if gres is not None:
-                f.write('export TURBINE_SBATCH_ARGS="--gres=gpu:{}:1 {} --mem-per-cpu={}G --cpus-per-task={} --ntasks-per-core={} --nodes={}"\n'.format(gres, keywords['custom_sbatch_args'], keywords['mem_per_cpu'], cpus_per_task, ntasks_per_core, nodes))
+                f.write('export TURBINE_SBATCH_ARGS="--gres=gpu:{}:{} {} --mem-per-cpu={}G --cpus-per-task={} --ntasks-per-core={} --nodes={}"\n'.format(gres, ngpus_per_node, keywords['custom_sbatch_args'], keywords['mem_per_cpu'], cpus_per_task, ntasks_per_core, nodes))
                 f.write('export TURBINE_LAUNCH_OPTIONS="--ntasks={} --distribution=cyclic"\n'.format(ntasks))
+                f.write('export CANDLE_BIND_GPUS={}\n'.format(int(ngpus_per_node > 1))) # have each worker bind itself to one of its node's GPUs (model_wrapper.sh by task index or async_scheduler.py by worker slot)
             else:
                 f.write('export TURBINE_SBATCH_ARGS="{} --mem-per-cpu={}G --cpus-per-task={} --ntasks-per-core={} --nodes={}"\n'.format(keywords['custom_sbatch_args'], keywords['mem_per_cpu'], cpus_per_task, ntasks_per_core, nodes))
             f.write('export QUEUE={}\n'.format(partition))
+            f.write('export CANDLE_WORKER_TYPE={}\n'.format(keywords['worker_type']))
             f.write('export PPN={}\n'.format(ntasks_per_node))
             f.write('export WALLTIME={}\n'.format(keywords['walltime'])) # hours:minutes:seconds
             f.write('export CANDLE_DL_BACKEND={}\n'.format(keywords['dl_backend'])) # note that while we didn't have to export e.g. the workflow keyword, that's because it was mandatory; since dl_backend is an optional keyword, it's not necessarily already exported by command_script.sh as CANDLE_KEYWORD_DL_BACKEND, so we need to make sure we export it, but this time as CANDLE_DL_BACKEND since it's essentially been processed (checked) here
@@ -394,6 +250,25 @@ def export_bash_variables(keywords):
             f.write('export CANDLE_DRY_RUN={}\n'.format(keywords['dry_run']))
             f.write('export CANDLE_DEFAULT_MODEL_FILE={}\n'.format(keywords['default_model_file']))
             f.write('export CANDLE_WORKFLOW_SETTINGS_FILE={}\n'.format(keywords['param_space_file']))
+            f.write('export CANDLE_PERSISTENT_WORKER={}\n'.format(keywords['persistent_worker']))
+            f.write('export CANDLE_STAGE_LOCALLY={}\n'.format(keywords['stage_locally']))
+            f.write('export CANDLE_STAGED_OUTPUTS="{}"\n'.format(keywords['staged_outputs'])) # quoted so that the patterns aren't expanded when this file is sourced
+            f.write('export CANDLE_PRUNING={}\n'.format(keywords['pruning']))
+            f.write('export CANDLE_PRUNING_WARMUP_STEPS={}\n'.format(keywords['pruning_warmup_steps']))
+            f.write('export CANDLE_HYPERBAND_MAX_BUDGET={}\n'.format(keywords['hyperband_max_budget']))
+            f.write('export CANDLE_HYPERBAND_ETA={}\n'.format(keywords['hyperband_eta']))
+            f.write('export CANDLE_HYPERBAND_BUDGET_PARAM={}\n'.format(keywords['hyperband_budget_param']))
+            f.write('export CANDLE_SCHEDULER={}\n'.format(keywords['scheduler']))
+            f.write('export CANDLE_EVALS_PER_GPU={}\n'.format(evals_per_gpu))
+            f.write('export CANDLE_MEMOIZE_RESULTS={}\n'.format(keywords['memoize_results']))
+            f.write('export CANDLE_PROFILE_INTERVAL={}\n'.format(keywords['profile_interval']))
+            if evals_per_gpu > 1:
+                f.write('export TF_FORCE_GPU_ALLOW_GROWTH=true\n') # keep each packed evaluation from reserving the whole GPU's memory
+            f.write('export CANDLE_NWORKERS={}\n'.format(ntasks - S))
+            if (gres is not None) and ((ngpus_per_node > 1) or (evals_per_gpu > 1)):
+                f.write('export CANDLE_EVALUATION_LAUNCHER="srun --overlap --cpu-bind=none --nodes=1 --ntasks=1 --cpus-per-task={} --relative={{node}}"\n'.format(cpus_per_task)) # one job step per evaluation run by async_scheduler.py, placed on the node of its worker slot and seeing all the node's GPUs (a step can't share a GPU allocated to another), so that the evaluation binds itself to the GPU of its slot
+            else:
+                f.write('export CANDLE_EVALUATION_LAUNCHER="srun --exclusive --nodes=1 --ntasks=1 --cpus-per-task={}{}"\n'.format(cpus_per_task, '' if gres is None else ' --gres=gpu:{}:1'.format(gres))) # one job step per evaluation run by async_scheduler.py
 
     else:
 
@@ -412,7 +287,7 @@ def main():
     """
 
     # Check the input settings and return the resulting required and optional variables (in a single dictionary) that we'll need later
-    checked_keywords = check_keywords('CANDLE_POSSIBLE_KEYWORDS_AND_DEFAULTS')
+    checked_keywords = check_keywords()
 
     # Apply logic to the checked keywords and export the Bash variables needed for later to a file, to subsequently be sourced back in in run_workflows.sh
     export_bash_variables(checked_keywords)
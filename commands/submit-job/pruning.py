@@ -0,0 +1,223 @@
+# Early stopping ("pruning") of evaluations whose intermediate results show they are unlikely to be competitive
+# The model reports intermediate values via candle_report() or the Keras callback candle_pruning_callback() (both made available by head.py), which append them to candle_intermediate_values.jsonl in the evaluation directory
+# candle_compliant_wrapper.py watches that file while the model runs and, if the policy set by the pruning keyword decides to stop the evaluation, creates the file candle_prune_requested, upon which the next report ends the model; the evaluation then returns the best value reported so far
+# ASSUMPTIONS: candle is run the normal way via "candle submit-job ...", which defines the variables $CANDLE_PRUNING and $CANDLE_PRUNING_WARMUP_STEPS (preprocess.py)
+
+import os
+import json
+
+
+INTERMEDIATE_VALUES_FILE = 'candle_intermediate_values.jsonl'
+PRUNE_FLAG_FILE = 'candle_prune_requested'
+EVAL_DIR_ENV = 'CANDLE_EVALUATION_DIR'  # set by candle_compliant_wrapper.py/persistent_worker.py since the model may run elsewhere (e.g., when staged)
+POLICIES = ('none', 'median', 'successive_halving')
+CHECK_INTERVAL = 10  # seconds between checks of a running evaluation
+MIN_PEER_EVALUATIONS = 5  # number of finished evaluations that must have reached a step before the median rule compares against them
+REDUCTION_FACTOR = 3  # successive halving keeps the top 1/REDUCTION_FACTOR of the evaluations at each rung
+
+
+class EvaluationPruned(SystemExit):
+    """
+    Raised by report() to end a model whose evaluation has been pruned; being a SystemExit, it ends the wrapped model as a normal exit would
+    """
+
+
+def get_eval_dir():
+    """
+    Return the directory of the current evaluation
+    """
+    return os.getenv(EVAL_DIR_ENV, '.')
+
+
+def report(step, value):
+    """
+    Record an intermediate value of the objective (which is minimized) and end the model if the evaluation has been pruned
+    Arguments:
+        step: int
+            The step (e.g., epoch) at which the value was obtained, increasing with each report
+        value: float
+            The value of the objective at that step
+    """
+    eval_dir = get_eval_dir()
+    with open(os.path.join(eval_dir, INTERMEDIATE_VALUES_FILE), 'a') as f:
+        f.write(json.dumps({'step': step, 'value': float(value)}) + '\n')
+    if os.path.exists(os.path.join(eval_dir, PRUNE_FLAG_FILE)):
+        print('Pruning the evaluation at step {} as requested by the early-stopping policy'.format(step), flush=True)
+        raise EvaluationPruned(0)
+
+
+def keras_callback(monitor='val_loss'):
+    """
+    Return a Keras callback that reports the value of a metric at the end of every epoch, to be passed to model.fit(..., callbacks=[...])
+    Arguments:
+        monitor: str
+            Name of the metric in the epoch logs to report
+
+    Returns: keras.callbacks.Callback
+    """
+    try:
+        from tensorflow.keras.callbacks import Callback
+    except ImportError:
+        from keras.callbacks import Callback
+
+    class PruningCallback(Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            if logs and (monitor in logs):
+                report(epoch + 1, logs[monitor])
+
+    return PruningCallback()
+
+
+def read_intermediate_values(filename, offset=0):
+    """
+    Read the intermediate values appended to a file since a given offset
+    Arguments:
+        filename: str
+            Path to the intermediate values file
+        offset: int
+            Byte offset up to which the file has already been read
+
+    Returns: tuple
+        (values, offset), where values is a list of (step, value) tuples and offset is the position up to which complete lines have been read
+    """
+    values = []
+    try:
+        with open(filename, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):  # a line still being written
+                    break
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                    values.append((record['step'], float(record['value'])))
+                except (ValueError, KeyError, TypeError):
+                    pass
+    except OSError:
+        pass
+    return values, offset
+
+
+def best_up_to(values, step):
+    """
+    Return the best (lowest) value reported at or before a step, or None if there is none
+    """
+    candidates = [value for value_step, value in values if value_step <= step]
+    return min(candidates) if candidates else None
+
+
+def median_rule(values, peer_values, warmup_steps):
+    """
+    Median stopping rule: prune if the best value so far is worse than the median of the best values that the peer evaluations had reached by the same step
+    Arguments:
+        values: list
+            (step, value) tuples of the current evaluation
+        peer_values: dict
+            (step, value) tuples of each of the other evaluations
+        warmup_steps: int
+            Number of steps before which an evaluation is never pruned
+
+    Returns: bool
+        Whether to prune the current evaluation
+    """
+    import statistics
+    step = values[-1][0]
+    if step < warmup_steps:
+        return False
+    peer_bests = [x for x in (best_up_to(y, step) for y in peer_values.values() if y and y[-1][0] >= step) if x is not None]
+    if len(peer_bests) < MIN_PEER_EVALUATIONS:
+        return False
+    return best_up_to(values, step) > statistics.median(peer_bests)
+
+
+def successive_halving_rule(values, peer_values, warmup_steps):
+    """
+    Asynchronous successive halving: at each rung (warmup_steps * REDUCTION_FACTOR**k steps) reached, prune unless the best value so far is in the top 1/REDUCTION_FACTOR of those the peer evaluations had at that rung
+    Arguments:
+        values: list
+            (step, value) tuples of the current evaluation
+        peer_values: dict
+            (step, value) tuples of each of the other evaluations
+        warmup_steps: int
+            Step of the first rung
+
+    Returns: bool
+        Whether to prune the current evaluation
+    """
+    import math
+    step = values[-1][0]
+    rung = max(warmup_steps, 1)
+    if step < rung:
+        return False
+    while rung * REDUCTION_FACTOR <= step:
+        rung *= REDUCTION_FACTOR
+    rung_values = [x for x in (best_up_to(y, rung) for y in peer_values.values() if y and y[-1][0] >= rung) if x is not None]
+    if len(rung_values) < REDUCTION_FACTOR - 1:
+        return False
+    rung_values = sorted(rung_values + [best_up_to(values, rung)])
+    return best_up_to(values, rung) > rung_values[math.ceil(len(rung_values) / REDUCTION_FACTOR) - 1]
+
+
+class PruningMonitor:
+    """
+    Watch the intermediate values of a running evaluation and request that it be pruned when the policy says so
+    """
+
+    def __init__(self, eval_dir, policy='none', warmup_steps=1):
+        self.eval_dir = eval_dir
+        self.policy = policy
+        self.warmup_steps = warmup_steps
+        self.values = []
+        self.offset = 0
+        self.pruned = False
+        self.nchecked = 0
+
+        # Start from a clean slate in case the evaluation is being rerun
+        for filename in (INTERMEDIATE_VALUES_FILE, PRUNE_FLAG_FILE):
+            try:
+                os.remove(os.path.join(eval_dir, filename))
+            except OSError:
+                pass
+
+    def update(self):
+        """
+        Read the values reported since the last update
+        """
+        new_values, self.offset = read_intermediate_values(os.path.join(self.eval_dir, INTERMEDIATE_VALUES_FILE), self.offset)
+        self.values += new_values
+
+    def get_peer_values(self):
+        """
+        Return the intermediate values of the other finished evaluations of the same launch, as recorded in the experiment index
+        """
+        import experiment_index
+        location = experiment_index.locate_evaluation(self.eval_dir)
+        if location is None:
+            return {}
+        index_file, launch, evaluation = location
+        return experiment_index.query_intermediate_values(os.path.dirname(index_file), launch, exclude_eval_dir=self.eval_dir)
+
+    def check(self):
+        """
+        Read the newly reported values and, if there are any and the policy says so, request that the evaluation be pruned
+
+        Returns: bool
+            Whether the evaluation has been pruned
+        """
+        self.update()
+        if self.pruned or (self.policy == 'none') or (len(self.values) == self.nchecked):
+            return self.pruned
+        self.nchecked = len(self.values)
+        rule = median_rule if self.policy == 'median' else successive_halving_rule
+        if rule(self.values, self.get_peer_values(), self.warmup_steps):
+            with open(os.path.join(self.eval_dir, PRUNE_FLAG_FILE), 'w') as f:
+                f.write('{}\n'.format(self.values[-1][0]))
+            self.pruned = True
+            print('Requested that the evaluation be pruned at step {} using the {} policy'.format(self.values[-1][0], self.policy))
+        return self.pruned
+
+    def get_best_value(self):
+        """
+        Return the best value reported so far, or None if there is none
+        """
+        return min(value for _, value in self.values) if self.values else None
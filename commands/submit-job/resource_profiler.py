@@ -0,0 +1,262 @@
+# Profiling of the resources (CPU, memory, I/O, and GPU) used by each evaluation, so that the hyperparameter sets that make evaluations memory-bound or I/O-bound can be found and the mem_per_cpu and nthreads keywords sized from measurements
+# candle_compliant_wrapper.py samples the process tree running the model (model_wrapper.sh and everything it starts, or the persistent worker) every $CANDLE_PROFILE_INTERVAL seconds (the profile_interval keyword) and writes the measurements to resource_profile.json in the evaluation directory alongside result.txt; aggregate_results.py then summarizes the profiles of an experiment
+# The CPU, memory, and I/O are read from /proc, so that nothing beyond the standard library is needed; the GPUs are sampled via nvidia-smi (see gpu_packing.py) and are simply left out of the profile on nodes without one
+# ASSUMPTIONS: Linux (for /proc)
+
+import os
+import json
+import math
+import time
+
+import gpu_packing
+
+
+PROFILE_FILE = 'resource_profile.json'  # in the evaluation directory
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100  # units of the CPU times in /proc/<PID>/stat
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096  # units of the memory in /proc/<PID>/stat
+MEMORY_BOUND_FRACTION = 0.8  # an evaluation whose peak memory is at least this fraction of the memory available to it is memory-bound
+CPU_BOUND_FRACTION = 0.8  # an evaluation keeping at least this fraction of its CPUs busy on average is CPU-bound
+GPU_BOUND_UTILIZATION = 80  # an evaluation keeping its GPU(s) at least this busy (in percent) on average is GPU-bound
+IO_BOUND_MB_PER_S = 50  # an evaluation reading and writing at least this fast on average while leaving more than half of its CPUs idle is I/O-bound
+MEMORY_HEADROOM = 1.2  # factor by which to exceed the largest peak memory when suggesting mem_per_cpu
+
+
+def read_processes():
+    """
+    Return the parent PID, CPU time (in seconds), and resident memory (in bytes) of every process on the node by PID, skipping processes that end while being read
+    """
+    processes = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(entry)) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        fields = stat[stat.rindex(')') + 2:].split()  # the command name in parentheses may itself contain spaces
+        processes[int(entry)] = (int(fields[1]), (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, int(fields[21]) * PAGE_SIZE)
+    return processes
+
+
+def read_io_bytes(pid):
+    """
+    Return the (bytes read, bytes written) by a process via system calls (i.e., including cached and network filesystem I/O), or None if they can't be read
+    """
+    try:
+        with open('/proc/{}/io'.format(pid)) as f:
+            counters = dict(line.split(':') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def get_tree(root_pid, processes):
+    """
+    Return the PIDs of a process and all its descendants given the processes returned by read_processes()
+    """
+    children = {}
+    for pid, (ppid, _, _) in processes.items():
+        children.setdefault(ppid, []).append(pid)
+    tree, pending = [], [root_pid] if root_pid in processes else []
+    while pending:
+        pid = pending.pop()
+        tree.append(pid)
+        pending += children.get(pid, [])
+    return tree
+
+
+def get_ncpus():
+    """
+    Return the number of CPUs this process may run on (e.g., those allocated to the evaluation by Slurm)
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count()
+
+
+def get_cgroup_dirs():
+    """
+    Return the directories of the memory control groups this process is in (e.g., the Slurm job step's), from its own group up to the root, per /proc/self/cgroup
+    """
+    try:
+        with open('/proc/self/cgroup') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    entries = [line.split(':', 2) for line in lines if line.count(':') >= 2]
+    v1_paths = [path for _, controllers, path in entries if 'memory' in controllers.split(',')]
+    v2_paths = [path for hierarchy, controllers, path in entries if (hierarchy == '0') and (controllers == '')]
+    if v1_paths:
+        root, path = '/sys/fs/cgroup/memory', v1_paths[0]
+    elif v2_paths:
+        root, path = '/sys/fs/cgroup', v2_paths[0]
+    else:
+        return []
+    dirs = []
+    while True:
+        dirs.append(root + path.rstrip('/'))
+        if path in ('', '/'):
+            return dirs
+        path = os.path.dirname(path)
+
+
+def get_memory_limit_gb():
+    """
+    Return the memory (in GB) available to this process per its control groups (e.g., as allocated by Slurm to its job), i.e., the tightest limit of its own group and those containing it, or None if it isn't limited
+    """
+    limits = []
+    for cgroup_dir in get_cgroup_dirs():
+        for filename in ('memory.max', 'memory.limit_in_bytes'):
+            try:
+                with open(os.path.join(cgroup_dir, filename)) as f:
+                    limit = f.read().strip()
+            except OSError:
+                continue
+            if limit.isdigit() and (int(limit) < 2 ** 60):  # cgroup v1 reports an unlimited group as a huge number and v2 as "max"
+                limits.append(int(limit))
+    return min(limits) / 1024 ** 3 if limits else None
+
+
+class ResourceProfiler:
+    """
+    Sample the CPU, memory, I/O, and GPU usage of the process tree running an evaluation
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.root_pid = None
+        self.gpu = True  # until nvidia-smi has been found not to work
+        self.samples = {'time': [], 'cpu_percent': [], 'rss_mb': [], 'read_mb': [], 'write_mb': [], 'gpu_utilization': [], 'gpu_memory_mb': []}
+
+    def start(self, root_pid):
+        """
+        Start profiling the process with PID root_pid and its descendants, counting only the resources they use from now on (e.g., not those used by the persistent worker on earlier evaluations)
+        """
+        self.root_pid = root_pid
+        self.start_time = time.time()
+        self.cpu_seconds, self.io_bytes = {}, {}  # last values read for each process in the tree, kept after it ends so that its usage still counts
+        self.cpu_seconds_total = 0
+        self.peak_rss = 0
+        self.read_counters()
+        self.baseline_cpu_seconds, self.baseline_io_bytes = dict(self.cpu_seconds), dict(self.io_bytes)
+        self.last_time = self.start_time
+
+    def read_counters(self):
+        """
+        Update the CPU time and I/O of each process in the tree and return its current resident memory (in bytes)
+        """
+        processes = read_processes()
+        rss = 0
+        self.pids = get_tree(self.root_pid, processes)
+        for pid in self.pids:
+            _, self.cpu_seconds[pid], pid_rss = processes[pid]
+            rss += pid_rss
+            io_bytes = read_io_bytes(pid)
+            if io_bytes is not None:
+                self.io_bytes[pid] = io_bytes
+        return rss
+
+    def sample(self):
+        """
+        Record the current CPU usage (in percent of one CPU, averaged since the last sample), resident memory, cumulative I/O, and GPU usage of the process tree
+        The GPU usage is that of the GPU(s) the evaluation is bound to (see gpu_packing.get_bound_gpus()), its memory being that of the processes of the tree where nvidia-smi reports them; the utilization of a GPU shared by packed evaluations includes theirs, as nvidia-smi doesn't break it down by process
+        """
+        if self.root_pid is None:
+            return
+        rss = self.read_counters()
+        now = time.time()
+        cpu_seconds_total = sum(seconds - self.baseline_cpu_seconds.get(pid, 0) for pid, seconds in self.cpu_seconds.items())
+        read_bytes = sum(io_bytes[0] - self.baseline_io_bytes.get(pid, (0, 0))[0] for pid, io_bytes in self.io_bytes.items())
+        write_bytes = sum(io_bytes[1] - self.baseline_io_bytes.get(pid, (0, 0))[1] for pid, io_bytes in self.io_bytes.items())
+        self.samples['time'].append(round(now - self.start_time, 2))
+        self.samples['cpu_percent'].append(round(100 * (cpu_seconds_total - self.cpu_seconds_total) / max(now - self.last_time, 1e-6), 1))
+        self.samples['rss_mb'].append(round(rss / 1024 ** 2, 1))
+        self.samples['read_mb'].append(round(read_bytes / 1024 ** 2, 1))
+        self.samples['write_mb'].append(round(write_bytes / 1024 ** 2, 1))
+        self.cpu_seconds_total, self.last_time = cpu_seconds_total, now
+        self.peak_rss = max(self.peak_rss, rss)
+        if self.gpu:
+            usage = gpu_packing.query_gpus()
+            if usage is None:
+                self.gpu = False
+            else:
+                memory = gpu_packing.query_gpu_processes(self.pids)  # only the evaluation's own memory if others are packed onto its GPU
+                self.samples['gpu_memory_mb'].append(round(usage[0] if memory is None else memory, 1))
+                self.samples['gpu_utilization'].append(round(usage[1], 1))
+
+    def save(self, filename=PROFILE_FILE):
+        """
+        Write the summary of the samples followed by the samples themselves to a JSON file
+        The usage since the last sample isn't counted, as the processes have usually ended by now
+        """
+        if not self.samples['time']:
+            print('No resource profile of the evaluation has been written, as it ended before the first sample')
+            return
+        sampled_duration = self.samples['time'][-1]
+        samples = {key: values for key, values in self.samples.items() if values}
+        profile = {
+            'interval': self.interval,
+            'duration': round(time.time() - self.start_time, 2),
+            'nsamples': len(self.samples['time']),
+            'ncpus': get_ncpus(),
+            'memory_limit_gb': get_memory_limit_gb(),
+            'cpu_percent_mean': round(100 * self.cpu_seconds_total / max(sampled_duration, 1e-6), 1),
+            'cpu_percent_max': max(self.samples['cpu_percent']),
+            'rss_gb_max': round(self.peak_rss / 1024 ** 3, 3),
+            'rss_gb_mean': round(sum(self.samples['rss_mb']) / len(self.samples['rss_mb']) / 1024, 3),
+            'read_mb': self.samples['read_mb'][-1],
+            'write_mb': self.samples['write_mb'][-1],
+            'gpu_utilization_mean': round(sum(self.samples['gpu_utilization']) / len(self.samples['gpu_utilization']), 1) if self.samples['gpu_utilization'] else None,
+            'gpu_memory_gb_max': round(max(self.samples['gpu_memory_mb']) / 1024, 3) if self.samples['gpu_memory_mb'] else None,
+            'samples': samples
+        }
+        try:
+            with open(filename, 'w') as f:
+                json.dump(profile, f, separators=(',', ':'))
+        except OSError as e:
+            print('WARNING: Could not write the resource profile of the evaluation to {}: {}'.format(filename, e))
+
+
+def read_profile(eval_dir):
+    """
+    Return the resource profile written to an evaluation directory, or None if there isn't one
+    """
+    try:
+        with open(os.path.join(eval_dir, PROFILE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def get_io_rate(profile):
+    """
+    Return the average rate (in MB/s) at which an evaluation read and wrote while it was sampled
+    """
+    return (profile['read_mb'] + profile['write_mb']) / max(profile['samples']['time'][-1], 1e-6)
+
+
+def get_bottlenecks(profile):
+    """
+    Return the resources an evaluation was bound by per its profile, i.e., a sublist of ['memory', 'cpu', 'io', 'gpu']
+    """
+    bottlenecks = []
+    if (profile['memory_limit_gb'] is not None) and (profile['rss_gb_max'] >= MEMORY_BOUND_FRACTION * profile['memory_limit_gb']):
+        bottlenecks.append('memory')
+    if profile['cpu_percent_mean'] >= CPU_BOUND_FRACTION * 100 * profile['ncpus']:
+        bottlenecks.append('cpu')
+    if (get_io_rate(profile) >= IO_BOUND_MB_PER_S) and (profile['cpu_percent_mean'] < 0.5 * 100 * profile['ncpus']):
+        bottlenecks.append('io')
+    if (profile['gpu_utilization_mean'] is not None) and (profile['gpu_utilization_mean'] >= GPU_BOUND_UTILIZATION):
+        bottlenecks.append('gpu')
+    return bottlenecks
+
+
+def suggest_keywords(profiles):
+    """
+    Return the nthreads and mem_per_cpu (in GB) keywords that would fit the evaluations with the given profiles, i.e., enough CPUs for the busiest evaluation on average and enough memory (with MEMORY_HEADROOM) for the largest peak
+    """
+    nthreads = max(1, int(math.ceil(max(profile['cpu_percent_mean'] for profile in profiles) / 100 - 0.1)))
+    mem_per_cpu = max(1, int(math.ceil(MEMORY_HEADROOM * max(profile['rss_gb_max'] for profile in profiles) / nthreads)))
+    return nthreads, mem_per_cpu
@@ -1,8 +1,13 @@
 import os 
 import datetime
+import functools
+import ast
+import sys
+import re
 import pandas as pd
 import numpy as np
 import json
+import experiment_index
 
 
 result_file = "result.txt"
@@ -12,47 +17,129 @@ objective_str = "objective"
 eval_dir = "eval_dir"
 config_json = "configuration.json"
 TIME_FORMAT='%Y-%m-%d %H:%M:%S'
+TIME_REGEX = re.compile(r'(\d{4})-(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})$')
 start = "start_time"
 stop = "stop_time"
 eval_key = 'id'
 exp_dir = "EXPERIMENTS"
 upf_space = "CANDLE_WORKFLOW_SETTINGS_FILE"
+ID_REGEX = re.compile(r'\s*\{\s*"' + re.escape(eval_key) + r'"\s*:\s*"([^"\\]*)"')
+SCAN_NTHREADS = 32
+LOG_BLOCK_SIZE = 64 * 1024
  
 
-def grep(model_log):
+@functools.lru_cache(maxsize=4096)
+def parse_timestamp(ts):
+    """
+    Convert a log timestamp to seconds since the epoch
+    Arguments:
+        ts: str
+            Timestamp in TIME_FORMAT
+    returns: float
+        The timestamp in seconds since the epoch (local time, as for strptime)
+    """
+
+    # A precompiled regex is much faster than strptime(), and many evaluations start and stop in the same second
+    match = TIME_REGEX.match(ts)
+    if match is None:
+        return datetime.datetime.strptime(ts, TIME_FORMAT).timestamp()
+    return datetime.datetime(*[int(x) for x in match.groups()]).timestamp()
+
+
+def parse_run_lines(lines, result):
+    """
+    Update the start and stop times from the RUN START/RUN STOP lines among some log lines
+    Arguments:
+        lines: iterable of str
+            Lines of the log file for the evaluation
+        result: dict
+            Dictionary with start and stop times to update
+    """
+
+    global start
+    global stop
+
+    for line in lines:
+        if 'RUN START' not in line and 'RUN STOP' not in line:
+            continue
+        line = line.rstrip('\n')
+        idx = line.find(' __main')
+        if idx != -1:
+            dt = parse_timestamp(line[0:idx])
+            if line.endswith('START'):
+                result[start] = dt
+            else:
+                result[stop] = dt
+
+
+def read_run_times(model_log, block_size=LOG_BLOCK_SIZE):
     """
     Parse the log file to generate the start and stop times
+    The RUN START line is near the head of the log and the RUN STOP line is near its tail, so only the first and last blocks of the file are read; if the RUN START line is not in the first block or the RUN STOP line is not in the last block, the whole file is scanned instead
     Arguments: 
         model_log: filepath
             The log file for the evaluation
+        block_size: int
+            Number of bytes to read from each end of the log file
     returns: dict
         Dictionary with start and stop times.
         
     """
-    import subprocess
 
-    global TIME_FORMAT
     global start
-    global stop 
-    
-    output = subprocess.check_output(['grep', '-E', "RUN START|RUN STOP", model_log])
-    lines = output.decode("utf-8")
+    global stop
+
     result = {}
-    for line in lines.split('\n'):
-        idx = line.find(' __main')
-        if idx != -1:
-            ts = line[0:idx]
-            dt = datetime.datetime.strptime(ts, TIME_FORMAT).timestamp()
-            if line.endswith('START'):
-                result[start] = dt
-            else:
-                result[stop] = dt
-    
+    with open(model_log, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+
+        # If the file is small, just parse all of it
+        if size <= 2 * block_size:
+            parse_run_lines(f.read().decode('utf-8', errors='replace').split('\n'), result)
+            return result
+
+        # Parse the first block, dropping its trailing partial line
+        head = f.read(block_size).decode('utf-8', errors='replace')
+        parse_run_lines(head[:head.rfind('\n') + 1].split('\n'), result)
+
+        # Seek from the end to parse the last block, dropping its leading partial line
+        if start in result:
+            f.seek(-block_size, os.SEEK_END)
+            tail = f.read().decode('utf-8', errors='replace')
+            parse_run_lines(tail[tail.find('\n') + 1:].split('\n'), result)
+
+        # If the RUN START or RUN STOP line is not where we expect it, fall back to a full streaming scan
+        if start not in result or stop not in result:
+            result.clear()
+            f.seek(0)
+            parse_run_lines((line.decode('utf-8', errors='replace') for line in f), result)
+
     return result
 
-def get_immediate_subdirectories(a_dir):
-    return [name for name in os.listdir(a_dir)
-        if os.path.isdir(os.path.join(a_dir, name))]
+def scan_evaluation_dirs(exp_dir):
+    """
+    Find all the evaluation directories of an experiment in a single pass
+    Arguments:
+        exp_dir: str
+            Path to the experiment directory
+
+    Returns: generator
+        Path to every exp_dir/<launch>/run/<evaluation> directory
+    """
+
+    # os.scandir() gets the file types from the directory listing itself, so no stat() call is needed per entry on most filesystems
+    with os.scandir(exp_dir) as launches:
+        for launch in launches:
+            if not launch.is_dir():
+                continue
+            run_dir = os.path.join(launch.path, "run")
+            try:
+                with os.scandir(run_dir) as evaluations:
+                    for evaluation in evaluations:
+                        if evaluation.is_dir():
+                            yield evaluation.path
+            except (FileNotFoundError, NotADirectoryError):
+                continue
 
 
 def get_successful_evaluations(all_eval):
@@ -71,70 +158,146 @@ def get_successful_evaluations(all_eval):
     u = ~all_eval[objective_str].isnull()
     return all_eval[u] 
 
-def get_remaining_evaluations(upf_file, all_eval):
+def get_line_id(line):
+    """
+    Extract the evaluation id from a single line of a upf file
+    Arguments:
+        line: str
+            A configuration of the upf file, nominally a JSON object
+
+    Return: str
+        The value of the eval_key field of the configuration
+    """
+
+    global eval_key
+
+    #Lines written by generate-grid start with the id, so usually a regex match suffices
+    match = ID_REGEX.match(line)
+    if match is not None:
+        return match.group(1)
+
+    #Otherwise fully parse the line, accepting Python literals as well as JSON (but never executing anything)
+    try:
+        configuration = json.loads(line)
+    except ValueError:
+        configuration = ast.literal_eval(line)
+    return configuration[eval_key]
+
+def get_remaining_evaluations(upf_file, all_eval, out):
     """
     Generate a upf file with that contains all the evaluations that did not 
     complete successuflly
+    The original upf is streamed line by line, so memory is bounded by the
+    number of successful evaluations rather than by the size of the upf
     
     Arguments:
         upf_file: filename 
             The orignial file that contains the parameter space
         all_eval: dataframe
             The dataframe that has attemped simulation parameters
+        out: file object
+            Where to write the configurations that did not complete
             
-    Return: str
-        A str that contains information the upf info for the configuration
-        that did not complete
+    Return: int
+        The number of configurations that did not complete
     """
-    #Read and parse the original upf
 
     global eval_key
+    global objective_str
 
-    if os.path.exists(upf_file):
-        with open(upf_file, 'r') as upf:
-            upf_str = upf.read() 
-    else:     
+    if len(all_eval) == 0 or objective_str not in all_eval.columns:
+        success_ids = set()
+    else:
+        success_eval_df = get_successful_evaluations(all_eval)
+        success_ids = set(success_eval_df[eval_key].tolist())
+
+    #Copy the untouched raw lines of the remaining configurations straight through
+    nremaining = 0
+    try:
+        upf = open(upf_file, 'r')
+    except FileNotFoundError:
         raise Exception("The upf file {} does not exist".format(upf_file))
-
-    #parse the upf string to a list of dictionaries
-    lines =  upf_str.split('\n')
-    lines = [l for l in lines if l.strip() != '']
-    params = []
-    for configuration in lines:
-        params.append(eval(configuration))
-        
-    total_ids = set([x[eval_key] for x in params])
-    success_eval_df =  get_successful_evaluations(all_eval)
-    success_ids = set(success_eval_df[eval_key].tolist())
-    remaining_ids = total_ids.difference(success_ids)
-    new_upf = [json.dumps(config) for config in params if config[eval_key] in remaining_ids]
-    return "\n".join(new_upf)
-
-def all_runs_log(exp_dir):
+    with upf:
+        for line in upf:
+            if line.strip() == '':
+                continue
+            if get_line_id(line) not in success_ids:
+                out.write(line if line.endswith('\n') else line + '\n')
+                nremaining += 1
+    return nremaining
+
+def all_runs_log(exp_dir, nthreads=SCAN_NTHREADS, use_index=True):
     """
     Gather information about all the runs in an experiment
     Arguments:
         exp_dir: str
             Path to the experiment directory
+        nthreads: int
+            Number of threads reading the evaluation directories concurrently
+        use_index: bool
+            Whether to read the hyperparameters and times of the evaluations recorded in the experiment index from it instead of from their directories
 
     Returns: Dataframe 
         Every evaluation will occupy a row 
     """
+    from concurrent.futures import ThreadPoolExecutor
 
-    eval_list = []
-    launch_dirs = get_immediate_subdirectories(exp_dir) 
-    for launch in launch_dirs: 
-        run_dir  = os.path.join(exp_dir, launch, "run") 
-        #print(run_dir)
-        eval_dirs = get_immediate_subdirectories(run_dir)
-        for evaluation in eval_dirs:
-            eval_dir = os.path.join(run_dir, evaluation)
-            eval_dic = single_evaluation_log(eval_dir)
-            eval_list.append(pd.Series(eval_dic, index = eval_dic.keys()))
+    # Every evaluation directory is listed, as the experiment index (see candle_compliant_wrapper.py) lacks evaluations killed before being recorded and those of canonically CANDLE-compliant model scripts
+    # The evaluations it does record only need their result.txt read, while the others are crawled
+    records = experiment_index.get_records_by_location(exp_dir) if use_index else {}
+
+    def evaluation_log(evaluation_dir):
+        record = records.get((os.path.basename(os.path.dirname(os.path.dirname(evaluation_dir))), os.path.basename(evaluation_dir)))
+        if record is None:
+            return single_evaluation_log(evaluation_dir)
+        return indexed_evaluation_log(record, evaluation_dir)
+
+    # The per-evaluation work is almost entirely waiting on (shared) filesystem I/O, so threads overlap it well despite the GIL
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        eval_list = list(executor.map(evaluation_log, scan_evaluation_dirs(exp_dir)))
 
     df = pd.DataFrame(eval_list)
     return df
 
+
+def read_objective(evaluation_dir):
+    """
+    Return the objective value in the result.txt file of an evaluation, or NaN if it didn't complete successfully
+    """
+
+    global result_file
+
+    #See if evaluation completed successfully if resutls.txt contains a float
+    #Opening the files directly (rather than first checking that they exist) saves a metadata round trip per file
+    try:
+        with open(os.path.join(evaluation_dir, result_file), mode='r') as result:
+            return float(result.read())
+    except (OSError, ValueError):
+        return np.nan
+
+def indexed_evaluation_log(record, evaluation_dir):
+    """
+    Generate evaluation parameters from a record of the experiment index and the result.txt file of the evaluation
+    Arguments:
+        record: dict
+            A record as returned by experiment_index.query_evaluations()
+        evaluation_dir: string
+            Path to the evaluation directory
+
+    returns: dict
+        Dictionary with all the parameters of the evaluation and the objective value, as in single_evaluation_log()
+    """
+
+    global objective_str
+    global start
+    global stop
+
+    eval_dic = {objective_str: read_objective(evaluation_dir)}
+    eval_dic.update(record["params"])
+    eval_dic[start] = record["start_time"]
+    eval_dic[stop] = record["stop_time"]
+    return eval_dic
+
 def single_evaluation_log(evaluation_dir):
     """
     Checks if the an evaluation is successful and generate evaluation parameters
@@ -146,7 +309,6 @@ def single_evaluation_log(evaluation_dir):
         Dictionary with all the parameters of the evaluation and the objective value
     """
 
-    global result_file 
     global params_log 
     global eval_log 
     global objective_str 
@@ -155,33 +317,24 @@ def single_evaluation_log(evaluation_dir):
 
     eval_dic = {}
 
-    #See if evaluation completed successfully if resutls.txt contains a float    
-    result_path = os.path.join(evaluation_dir, result_file)
-    if not os.path.exists(result_path):
-        obj_value = np.nan
-    else:
-        with open(result_path,mode='r') as result:
-            obj_str = result.read()
-        try:
-            obj_value = float(obj_str)
-        except Exception as e:
-            obj_value =  np.nan
-
-    eval_dic[objective_str] = obj_value
+    eval_dic[objective_str] = read_objective(evaluation_dir)
 
     #Read the parameters dictionary
     params_path = os.path.join(evaluation_dir, params_log)
-    if os.path.exists(params_path):
+    try:
         with open(params_path, 'r') as f:
             model_params = json.load(f)
-
-    eval_dic.update(model_params)
+        eval_dic.update(model_params)
+    except (OSError, ValueError):
+        pass
 
     #Read the timing metadata
     model_log = os.path.join(evaluation_dir, eval_log)
-    if os.path.exists(model_log):
-        timing_dic = grep(model_log)
+    try:
+        timing_dic = read_run_times(model_log)
         eval_dic.update(timing_dic)
+    except OSError:
+        pass
 
     return eval_dic
 
@@ -199,6 +352,4 @@ if __name__ == "__main__":
     upf_file = config_json[upf_space]
 
     status = all_runs_log(experiment)
-    new_upf = get_remaining_evaluations(upf_file, status)
-    if new_upf != "":
-        print(new_upf)
+    get_remaining_evaluations(upf_file, status, sys.stdout)
@@ -0,0 +1,109 @@
+# Memoization of evaluation results across the experiments of an experiments directory, so that resubmitting overlapping grids doesn't retrain hyperparameter sets that have already been evaluated
+# Results are stored in the experiment index (see experiment_index.py) keyed by a hash of the canonicalized hyperparameters, the contents of the model script, and the contents of the default model file; changing the model script therefore invalidates its results, which are evicted once a result of the new version is stored
+# Used by candle_compliant_wrapper.py if the memoize_results keyword is set
+# ASSUMPTIONS: candle is run the normal way via "candle submit-job ...", which defines the variables $CANDLE_KEYWORD_MODEL_SCRIPT and $CANDLE_DEFAULT_MODEL_FILE
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+import experiment_index
+
+
+# Hyperparameters that identify an evaluation (e.g., the hyperparameter set ID, which differs between grids) or its output location rather than what is computed
+VOLATILE_PARAMS = ('id', 'run_id', 'experiment_id', 'output_dir', 'save', 'save_path', 'logfile', 'timeout')
+MEMOIZED_FROM_FILE = 'candle_memoized_from.txt'  # written to an evaluation directory whose result was memoized, pointing to the evaluation that produced it
+
+
+def get_file_digest(filename):
+    """
+    Return the SHA-256 hash of the contents of a file, or of nothing if it can't be read
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    except (OSError, TypeError):
+        pass
+    return digest.hexdigest()
+
+
+def get_key(params, model_digest):
+    """
+    Return the key of the result of an evaluation
+    Arguments:
+        params: dict
+            The hyperparameters of the evaluation
+        model_digest: str
+            Hash of the model script
+
+    Returns: str
+        SHA-256 hash of the canonicalized hyperparameters (less VOLATILE_PARAMS), the model script hash, and the hash of the default model file
+    """
+    canonical_params = json.dumps({key: value for key, value in params.items() if key not in VOLATILE_PARAMS}, sort_keys=True, default=str)
+    return hashlib.sha256('\0'.join((canonical_params, model_digest, get_file_digest(os.getenv('CANDLE_DEFAULT_MODEL_FILE')))).encode()).hexdigest()
+
+
+def lookup(eval_dir, key):
+    """
+    Return the memoized result for a key from the index of the experiments directory containing an evaluation
+    Errors reading the index (e.g., if it's locked or corrupt) are reported and treated as a cache miss, as memoization is only an accelerator
+    Arguments:
+        eval_dir: str
+            Path to the evaluation directory
+        key: str
+            Key returned by get_key()
+
+    Returns: tuple
+        (history, source_eval_dir), i.e., the history.history dictionary and the directory of the evaluation that produced it, or None if there is no such result
+    """
+    location = experiment_index.locate_evaluation(eval_dir)
+    if (location is None) or not os.path.exists(location[0]):
+        return None
+    try:
+        conn = experiment_index.connect(location[0])
+        try:
+            row = conn.execute("SELECT history, eval_dir FROM result_cache WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print('WARNING: Could not look up a memoized result for the evaluation in {}: {}'.format(eval_dir, e))
+        return None
+    if row is None:
+        return None
+    return json.loads(row[0]), row[1]
+
+
+def store(eval_dir, key, model_script, model_digest, history):
+    """
+    Memoize the result of an evaluation, evicting the results of other versions of the same model script
+    Errors are reported but never raised, as memoization is only an accelerator
+    Arguments:
+        eval_dir: str
+            Path to the evaluation directory
+        key: str
+            Key returned by get_key()
+        model_script: str
+            Path to the model script
+        model_digest: str
+            Hash of the model script
+        history: dict
+            The history.history dictionary returned by the model
+    """
+    location = experiment_index.locate_evaluation(eval_dir)
+    if location is None:
+        return
+    model_script = os.path.realpath(model_script)
+    try:
+        conn = experiment_index.connect(location[0])
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO result_cache VALUES (?, ?, ?, ?, ?, ?)", (key, model_script, model_digest, json.dumps(history, default=str), os.path.realpath(eval_dir), time.time()))
+                conn.execute("DELETE FROM result_cache WHERE model_script = ? AND model_digest != ?", (model_script, model_digest))
+        finally:
+            conn.close()
+    except Exception as e:
+        print('WARNING: Could not memoize the result of the evaluation in {}: {}'.format(eval_dir, e))
@@ -91,17 +91,27 @@ elif [ "x$CANDLE_KEYWORD_WORKFLOW" == "xbayesian" ]; then # if doing the mlrMBO
     echo -e "\nbayesian workflow has been requested\n"
     export R_FILE=${R_FILE:-"mlrMBO-mbo.R"}
     candle_workflow="mlrMBO" # this is what "bayesian" maps to in Supervisor
+elif [ "x$CANDLE_KEYWORD_WORKFLOW" == "xhyperband" ]; then # if doing Hyperband via repeated rounds of the UPF workflow...
+    echo -e "\nhyperband workflow has been requested\n"
+    export R_FILE=${R_FILE:-"NA"}
+    candle_workflow="hyperband" # hyperband.py runs the upf workflow of Supervisor once per round
 fi
 
 # Save the job's parameters into a JSON file
 # This is probably for the restart functionality above
 bash "$CANDLE/wrappers/commands/submit-job/make_json_from_submit_params.sh"
 
-# If we want to run the wrapper using CANDLE...
+# If we only want to estimate the resources the job needs (via "candle estimate"), run a few of its hyperparameter sets here and extrapolate...
+if [ "${CANDLE_ESTIMATE:-0}" -eq 1 ]; then
+    echo -e "\nEstimating the resources needed by the job has been requested\n"
+    cmd_to_run="python $CANDLE/wrappers/commands/estimate/estimate.py"
+# ...otherwise, if we want to run the wrapper using CANDLE...
 # ADD HERE WHEN ADDING NEW WORKFLOWS!!
-if [ "${CANDLE_RUN_WORKFLOW:-1}" -eq 1 ]; then
+elif [ "${CANDLE_RUN_WORKFLOW:-1}" -eq 1 ]; then
     echo -e "\nRunning the actual workflow has been requested\n"
-    if [ "x$candle_workflow" == "xupf" ]; then
+    if [ "x$candle_workflow" == "xupf" ] && [ "x$CANDLE_SCHEDULER" != "xswift" ]; then # dispatch the evaluations ourselves rather than via Swift/T
+        cmd_to_run="python $CANDLE/wrappers/commands/submit-job/async_scheduler.py"
+    elif [ "x$candle_workflow" == "xupf" ]; then
         cmd_to_run="$CANDLE/Supervisor/workflows/$candle_workflow/swift/workflow.sh $SITE -a $CANDLE/Supervisor/workflows/common/sh/cfg-sys-$SITE.sh $CANDLE_WORKFLOW_SETTINGS_FILE"
     elif [ "x$candle_workflow" == "xmlrMBO" ]; then
 
@@ -110,6 +120,8 @@ if [ "${CANDLE_RUN_WORKFLOW:-1}" -eq 1 ]; then
         export IGNORE_ERRORS=0
 
         cmd_to_run="$CANDLE/Supervisor/workflows/$candle_workflow/swift/workflow.sh $SITE -a $CANDLE/Supervisor/workflows/common/sh/cfg-sys-$SITE.sh $CANDLE/wrappers/commands/submit-job/dummy_cfg-prm.sh $MODEL_NAME"
+    elif [ "x$candle_workflow" == "xhyperband" ]; then
+        cmd_to_run="python $CANDLE/wrappers/commands/submit-job/hyperband.py"
     fi
 # ...otherwise, run the wrapper alone, outside of CANDLE, nominally on an interactive node
 else
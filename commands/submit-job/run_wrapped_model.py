@@ -0,0 +1,89 @@
+# Run a wrapped Python model script cached in candle_generated_files (see model_wrapper.sh) using its cached bytecode, as if it had been run via "python wrapped_model.py" in the current evaluation directory
+# Run like "python run_wrapped_model.py <CACHED-WRAPPED-MODEL>"
+# ASSUMPTIONS:
+#   (1) In directory where params.json resides, with wrapped_model.py being a link to <CACHED-WRAPPED-MODEL>
+#   (2) candle is run the normal way via "candle submit-job ...", which defines the variable $CANDLE_SUBMISSION_DIR
+
+import os
+import sys
+import types
+import hashlib
+import tempfile
+from importlib.machinery import SourceFileLoader
+
+
+WRAPPED_MODEL_BASENAME = 'wrapped_model'
+WRAPPED_MODEL_CACHE_DIRNAME = 'wrapped_models'  # subdirectory of candle_generated_files holding the cached wrapped model scripts and their bytecode
+HASH_NCHARS = 16  # number of characters of the SHA-256 hash of the wrapped model script to use in its filename
+
+
+def get_cache_dir():
+    """
+    Return the directory in which the wrapped model scripts of the current job are cached, which model_wrapper.sh points to a node-local directory when evaluations are staged
+    """
+    return os.getenv('CANDLE_WRAPPED_MODEL_CACHE_DIR') or os.path.join(os.getenv('CANDLE_SUBMISSION_DIR'), 'candle_generated_files', WRAPPED_MODEL_CACHE_DIRNAME)
+
+
+def get_cached_wrapped_model(head_file, model_file, tail_file, extension='py', cache_dir=None):
+    """
+    Return the path to the cached script consisting of the model script bookended by the head and tail snippets, writing it if it doesn't already exist
+    This produces the same file as the wrap_model() and get_cached_wrapped_model() functions in model_wrapper.sh
+    Arguments:
+        head_file, model_file, tail_file: str
+            Paths to the head snippet, the model script, and the tail snippet
+        extension: str
+            Extension of the cached file
+        cache_dir: str
+            Directory holding the cached wrapped model scripts; defaults to get_cache_dir()
+
+    Returns: str
+        Path to the cached wrapped model script, named by a hash of its contents
+    """
+
+    # Concatenate the pieces as wrap_model() in model_wrapper.sh does
+    pieces = []
+    for filename in (head_file, model_file, tail_file):
+        with open(filename, 'rb') as f:
+            pieces.append(f.read())
+    contents = b'\n'.join(pieces)
+
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+    cached_file = os.path.join(cache_dir, '{}-{}.{}'.format(WRAPPED_MODEL_BASENAME, hashlib.sha256(contents).hexdigest()[:HASH_NCHARS], extension))
+
+    # Write the file atomically so that concurrent evaluations never see a partial file
+    if not os.path.exists(cached_file):
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(contents)
+        os.chmod(tmp_file, 0o644)
+        os.replace(tmp_file, cached_file)
+
+    return cached_file
+
+
+def load_wrapped_model(cached_file):
+    """
+    Return the code object of a cached wrapped model script, reading it from the __pycache__ directory next to the script if it has already been compiled by this Python version and compiling (and caching) it otherwise
+    """
+    return SourceFileLoader('__main__', cached_file).get_code('__main__')
+
+
+def main():
+    code = load_wrapped_model(sys.argv[1])
+
+    # Make the model see the same environment it would see if run via "python wrapped_model.py" in the current directory
+    script = WRAPPED_MODEL_BASENAME + '.py'
+    sys.argv = [script] + sys.argv[2:]
+    sys.path[0] = os.getcwd()
+    main_module = types.ModuleType('__main__')
+    main_module.__file__ = script
+    main_module.__builtins__ = __builtins__
+    sys.modules['__main__'] = main_module
+
+    exec(code, main_module.__dict__)
+
+
+if __name__ == '__main__':
+    main()
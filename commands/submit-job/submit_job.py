@@ -0,0 +1,351 @@
+# Single-process front end for "candle submit-job": generate the input files from the .in file, preprocess the keywords, write metadata.json, and run the workflow, all without the chain of bash/awk/grep processes run by command_script.sh (generate_input_files_and_run()), run_workflows.sh, and make_json_from_submit_params.sh
+# The input file is read by input_file_parser.py; the generated files (submit_candle_job.sh, default_model.txt, the parameter space file, preprocessed_vars_to_export.sh, and metadata.json) are identical to those written by that chain, which is still used if $CANDLE_LEGACY_SUBMIT is set to 1; submit_candle_job.sh in particular can still be run by hand to resubmit the job the old way
+# Run like "python $CANDLE/wrappers/commands/submit-job/submit_job.py <INPUT-FILE>" from command_script.sh, which first loads the Python environment (sourcing site-specific_settings.sh) and passes on the non-exported $CANDLE_SETUP_JOB_LAUNCHER and $CANDLE_SETUP_SINGLE_TASK_LAUNCHER_OPTIONS
+# ASSUMPTIONS:
+#   (1) candle module has been loaded
+#   (2) the candle program has been called normally (so that the $CANDLE_SUBMISSION_DIR variable has been defined)
+
+import os
+import re
+import sys
+import shlex
+import locale
+import subprocess
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import input_file_parser
+
+
+SHELL_SPECIAL_CHARS = '$`\\~;&|<>()*?['  # characters in an export statement that only bash can interpret faithfully
+METADATA_EXTRA_VARS = 'SUPP_MODULES PYTHON_BIN_PATH EXEC_PYTHON_MODULE SUPP_PYTHONPATH EXTRA_SCRIPT_ARGS EXEC_R_MODULE RESTART_FROM_EXP RUN_WORKFLOW'  # as in make_json_from_submit_params.sh
+
+
+def read_lines(filename):
+    """
+    Return the lines of a file (without their newlines) as grep and awk see them
+    """
+    with open(filename, errors='surrogateescape') as f:
+        text = f.read()
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def write_lines(filename, lines):
+    """
+    Write lines to a file, each terminated by a newline as when printed by awk
+    """
+    with open(filename, 'w', errors='surrogateescape') as f:
+        f.write(''.join(line + '\n' for line in lines))
+
+
+def generate_input_files(input_file, submission_dir):
+    """
+    Generate the submission script and, if necessary, the default model and parameter space files from the input file
+    Arguments:
+        input_file: str
+            Path to the .in file
+        submission_dir: str
+            Path to the submission directory
+
+    Returns: list
+        The export statements of the submission script
+    """
+
+    # Ensure the generated_files directory has been created
+    generated_files_dir = os.path.join(submission_dir, 'candle_generated_files')
+    if not os.path.isdir(generated_files_dir):
+        os.mkdir(generated_files_dir)
+    parsed_input_file = input_file_parser.parse(input_file)
+    for problem in parsed_input_file.problems:
+        print('WARNING: {}'.format(problem))
+    sections = parsed_input_file.sections
+
+    # Create the beginning part of the Bash submission script from all the keywords set in the &control section
+    exports = []
+    for line in sections['control']:
+        key, equals_sign, val = line.partition('=')
+        exports.append('export CANDLE_KEYWORD_{}={}'.format(key.replace(' ', '').upper(), (val if equals_sign else line).lstrip(' ')))
+
+    # Define the default model file in the submission script and if required, create it
+    default_model_file = parsed_input_file.get_file_keyword('default_model', 'candle_default_model_file')
+    if default_model_file is not None:
+        exports.append('export CANDLE_KEYWORD_DEFAULT_MODEL_FILE="{}"'.format(default_model_file))
+    else:
+        fn_default_model_file = '{}/candle_generated_files/default_model.txt'.format(submission_dir)
+        exports.append('export CANDLE_DEFAULT_MODEL_FILE="{}"'.format(fn_default_model_file))
+        write_lines(fn_default_model_file, ['[Global Params]'] + sections['default_model'])
+
+    # Define the parameter space file in the submission script and if required, create it
+    param_space_file = parsed_input_file.get_file_keyword('param_space', 'candle_param_space_file')
+    if param_space_file is not None:
+        exports.append('export CANDLE_KEYWORD_PARAM_SPACE_FILE="{}"'.format(param_space_file))
+    else:
+        workflow = '\n'.join(export.replace('"', '').split('=')[1].lower() for export in exports if export.startswith('export CANDLE_KEYWORD_WORKFLOW='))
+        is_txt = workflow in ('grid', 'hyperband')
+        fn_param_space_file = '{}/candle_generated_files/{}_workflow.{}'.format(submission_dir, workflow, 'txt' if is_txt else 'R')
+        exports.append('export CANDLE_WORKFLOW_SETTINGS_FILE="{}"'.format(fn_param_space_file))
+        lines = sections['param_space']
+        if not is_txt:
+            lines = ['param.set <- makeParamSet('] + [line + ',' for line in lines[:-1]] + lines[-1:] + [')']
+        write_lines(fn_param_space_file, lines)
+
+    # Wrap up the submission file by running run_workflows.sh
+    write_lines(os.path.join(generated_files_dir, 'submit_candle_job.sh'), exports + ['bash $CANDLE/wrappers/commands/submit-job/run_workflows.sh'])
+
+    return exports
+
+
+def is_valid_variable_name(name):
+    """
+    Return whether a string is a valid bash variable name
+    """
+    return re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', name) is not None
+
+
+def source_exports(exports):
+    """
+    Apply export statements to the environment as sourcing them in bash would
+    The statements are parsed here unless one of them needs bash to be expanded (e.g., it contains "$(pwd)"), in which case all of them are evaluated by a single bash process
+    Arguments:
+        exports: list
+            Lines of the form "export NAME=VALUE"
+    """
+    exports = [export for export in exports if export.startswith('export ')]
+    names = [export[len('export '):].split('=', 1)[0] for export in exports]
+    is_valid_name = [is_valid_variable_name(name) for name in names]  # bash reports and skips the others
+    values = []
+    for export in exports:
+        try:
+            tokens = shlex.split(export[len('export '):]) if not any(char in export for char in SHELL_SPECIAL_CHARS) else []
+        except ValueError:  # e.g., unbalanced quotes, which bash reports
+            tokens = []
+        if (len(tokens) != 1) or ('=' not in tokens[0]):
+            break
+        values.append(tokens[0].split('=', 1)[1])
+    if len(values) < len(exports):
+        script = '\n'.join(exports + ['for name in {}; do printf "%s\\0" "${{!name}}"; done'.format(' '.join(name for name, is_valid in zip(names, is_valid_name) if is_valid))])
+        values = iter(subprocess.run(['bash', '-c', script], stdout=subprocess.PIPE).stdout.decode(errors='surrogateescape').split('\0')[:-1])
+        values = [next(values, '') if is_valid else None for is_valid in is_valid_name]
+    for name, value, is_valid in zip(names, values, is_valid_name):
+        if is_valid:
+            os.environ[name] = value
+
+
+def run_preprocessing(submission_dir):
+    """
+    Check the input settings, determine the sbatch settings, and export the variables set by preprocess.py
+
+    Returns: bool
+        Whether preprocess.py was run successfully
+    """
+    import preprocess
+    import traceback
+    try:
+        preprocess.main()
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            return False
+    except Exception:  # as when preprocess.py is run as a script, report the error rather than ending the submission abruptly
+        traceback.print_exc()
+        return False
+    vars_file = os.path.join(submission_dir, 'candle_generated_files', 'preprocessed_vars_to_export.sh')
+    print('NOTE: preprocess.py was run successfully; now sourcing the variables it set in {}'.format(vars_file))
+    source_exports(read_lines(vars_file))
+    return True
+
+
+def is_model_script_canonically_candle_compliant(model_script):
+    """
+    Return whether a model script defines both run() and initialize_parameters(), as is_model_script_canonically_candle_compliant() in utilities.sh does
+    """
+    try:
+        lines = read_lines(model_script)
+    except OSError:
+        return False
+    return any(line.startswith('def run(') for line in lines) and any(line.startswith('def initialize_parameters(') for line in lines)
+
+
+def set_default(name, value):
+    """
+    Export a variable unless it's already set to something non-empty, i.e., export NAME=${NAME:-VALUE}
+    """
+    os.environ[name] = os.getenv(name) or value
+
+
+def write_metadata(candle, submission_dir):
+    """
+    Save the job's parameters into a JSON file as make_json_from_submit_params.sh does, i.e., the values of the variables set in the lmod module, the submission scripts, and run_workflows.sh
+    """
+    import glob
+    names = []
+    for filename, regex in [(os.path.join(candle, 'wrappers', 'lmod_modules', 'biowulf', 'dev.lua'), r'^setenv\("([^"]*)')] + [(submit_script, r'^export ([^=]*)') for submit_script in sorted(glob.glob(os.path.join(submission_dir, 'candle_generated_files', 'submit_candle_job*.sh')))] + [(os.path.join(candle, 'wrappers', 'commands', 'submit-job', 'run_workflows.sh'), r'^ *export ([^=]*)')]:
+        try:
+            names += [match.group(1) for match in map(re.compile(regex).match, read_lines(filename)) if match]
+        except OSError:
+            pass
+    names = ' '.join(names + [METADATA_EXTRA_VARS]).split()
+
+    # Sort the variable names as "sort -u" does in the current locale
+    try:
+        locale.setlocale(locale.LC_COLLATE, '')
+    except locale.Error:
+        pass
+    names = sorted(set(names), key=locale.strxfrm)
+
+    # Like make_json_from_submit_params.sh, stop at the first name that isn't a valid variable name (e.g., from a malformed &control line)
+    for iname, name in enumerate(names):
+        if not is_valid_variable_name(name):
+            names = names[:iname]
+            break
+
+    with open(os.path.join(submission_dir, 'candle_generated_files', 'metadata.json'), 'w', errors='surrogateescape') as f:
+        f.write('{' + ', '.join('"{}": "{}"'.format(name, os.getenv(name, '')) for name in names) + '}\n')
+
+
+def prepare_submission(input_file, candle, submission_dir):
+    """
+    Generate the input files, preprocess the keywords, set the job's variables as run_workflows.sh does, and write metadata.json
+    Quits via exit() if there's an error, as run_workflows.sh does
+    Arguments:
+        input_file: str
+            Path to the .in file
+        candle: str
+            Path to the CANDLE installation, i.e., $CANDLE
+        submission_dir: str
+            Path to the submission directory
+
+    Returns: str
+        The Supervisor workflow to run (upf, mlrMBO, or hyperband), or None if the workflow is unknown
+    """
+
+    # Generate the three input files from the input file
+    source_exports(generate_input_files(input_file, submission_dir))
+
+    # Check the input settings, determine the sbatch settings, and export variables set in Python
+    if not run_preprocessing(submission_dir):
+        print('ERROR: There was an error in preprocess.py')
+        exit(1)
+
+    # Note that later we can put these as keywords model_description and prog_name in the input file if we want
+    set_default('CANDLE_MODEL_DESCRIPTION', 'Dummy model description')
+    set_default('CANDLE_PROG_NAME', 'Dummy program name')
+
+    # Set $MODEL_PYTHON_DIR and $MODEL_PYTHON_SCRIPT as appropriate. Bottom line is this needs to be set to a canonically CANDLE-compliant Python file
+    model_script = os.getenv('CANDLE_KEYWORD_MODEL_SCRIPT', '')
+    if model_script.rsplit('.', 1)[-1] == 'py':
+        print('NOTE: Model script \'{}\' is a Python file'.format(model_script))
+        is_compliant = is_model_script_canonically_candle_compliant(model_script)
+    else:
+        print('NOTE: Model script \'{}\' is not a Python file'.format(model_script))
+        is_compliant = False
+    if is_compliant:
+        os.environ['MODEL_PYTHON_DIR'] = os.path.dirname(model_script) or '.'
+        os.environ['MODEL_PYTHON_SCRIPT'] = re.split('.py', os.path.basename(model_script))[0]  # as run_workflows.sh does with awk -v FS=".py"
+    else:
+        set_default('MODEL_PYTHON_DIR', os.path.join(candle, 'wrappers', 'commands', 'submit-job'))
+        set_default('MODEL_PYTHON_SCRIPT', 'candle_compliant_wrapper')
+
+    # Export some other settings that weren't preprocessed in preprocess.py (i.e., these aren't based on the keywords in the input file)
+    set_default('EXPERIMENTS', os.path.join(submission_dir, 'candle_generated_files', 'experiments'))
+    set_default('OBJ_RETURN', 'val_loss')
+    set_default('MODEL_NAME', 'candle_job')
+    set_default('TURBINE_OUTPUT_SOFTLINK', 'last-candle-job')
+    experiments_dir = os.getenv('EXPERIMENTS')
+
+    # Create the experiments directory if it doesn't already exist
+    if not os.path.isdir(experiments_dir):
+        os.makedirs(experiments_dir)
+        print('Experiments directory created: {}'.format(experiments_dir))
+
+    # If a restart is requested for a UPF job, then overwrite the CANDLE_WORKFLOW_SETTINGS_FILE accordingly
+    candle_workflow = None
+    restart_from_exp = os.getenv('CANDLE_KEYWORD_RESTART_FROM_EXP')
+    if restart_from_exp:
+        candle_workflow = 'upf'
+        metadata_file = os.path.join(experiments_dir, restart_from_exp, 'metadata.json')
+        if not os.path.isfile(metadata_file):
+            print('Error: metadata.json does not exist in the requested restart experiment {}/{}'.format(experiments_dir, restart_from_exp))
+            exit(1)
+        upf_new = os.path.join(submission_dir, 'candle_generated_files', 'upf_workflow-restart.txt')
+        with open(upf_new, 'w') as f:
+            subprocess.run([sys.executable, os.path.join(candle, 'wrappers', 'commands', 'submit-job', 'restart.py'), metadata_file], stdout=f)
+        if os.path.getsize(upf_new) > 0:
+            os.environ['CANDLE_WORKFLOW_SETTINGS_FILE'] = upf_new
+        else:
+            print('Error: Job is complete; nothing to do')
+            os.remove(upf_new)
+            exit(1)
+
+    # Do some workflow-dependent things
+    # ADD HERE WHEN ADDING NEW WORKFLOWS!!
+    workflow = os.getenv('CANDLE_KEYWORD_WORKFLOW')
+    if workflow == 'grid':
+        print('\ngrid workflow has been requested\n')
+        set_default('R_FILE', 'NA')
+        candle_workflow = 'upf'
+    elif workflow == 'bayesian':
+        print('\nbayesian workflow has been requested\n')
+        set_default('R_FILE', 'mlrMBO-mbo.R')
+        candle_workflow = 'mlrMBO'
+    elif workflow == 'hyperband':
+        print('\nhyperband workflow has been requested\n')
+        set_default('R_FILE', 'NA')
+        candle_workflow = 'hyperband'
+
+    # Save the job's parameters into a JSON file
+    write_metadata(candle, submission_dir)
+
+    return candle_workflow
+
+
+def get_command(candle_workflow, candle):
+    """
+    Return the command to run (a workflow or just the model script) as run_workflows.sh determines it
+    """
+
+    # ADD HERE WHEN ADDING NEW WORKFLOWS!!
+    site = os.getenv('SITE')
+    cmd_to_run = ''
+    if os.getenv('CANDLE_ESTIMATE', '0') == '1':
+        print('\nEstimating the resources needed by the job has been requested\n')
+        cmd_to_run = 'python {}/wrappers/commands/estimate/estimate.py'.format(candle)
+    elif os.getenv('CANDLE_RUN_WORKFLOW', '1') == '1':
+        print('\nRunning the actual workflow has been requested\n')
+        if (candle_workflow == 'upf') and (os.getenv('CANDLE_SCHEDULER') != 'swift'):
+            cmd_to_run = 'python {}/wrappers/commands/submit-job/async_scheduler.py'.format(candle)
+        elif candle_workflow == 'upf':
+            cmd_to_run = '{0}/Supervisor/workflows/{1}/swift/workflow.sh {2} -a {0}/Supervisor/workflows/common/sh/cfg-sys-{2}.sh {3}'.format(candle, candle_workflow, site, os.getenv('CANDLE_WORKFLOW_SETTINGS_FILE'))
+        elif candle_workflow == 'mlrMBO':
+            os.environ['SH_TIMEOUT'] = os.getenv('SH_TIMEOUT', '')
+            os.environ['IGNORE_ERRORS'] = '0'
+            cmd_to_run = '{0}/Supervisor/workflows/{1}/swift/workflow.sh {2} -a {0}/Supervisor/workflows/common/sh/cfg-sys-{2}.sh {0}/wrappers/commands/submit-job/dummy_cfg-prm.sh {3}'.format(candle, candle_workflow, site, os.getenv('MODEL_NAME'))
+        elif candle_workflow == 'hyperband':
+            cmd_to_run = 'python {}/wrappers/commands/submit-job/hyperband.py'.format(candle)
+    else:
+        print('\nRunning just the model script has been requested\n')
+        cmd_to_run = '{} {} python {}/{}.py --config_file={}'.format(os.getenv('CANDLE_SETUP_JOB_LAUNCHER', ''), os.getenv('CANDLE_SETUP_SINGLE_TASK_LAUNCHER_OPTIONS', ''), os.getenv('MODEL_PYTHON_DIR'), os.getenv('MODEL_PYTHON_SCRIPT'), os.getenv('CANDLE_DEFAULT_MODEL_FILE'))
+        if site == 'biowulf':  # see run_workflows.sh for why the launcher isn't used on Biowulf
+            cmd_to_run = 'python {}/{}.py --config_file={}'.format(os.getenv('MODEL_PYTHON_DIR'), os.getenv('MODEL_PYTHON_SCRIPT'), os.getenv('CANDLE_DEFAULT_MODEL_FILE'))
+    return cmd_to_run
+
+
+def main():
+
+    # Prepare the job from the input file and determine the command to run
+    candle = os.getenv('CANDLE')
+    cmd_to_run = get_command(prepare_submission(sys.argv[1], candle, os.getenv('CANDLE_SUBMISSION_DIR')), candle)
+
+    # Run CANDLE (whether a workflow or just the model script) unless a dry run has been requested
+    if os.getenv('CANDLE_DRY_RUN') == '0':
+        print('\nNow running CANDLE using the command:\n')
+        print('  {}\n'.format(cmd_to_run), flush=True)
+        exit(subprocess.call(cmd_to_run.split()))
+    else:
+        print('\nDry run has been requested; command that would otherwise be run next:\n')
+        print('  {}\n'.format(cmd_to_run))
+
+
+if __name__ == '__main__':
+    main()
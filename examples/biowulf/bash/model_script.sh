@@ -1,6 +1,7 @@
 #!/bin/bash
 
-#Get the hyperparameters from CANDLE
+#Get the hyperparameters from CANDLE, loading them all at once first (after which they are also available as, e.g., $CANDLE_PARAM_batch_size)
+candle_load_params
 batch_size=$(candle_get_param batch_size)
 epochs=$(candle_get_param epochs)
 activation=$(candle_get_param activation)
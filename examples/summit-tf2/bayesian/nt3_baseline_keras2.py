@@ -20,9 +20,10 @@ import candle
 
 def load_data(train_path, test_path, candle_params):
 
+    # candle_load_csv() (defined in head.py) parses each CSV file only once per job and otherwise memory-maps the cached array
     print('Loading data...')
-    df_train = (pd.read_csv(train_path,header=None).values).astype('float32')
-    df_test = (pd.read_csv(test_path,header=None).values).astype('float32')
+    df_train = candle_load_csv(train_path, dtype='float32', header=None)
+    df_test = candle_load_csv(test_path, dtype='float32', header=None)
     print('done')
 
     print('df_train shape:', df_train.shape)
@@ -36,15 +37,18 @@ def load_data(train_path, test_path, candle_params):
     Y_train = np_utils.to_categorical(df_y_train,candle_params['classes'])
     Y_test = np_utils.to_categorical(df_y_test,candle_params['classes'])
 
-    df_x_train = df_train[:, 1:seqlen].astype(np.float32)
-    df_x_test = df_test[:, 1:seqlen].astype(np.float32)
+    df_x_train = df_train[:, 1:seqlen].astype(np.float32, copy=False)
+    df_x_test = df_test[:, 1:seqlen].astype(np.float32, copy=False)
 
     X_train = df_x_train
     X_test = df_x_test
 
-    scaler = MaxAbsScaler()
-    mat = np.concatenate((X_train, X_test), axis=0)
-    mat = scaler.fit_transform(mat)
+    # Likewise only scale the data once per job
+    def scale_data():
+        scaler = MaxAbsScaler()
+        mat = np.concatenate((X_train, X_test), axis=0)
+        return scaler.fit_transform(mat)
+    mat = candle_cached_array('nt3_scaled-' + candle_get_cache_key(os.path.realpath(train_path), os.path.getmtime(train_path), os.path.realpath(test_path), os.path.getmtime(test_path)), scale_data)
 
     X_train = mat[:X_train.shape[0], :]
     X_test = mat[X_train.shape[0]:, :]
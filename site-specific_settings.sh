@@ -4,6 +4,7 @@
 # $CANDLE_SETUP_... variables are those explicitly used in setup.sh and are not sourced
 # It would be nice in this script to only set variables that I have created, such as those that begin with $CANDLE_... that would be a useful rule for this file that I am sticking to for now
 # All this script should do is set environment variables with CANDLE_ prefixes, so it should be really benign
+# The keywords of the input file that apply to each $SITE (and their default and valid values) are set in commands/submit-job/keyword_schema.py
 # ASSUMPTIONS:
 #   (1) The candle module is loaded as usual
 #   (2) Running this script in interactive or batch mode (i.e., not on a login node) (the $CANDLE_... variables involving $SLURM_... variables will definitely be set if so)
@@ -12,6 +13,8 @@
 if [ "x$SITE" == "xbiowulf" ]; then
 
     CANDLE_SETUP_LOCAL_DIR="/lscratch/$SLURM_JOB_ID"
+    export CANDLE_DATASET_CACHE_DIR="$CANDLE_SETUP_LOCAL_DIR/candle_dataset_cache" # node-local cache of the datasets loaded via candle_load_csv()/candle_cached_array() in head.py (used if /lscratch was requested)
+    export CANDLE_STAGING_DIR="$CANDLE_SETUP_LOCAL_DIR/candle_staging" # node-local directory in which evaluations are run if the stage_locally keyword is set (used if /lscratch was requested)
 
     CANDLE_SETUP_COMPILE_SWIFT_T=1
     CANDLE_SETUP_SWIFT_T=
@@ -38,13 +41,11 @@ if [ "x$SITE" == "xbiowulf" ]; then
     export CANDLE_DEFAULT_PYTHON_MODULE="python/3.7"
     export CANDLE_DEFAULT_R_MODULE="R/4.0.0"
 
-    # Note: A keyword is specified to be required by setting its default value to None
-    export CANDLE_POSSIBLE_KEYWORDS_AND_DEFAULTS="{'model_script': None, 'workflow': None, 'walltime': '00:05:00', 'worker_type': 'k80', 'nworkers': 1, 'nthreads': 1, 'custom_sbatch_args': '', 'mem_per_cpu': 7, 'dl_backend': 'keras', 'supp_modules': '', 'python_bin_path': '', 'exec_python_module': '', 'supp_pythonpath': '', 'extra_script_args': '', 'exec_r_module': '', 'supp_r_libs': '', 'run_workflow': 1, 'dry_run': 0, 'default_model_file': '', 'param_space_file': ''}"
-    export CANDLE_VALID_WORKER_TYPES="('cpu', 'k20x', 'k80', 'p100', 'v100', 'v100x')"
-
 elif [ "x$SITE" == "xsummit-tf1" ]; then
 
     CANDLE_SETUP_LOCAL_DIR=$(pwd)
+    export CANDLE_DATASET_CACHE_DIR= # no node-local directory, so the datasets loaded via candle_load_csv()/candle_cached_array() in head.py are cached in candle_generated_files/dataset_cache
+    export CANDLE_STAGING_DIR= # no node-local directory, so evaluations are always run in place even if the stage_locally keyword is set
 
     CANDLE_SETUP_COMPILE_SWIFT_T=0
     CANDLE_SETUP_SWIFT_T="/gpfs/alpine/world-shared/med106/wozniak/sw/gcc-6.4.0/swift-t/2020-09-02" # tf1 version
@@ -69,13 +70,11 @@ elif [ "x$SITE" == "xsummit-tf1" ]; then
     #export CANDLE_DEFAULT_PYTHON_MODULE="/gpfs/alpine/world-shared/med106/sw2/opence010env/bin/python3.6" # tf2 version
     export CANDLE_DEFAULT_R_MODULE="/gpfs/alpine/world-shared/med106/wozniak/sw/gcc-6.4.0/R-3.6.1/lib64/R/bin/R"
 
-    # Note: A keyword is specified to be required by setting its default value to None
-    export CANDLE_POSSIBLE_KEYWORDS_AND_DEFAULTS="{'model_script': None, 'workflow': None, 'walltime': '00:05', 'nworkers': 1, 'project': None, 'dl_backend': 'keras', 'supp_modules': '', 'python_bin_path': '', 'exec_python_module': '', 'supp_pythonpath': '', 'extra_script_args': '', 'exec_r_module': '', 'supp_r_libs': '', 'run_workflow': 1, 'dry_run': 0, 'queue': 'batch', 'default_model_file': '', 'param_space_file': ''}"
-    export CANDLE_VALID_WORKER_TYPES=
-
 elif [ "x$SITE" == "xsummit-tf2" ]; then
 
     CANDLE_SETUP_LOCAL_DIR=$(pwd)
+    export CANDLE_DATASET_CACHE_DIR= # no node-local directory, so the datasets loaded via candle_load_csv()/candle_cached_array() in head.py are cached in candle_generated_files/dataset_cache
+    export CANDLE_STAGING_DIR= # no node-local directory, so evaluations are always run in place even if the stage_locally keyword is set
 
     CANDLE_SETUP_COMPILE_SWIFT_T=0
     # CANDLE_SETUP_SWIFT_T="/gpfs/alpine/world-shared/med106/wozniak/sw/gcc-6.4.0/swift-t/2020-09-02" # tf1 version
@@ -100,10 +99,6 @@ elif [ "x$SITE" == "xsummit-tf2" ]; then
     export CANDLE_DEFAULT_PYTHON_MODULE="/gpfs/alpine/world-shared/med106/sw2/opence010env/bin/python3.6" # tf2 version
     export CANDLE_DEFAULT_R_MODULE="/gpfs/alpine/world-shared/med106/wozniak/sw/gcc-6.4.0/R-3.6.1/lib64/R/bin/R"
 
-    # Note: A keyword is specified to be required by setting its default value to None
-    export CANDLE_POSSIBLE_KEYWORDS_AND_DEFAULTS="{'model_script': None, 'workflow': None, 'walltime': '00:05', 'nworkers': 1, 'project': None, 'dl_backend': 'keras', 'supp_modules': '', 'python_bin_path': '', 'exec_python_module': '', 'supp_pythonpath': '', 'extra_script_args': '', 'exec_r_module': '', 'supp_r_libs': '', 'run_workflow': 1, 'dry_run': 0, 'queue': 'batch', 'default_model_file': '', 'param_space_file': ''}"
-    export CANDLE_VALID_WORKER_TYPES=
-
 else
 
     echo "ERROR: \$SITE variable (which has a setting of $SITE) has no corresponding section in \$CANDLE/checkouts/wrappers/site-specific_settings.sh"